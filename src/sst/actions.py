@@ -41,6 +41,7 @@ id, tag, text, class or other attributes. See the `get_element` documentation.
 
 import codecs
 import errno
+import itertools
 import logging
 import os
 import re
@@ -76,18 +77,21 @@ __all__ = [
     'assert_url_contains', 'assert_url_network_location', 'check_flags',
     'clear_cookies', 'click_button', 'click_element', 'click_link',
     'close_window', 'debug', 'dismiss_alert', 'end_test', 'execute_script',
-    'exists_element', 'fails', 'get_argument', 'get_base_url',
+    'exists_element', 'fails', 'fill_form', 'get_argument', 'get_base_url',
     'get_cookies', 'get_current_url', 'get_element',
     'get_element_by_css', 'get_element_by_xpath', 'get_element_source',
     'get_elements', 'get_elements_by_css', 'get_elements_by_xpath',
-    'get_link_url', 'get_page_source', 'get_text', 'get_wait_timeout',
-    'get_window_size', 'go_back', 'go_to', 'refresh', 'reset_base_url',
-    'retry_on_exception', 'run_test', 'save_page_source', 'set_base_url',
-    'set_checkbox_value', 'set_dropdown_value', 'set_radio_value',
-    'set_wait_timeout', 'set_window_size', 'simulate_keys', 'skip', 'sleep',
-    'switch_to_frame', 'switch_to_window',
+    'get_elements_data',
+    'get_link_url', 'get_page_source', 'get_table_data', 'get_text',
+    'get_wait_timeout', 'get_window_size', 'go_back', 'go_to', 'refresh',
+    'reset_base_url', 'retry_on_exception', 'run_test', 'save_page_source',
+    'set_base_url', 'set_checkbox_value', 'set_dropdown_value',
+    'set_element_cache', 'set_event_driven_wait', 'set_page_readiness',
+    'set_radio_value', 'set_test_timeout', 'set_wait_timeout',
+    'set_window_size',
+    'simulate_keys', 'skip', 'sleep', 'switch_to_frame', 'switch_to_window',
     'take_screenshot', 'toggle_checkbox', 'wait_for',
-    'wait_for_and_refresh', 'write_textfield'
+    'wait_for_and_refresh', 'wait_for_network_idle', 'write_textfield'
 ]
 
 
@@ -124,7 +128,8 @@ def retry_on_exception(exception, retries=None):
         will be retried.
     :param retries: The number of times that the function will be retried.
         If it is `None`, the function will be retried until the time out set by
-        `set_wait_timeout` expires.
+        `set_wait_timeout` expires. In both cases, it is not retried once the
+        time allowed for the test is over (see `set_test_timeout`).
 
     """
     def middle(func):
@@ -135,8 +140,14 @@ def retry_on_exception(exception, retries=None):
             max_time = time.time() + _TIMEOUT
 
             def retry():
-                return ((retries is None and time.time() < max_time) or
-                        (retries is not None and tries <= retries))
+                if tries == 0:
+                    return True
+                now = time.time()
+                if _TEST_DEADLINE is not None and now >= _TEST_DEADLINE:
+                    return False
+                if retries is None:
+                    return now < max_time
+                return tries <= retries
 
             while(retry()):
                 tries = tries + 1
@@ -202,16 +213,15 @@ def skip(reason=''):
 def refresh(wait=True):
     """Refresh the current page.
 
-    :argument wait: If `True`, this action will wait until a page with a body
-        element is available. Otherwise, it will return immediately after the
-        Selenium refresh action is completed.
+    :argument wait: If `True`, this action will wait until the page is ready,
+        as set by `set_page_readiness`. It can also be the name of the page
+        readiness strategy to use, or a `PageReadiness` object. Otherwise, it
+        will return immediately after the Selenium refresh action is completed.
 
     """
     logger.debug('Refreshing current page')
-    _test.browser.refresh()
-
-    if wait:
-        _waitforbody()
+    _load_page(_test.browser.refresh, wait)
+    _element_cache.forget()
 
 
 def take_screenshot(filename='screenshot.png', add_timestamp=True):
@@ -353,33 +363,32 @@ def go_to(url='', wait=True):
     :arguement url: The URL to go to. If it is a relative URL it will be added
         to the base URL. You can change the base url for the test with
         `set_base_url`.
-    :argument wait: If `True`, this action will wait until a page with a body
-        element is available. Otherwise, it will return immediately after the
-        Selenium refresh action is completed.
+    :argument wait: If `True`, this action will wait until the page is ready,
+        as set by `set_page_readiness`. It can also be the name of the page
+        readiness strategy to use, or a `PageReadiness` object. Otherwise, it
+        will return immediately after the Selenium refresh action is completed.
 
     """
     url = _fix_url(url)
 
     logger.debug('Going to... %s' % url)
-    _test.browser.get(url)
-
-    if wait:
-        _waitforbody()
+    _test.record_origin(url)
+    _load_page(lambda: _test.browser.get(url), wait)
+    _element_cache.forget()
 
 
 def go_back(wait=True):
     """Go one step backward in the browser history.
 
-    :argument wait: If `True`, this action will wait until a page with a body
-        element is available. Otherwise, it will return immediately after the
-        Selenium refresh action is completed.
+    :argument wait: If `True`, this action will wait until the page is ready,
+        as set by `set_page_readiness`. It can also be the name of the page
+        readiness strategy to use, or a `PageReadiness` object. Otherwise, it
+        will return immediately after the Selenium refresh action is completed.
 
     """
     logger.debug('Going back one step in browser history')
-    _test.browser.back()
-
-    if wait:
-        _waitforbody()
+    _load_page(_test.browser.back, wait)
+    _element_cache.forget()
 
 
 def assert_checkbox(id_or_elem):
@@ -390,7 +399,11 @@ def assert_checkbox(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
+    return _assert_checkbox(id_or_elem).element
+
+
+def _assert_checkbox(id_or_elem):
+    elem = _get_wrapped_elem(id_or_elem)
     _elem_is_type(elem, id_or_elem, 'checkbox')
     return elem
 
@@ -405,10 +418,11 @@ def assert_checkbox_value(id_or_elem, value):
         checkbox, or if the checkbox value is not the expected.
 
     """
-    checkbox = assert_checkbox(id_or_elem)
+    checkbox = _assert_checkbox(id_or_elem)
     real = checkbox.is_selected()
-    msg = 'Checkbox: %r - Has Value: %r' % (_element_to_string(checkbox), real)
     if real != value:
+        msg = 'Checkbox: %r - Has Value: %r' % (_element_to_string(checkbox),
+                                                real)
         _raise(msg)
 
 
@@ -435,6 +449,24 @@ def _element_to_string(element):
                 return element.get_attribute('outerHTML')
 
 
+class _ElementString(object):
+    """Describe an element with `_element_to_string` when it is formatted.
+
+    Passed as an argument of a logging call, the element is described only if
+    the record is emitted.
+
+    """
+
+    def __init__(self, element):
+        self.element = element
+
+    def __repr__(self):
+        try:
+            return repr(_element_to_string(self.element))
+        except WebDriverException:
+            return repr(self.element)
+
+
 def get_text(id_or_elem):
     """Return the text of an element.
 
@@ -454,15 +486,14 @@ def toggle_checkbox(id_or_elem):
         checkbox.
 
     """
-    checkbox = assert_checkbox(id_or_elem)
-    element_string = _element_to_string(checkbox)
-    logger.debug('Toggling checkbox: %r' % element_string)
+    checkbox = _assert_checkbox(id_or_elem)
+    logger.debug('Toggling checkbox: %r', _ElementString(checkbox))
     before = checkbox.is_selected()
     checkbox.click()
     after = checkbox.is_selected()
     if before == after:
         msg = 'Checkbox: %r - was not toggled, value remains: %r' \
-            % (element_string, before)
+            % (_element_to_string(checkbox), before)
         _raise(msg)
 
 
@@ -476,14 +507,13 @@ def set_checkbox_value(id_or_elem, new_value):
         checkbox.
 
     """
-    checkbox = assert_checkbox(id_or_elem)
-    logger.debug(
-        'Setting checkbox %r to %r' % (_element_to_string(checkbox),
-                                       new_value))
+    checkbox = _assert_checkbox(id_or_elem)
+    logger.debug('Setting checkbox %r to %r', _ElementString(checkbox),
+                 new_value)
     # There is no method to 'unset' a checkbox in the browser object
     current_value = checkbox.is_selected()
     if new_value != current_value:
-        toggle_checkbox(id_or_elem)
+        toggle_checkbox(checkbox)
 
 
 def _make_keycode(key_to_make):
@@ -508,9 +538,8 @@ def simulate_keys(id_or_elem, key_to_press):
 
     """
     key_element = _get_elem(id_or_elem)
-    msg = 'Simulating keypress on %r with %r key' \
-        % (_element_to_string(key_element), key_to_press)
-    logger.debug(msg)
+    logger.debug('Simulating keypress on %r with %r key',
+                 _ElementString(key_element), key_to_press)
     key_code = _make_keycode(key_to_press)
     key_element.send_keys(key_code)
 
@@ -528,7 +557,23 @@ def assert_textfield(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
+    return _assert_textfield(id_or_elem).element
+
+
+def _select_all_modifier():
+    """Get the key selecting the whole text of a field along with 'a'.
+
+    This is COMMAND if the browser runs on a Mac, CONTROL otherwise.
+
+    """
+    platform = (_test.browser.capabilities.get('platform') or '').lower()
+    if platform in ('mac', 'darwin') or platform.startswith(('mac', 'os x')):
+        return keys.Keys.COMMAND
+    return keys.Keys.CONTROL
+
+
+def _assert_textfield(id_or_elem):
+    elem = _get_wrapped_elem(id_or_elem)
     _elem_is_type(elem, id_or_elem, *_textfields)  # see _textfields tuple
     return elem
 
@@ -544,15 +589,14 @@ def write_textfield(id_or_elem, new_text, check=True, clear=True):
         it.
 
     """
-    textfield = assert_textfield(id_or_elem)
-    msg = 'Writing to textfield %r with text %r' \
-        % (_element_to_string(textfield), new_text)
-    logger.debug(msg)
+    textfield = _assert_textfield(id_or_elem)
+    logger.debug('Writing to textfield %r with text %r',
+                 _ElementString(textfield), new_text)
 
     # clear field with send_keys(), don't use clear() (see
     # http://code.google.com/p/selenium/issues/detail?id=214 for rationale)
     if clear:
-        textfield.send_keys(keys.Keys().CONTROL, 'a')
+        textfield.send_keys(_select_all_modifier(), 'a')
         textfield.send_keys(keys.Keys().DELETE)
 
     if isinstance(new_text, unicode):
@@ -569,6 +613,152 @@ def write_textfield(id_or_elem, new_text, check=True, clear=True):
         _raise(msg)
 
 
+_form_fields = _textfields + ('select-one', 'checkbox', 'radio')
+
+# Returns, for each field, a list with the element, its type, whether it is
+# checked, its value and, for drop-down lists, the option whose text or value
+# is the wanted one (or null) and whether it is selected. Missing fields are
+# null.
+_FORM_FIELDS_SCRIPT = """
+var targets = arguments[0], wanted = arguments[1];
+var fields = [];
+for (var i = 0; i < targets.length; i++) {
+    var element = targets[i];
+    if (typeof element == 'string') {
+        element = document.getElementById(element);
+    }
+    if (!element) {
+        fields.push(null);
+        continue;
+    }
+    var option = null;
+    if (element.type == 'select-one') {
+        for (var j = 0; j < element.options.length; j++) {
+            var candidate = element.options[j];
+            if (candidate.text == String(wanted[i]) ||
+                    candidate.value == String(wanted[i])) {
+                option = candidate;
+                break;
+            }
+        }
+    }
+    fields.push([element, element.type || null, !!element.checked,
+                 element.value === undefined ? null : element.value,
+                 option, option !== null && option.selected]);
+}
+return fields;
+"""
+
+# Returns, for each field, a list with whether it is checked, its value and,
+# for drop-down lists, the text of the selected option.
+_FORM_VALUES_SCRIPT = """
+var elements = arguments[0], values = [];
+for (var i = 0; i < elements.length; i++) {
+    var element = elements[i], text = null;
+    if (element.type == 'select-one' && element.selectedIndex >= 0) {
+        text = element.options[element.selectedIndex].text;
+    }
+    values.push([!!element.checked, element.value, text]);
+}
+return values;
+"""
+
+
+def fill_form(fields, check=True):
+    """Fill several fields of a form.
+
+    The fields are looked for and their types asserted with a single call to
+    the browser, and only the fields whose value differs are changed.
+
+    The value of a field depends on its type:
+
+    * text field: the text to write, replacing the current one.
+    * drop-down list: the text or the value of the option to select.
+    * checkbox: `True` to select it, `False` to unselect it.
+    * radio button: `True` to select it.
+
+    :argument fields: A dict mapping the identifiers of the fields (or their
+        element objects) to their values. To fill the fields in a given order,
+        pass a sequence of (id_or_elem, value) pairs instead.
+    :argument check: If `True`, a check will be made to make sure that the
+        fields have the values after filling them, with a single call to the
+        browser.
+    :raise: AssertionError if a field doesn't exist, if it isn't a text field,
+        a drop-down list, a checkbox or a radio button, if an option is not in
+        a drop-down list, if a radio button should be unselected or if a field
+        doesn't have its value after filling.
+
+    """
+    if hasattr(fields, 'items'):
+        fields = fields.items()
+    names = [name for name, _ in fields]
+    values = [value for _, value in fields]
+    logger.debug('Filling form fields %r', names)
+    infos = _test.browser.execute_script(_FORM_FIELDS_SCRIPT, names, values)
+    # Assert all the fields before changing any
+    for name, value, info in zip(names, values, infos):
+        if info is None:
+            _raise('Element with id: %r does not exist' % (name,))
+        elem, field_type, _, _, option, _ = info
+        if field_type not in _form_fields:
+            _raise('Element %r is not one of %r' % (name, _form_fields))
+        if field_type == 'select-one' and option is None:
+            msg = ('The following option could not be found in the list: %r'
+                   % (value,))
+            _raise(msg)
+        if field_type == 'radio' and not value:
+            _raise('Radio %r can not be unselected' % (name,))
+        if _element_cache.enabled and not isinstance(name, WebElement):
+            _element_cache.keep(name, _heal_on_stale(elem, _by_id(name)))
+    for value, info in zip(values, infos):
+        elem, field_type, checked, current, option, selected = info
+        if field_type in _textfields:
+            _replace_text(elem, current, value)
+        elif field_type == 'select-one':
+            if not selected:
+                option.click()
+        elif bool(value) != checked:
+            elem.click()
+    if not check:
+        return
+    logger.debug('Check form fields were filled correctly')
+    elems = [info[0] for info in infos]
+    actual = _test.browser.execute_script(_FORM_VALUES_SCRIPT, elems)
+    for name, value, info, (checked, current, text) in zip(
+            names, values, infos, actual):
+        field_type = info[1]
+        if field_type in _textfields:
+            success = current == _text_to_write(value)
+        elif field_type == 'select-one':
+            success = value in (text, current)
+        else:
+            success = checked == bool(value)
+        if not success:
+            msg = 'Field: %r - was not set to %r. Value is: %r' % (
+                name, value, checked if field_type in ('checkbox', 'radio')
+                else current)
+            _raise(msg)
+
+
+def _text_to_write(text):
+    if isinstance(text, unicode):
+        return text
+    return str(text)
+
+
+def _replace_text(textfield, current, new_text):
+    new_text = _text_to_write(new_text)
+    if current == new_text:
+        return
+    if current:
+        # Clear the field with the keyboard in the same command (see
+        # write_textfield), NULL releases the modifier.
+        textfield.send_keys(_select_all_modifier(), 'a', keys.Keys.NULL,
+                            keys.Keys.DELETE, new_text)
+    else:
+        textfield.send_keys(new_text)
+
+
 def assert_link(id_or_elem):
     """Assert that an element is a link.
 
@@ -577,7 +767,11 @@ def assert_link(id_or_elem):
     :return: The element object.
 
     """
-    link = _get_elem(id_or_elem)
+    return _assert_link(id_or_elem).element
+
+
+def _assert_link(id_or_elem):
+    link = _get_wrapped_elem(id_or_elem)
     if link.tag_name != 'a':
         msg = 'The text %r is not part of a Link or a Link ID' \
             % _element_to_string(link)
@@ -593,7 +787,7 @@ def get_link_url(id_or_elem):
 
     """
     logger.debug('Getting url from link %r' % id_or_elem)
-    link = assert_link(id_or_elem)
+    link = _assert_link(id_or_elem)
     link_url = link.get_attribute('href')
     return link_url
 
@@ -610,20 +804,20 @@ def click_link(id_or_elem, check=False, wait=True):
     :argument check: If `True`, the resulting URL will be check to be the same
         as the one on the link. Default is `False` because some links do
         redirects.
-    :argument wait: If `True`, this action will wait until a page with a body
-        element is available. Otherwise, it will return immediately after the
-        Selenium refresh action is completed.
+    :argument wait: If `True`, this action will wait until the page is ready,
+        as set by `set_page_readiness`. It can also be the name of the page
+        readiness strategy to use, or a `PageReadiness` object. Otherwise, it
+        will return immediately after the Selenium refresh action is completed.
     :raise: AssertionError if the element doesn't exist or isn't a link.
 
     """
-    link = assert_link(id_or_elem)
+    link = _assert_link(id_or_elem)
     link_url = link.get_attribute('href')
 
-    logger.debug('Clicking link %r' % _element_to_string(link))
-    link.click()
-
+    logger.debug('Clicking link %r', _ElementString(link))
+    _load_page(link.click, wait, link.element)
     if wait:
-        _waitforbody()
+        _element_cache.forget()
 
     # some links do redirects - so we
     # don't check by default
@@ -650,18 +844,18 @@ def click_element(id_or_elem, wait=True):
     """Click on an element of any kind not specific to links or buttons.
 
     :argument id_or_elem: The identifier of the element, or its element object.
-    :argument wait: If `True`, this action will wait until a page with a body
-        element is available. Otherwise, it will return immediately after the
-        Selenium refresh action is completed.
+    :argument wait: If `True`, this action will wait until the page is ready,
+        as set by `set_page_readiness`. It can also be the name of the page
+        readiness strategy to use, or a `PageReadiness` object. Otherwise, it
+        will return immediately after the Selenium refresh action is completed.
 
     """
     elem = _get_elem(id_or_elem)
 
-    logger.debug('Clicking element %r' % _element_to_string(elem))
-    elem.click()
-
+    logger.debug('Clicking element %r', _ElementString(elem))
+    _load_page(elem.click, wait, elem)
     if wait:
-        _waitforbody()
+        _element_cache.forget()
 
 
 def assert_title(title):
@@ -748,6 +942,13 @@ def assert_url_network_location(netloc):
 
 _TIMEOUT = 10
 _POLL = 0.1
+# The delay between two checks of a `wait_for` condition grows by this factor,
+# up to `_MAX_POLL_FACTOR` times the poll frequency.
+_POLL_BACKOFF = 1.5
+_MAX_POLL_FACTOR = 5
+_EVENT_DRIVEN_WAIT = False
+# When the current test must be done, None if it can run for ever
+_TEST_DEADLINE = None
 
 
 def set_wait_timeout(timeout, poll=None):
@@ -758,7 +959,8 @@ def set_wait_timeout(timeout, poll=None):
 
     :argument timeout: The new timeout in seconds.
     :argument poll: The poll frequency in seconds. It is how long `wait_for`
-       should wait in between checking its condition.
+       should wait after checking its condition for the first time. The delay
+       grows for each following check, up to five times the poll frequency.
 
     """
     msg = 'Setting wait timeout to %rs' % timeout
@@ -781,6 +983,35 @@ def get_wait_timeout():
     return _TIMEOUT
 
 
+def set_test_timeout(timeout):
+    """Set how long the current test can still run.
+
+    When the time is up, the browser of the test is killed and the test is
+    reported as an error. The waiting actions don't wait past that time.
+
+    The limit at the start of a test is set by the `--test-timeout` command
+    line option (for scripts) or `test_timeout` in `SSTTestCase`.
+
+    :argument timeout: The number of seconds, from now, the test can still
+        run. If it is `None`, the test can run for ever.
+
+    """
+    logger.debug('Setting test timeout to %rs' % (timeout,))
+    _test.set_test_timeout(timeout)
+
+
+def _set_test_deadline(deadline):
+    global _TEST_DEADLINE
+    _TEST_DEADLINE = deadline
+
+
+def _time_left(timeout):
+    # Shorten the timeout to end when the test must be done
+    if _TEST_DEADLINE is None:
+        return timeout
+    return max(0, min(timeout, _TEST_DEADLINE - time.time()))
+
+
 def _get_name(obj):
     try:
         return obj.__name__
@@ -790,12 +1021,17 @@ def _get_name(obj):
 
 def _wait_for(condition, refresh_page, timeout, poll, *args, **kwargs):
     logger.debug('Waiting for %r' % _get_name(condition))
+    dom_condition = None
+    if _EVENT_DRIVEN_WAIT and not refresh_page:
+        dom_condition = _get_dom_condition(condition, args, kwargs)
     # Disable logging levels equal to or lower than INFO.
     logging.disable(logging.INFO)
     result = None
     try:
-        max_time = time.time() + timeout
+        max_time = time.time() + _time_left(timeout)
         msg = _get_name(condition)
+        delay = poll
+        dom_condition_held = False
         while True:
             #refresh the page if requested
             if refresh_page:
@@ -805,27 +1041,40 @@ def _wait_for(condition, refresh_page, timeout, poll, *args, **kwargs):
                 result = condition(*args, **kwargs)
             except AssertionError as e:
                 pass
+            except StaleElementReferenceException as e:
+                # Checked again like a failed condition, within the same
+                # time out.
+                logger.warning('Retrying after catching: %r' % e)
             else:
                 if result is not False:
                     break
-            if time.time() > max_time:
+            remaining = max_time - time.time()
+            if remaining < 0:
                 error = 'Timed out waiting for: %s' % msg
                 if e:
                     error += '\nError during wait: %s' % e
                 _raise(error)
-            time.sleep(poll)
+            if dom_condition_held:
+                # The DOM condition doesn't tell when the condition holds,
+                # poll instead.
+                dom_condition = None
+            if dom_condition is not None:
+                try:
+                    dom_condition_held = _wait_for_dom(
+                        dom_condition, min(remaining, _DOM_WAIT_SLICE))
+                    continue
+                except WebDriverException as dom_error:
+                    logger.debug('Cannot wait for DOM changes: %s'
+                                 % (dom_error,))
+                    dom_condition = None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * _POLL_BACKOFF, poll * _MAX_POLL_FACTOR)
     finally:
         # Re-enable logging.
         logging.disable(logging.NOTSET)
     return result
 
 
-# Selenium sometimes raises StaleElementReferenceException which leads to
-# spurious failures. In those cases, using this decorator will retry the
-# function once and avoid the spurious failure. This is a work-around until
-# selenium is properly fixed and should not be abused (or there is a
-# significant risk to hide bugs in the user scripts).
-@retry_on_exception(StaleElementReferenceException, retries=10)
 def wait_for(condition, *args, **kwargs):
     """Wait for an action to succeed.
 
@@ -837,9 +1086,9 @@ def wait_for(condition, *args, **kwargs):
         wait_for(assert_title, 'Some page title')
 
     :argument condition: A function to wait for. It can either be an action or
-        a function that returns False or throws an AssertionError for failure,
-        and returns anything different from False (including not returning
-        anything) for success.
+        a function that returns False or throws an AssertionError or a
+        StaleElementReferenceException for failure, and returns anything
+        different from False (including not returning anything) for success.
     :argument args: The arguments to pass to the `condition` function.
     :argument kwargs: The keyword arguments to pass to the `condition`
         function.
@@ -875,6 +1124,200 @@ def wait_for_and_refresh(condition, *args, **kwargs):
     return _wait_for(condition, True, _TIMEOUT, _POLL, *args, **kwargs)
 
 
+def set_event_driven_wait(enabled=True):
+    """Let `wait_for` wait for DOM changes instead of polling.
+
+    For the conditions checking the DOM (`get_element`, `assert_element`,
+    `exists_element`, `get_element_by_css`, `get_elements_by_css`,
+    `assert_text`, `assert_text_contains` and `assert_attribute`), `wait_for`
+    watches the page from the browser and checks the condition again as soon
+    as it may hold. The other conditions are polled.
+
+    This sets the timeout of the asynchronous scripts for the browser.
+
+    The event driven wait is disabled at the start of each test.
+
+    :argument enabled: If `True` `wait_for` waits for DOM changes, otherwise
+        it polls all the conditions.
+
+    """
+    if enabled:
+        logger.debug('Enabling the event driven wait')
+    else:
+        logger.debug('Disabling the event driven wait')
+    _set_event_driven_wait(enabled)
+
+
+def _set_event_driven_wait(enabled):
+    global _EVENT_DRIVEN_WAIT
+    _EVENT_DRIVEN_WAIT = enabled
+
+
+# How long a single script waits for DOM changes. The condition is checked
+# with WebDriver in between, in case its DOM counterpart misses a change.
+_DOM_WAIT_SLICE = 1
+
+# Calls back with true as soon as a predicate about the DOM holds or with
+# false after a timeout (in milliseconds).
+_DOM_WAIT_SCRIPT = """
+var name = arguments[0], args = arguments[1], timeout = arguments[2];
+var callback = arguments[arguments.length - 1];
+function getElement(target) {
+    if (typeof target == 'string') {
+        return document.getElementById(target);
+    }
+    return target;
+}
+function getText(element) {
+    var text = element.innerText;
+    if (typeof text != 'string') {
+        text = element.textContent;
+    }
+    var lines = text.split(/\\r?\\n/), kept = [];
+    for (var i = 0; i < lines.length; i++) {
+        var line = lines[i].replace(/[\\s\\u00a0]+/g, ' ');
+        line = line.replace(/^ | $/g, '');
+        if (line) {
+            kept.push(line);
+        }
+    }
+    return kept.join('\\n');
+}
+var predicates = {
+    present: function(selector, text) {
+        var elements = document.querySelectorAll(selector);
+        if (text === null) {
+            return elements.length > 0;
+        }
+        for (var i = 0; i < elements.length; i++) {
+            if (getText(elements[i]) == text) {
+                return true;
+            }
+        }
+        return false;
+    },
+    text: function(target, text, contains) {
+        var element = getElement(target);
+        if (!element) {
+            return false;
+        }
+        var tag = element.tagName.toLowerCase(), actual;
+        if (tag == 'input' || tag == 'textarea') {
+            actual = element.value;
+        } else {
+            actual = getText(element);
+        }
+        return contains ? actual.indexOf(text) != -1 : actual == text;
+    },
+    attribute: function(target, attribute, value) {
+        var element = getElement(target);
+        if (!element) {
+            return false;
+        }
+        var actual = element[attribute];
+        if (typeof actual != 'string') {
+            actual = element.getAttribute(attribute);
+        }
+        return actual == value;
+    }
+};
+function check() {
+    try {
+        return predicates[name].apply(null, args);
+    } catch (e) {
+        return false;
+    }
+}
+if (check()) {
+    callback(true);
+    return;
+}
+var timer, observer = new MutationObserver(function() {
+    if (check()) {
+        observer.disconnect();
+        clearTimeout(timer);
+        callback(true);
+    }
+});
+observer.observe(document, {childList: true, subtree: true,
+                            attributes: true, characterData: true});
+timer = setTimeout(function() {
+    observer.disconnect();
+    callback(false);
+}, timeout);
+"""
+
+
+def _wait_for_dom(dom_condition, timeout):
+    """Wait in the browser for a DOM condition to hold.
+
+    :argument dom_condition: A pair (predicate name, arguments).
+    :argument timeout: How long to wait, in seconds.
+    :raise: WebDriverException if the browser can't run the script.
+    :return: `True` if the condition holds, `False` on timeout.
+
+    """
+    name, args = dom_condition
+    _test.browser.set_script_timeout(timeout + _DOM_WAIT_SLICE)
+    return _test.browser.execute_async_script(
+        _DOM_WAIT_SCRIPT, name, args, int(timeout * 1000))
+
+
+def _element_dom_condition(tag=None, css_class=None, id=None, text=None,
+                           text_regex=None, **kwargs):
+    selector = _make_selector(tag, css_class, id, kwargs)
+    if not selector:
+        return None
+    # The elements matching text_regex are among the ones matching the
+    # selector.
+    return 'present', [selector, text or None]
+
+
+def _css_dom_condition(selector):
+    return 'present', [selector, None]
+
+
+def _text_dom_condition(id_or_elem, text):
+    return 'text', [id_or_elem, text, False]
+
+
+def _text_contains_dom_condition(id_or_elem, text, regex=False):
+    if regex:
+        return None
+    return 'text', [id_or_elem, text, True]
+
+
+def _attribute_dom_condition(id_or_elem, attribute, value, regex=False):
+    if regex:
+        return None
+    return 'attribute', [id_or_elem, attribute, value]
+
+
+# The DOM counterparts of the actions, by name.
+_dom_conditions = {
+    'assert_attribute': _attribute_dom_condition,
+    'assert_element': _element_dom_condition,
+    'assert_text': _text_dom_condition,
+    'assert_text_contains': _text_contains_dom_condition,
+    'exists_element': _element_dom_condition,
+    'get_element': _element_dom_condition,
+    'get_element_by_css': _css_dom_condition,
+    'get_elements': _element_dom_condition,
+    'get_elements_by_css': _css_dom_condition,
+}
+
+
+def _get_dom_condition(condition, args, kwargs):
+    name = getattr(condition, '__name__', None)
+    if name not in _dom_conditions or globals()[name] is not condition:
+        return None
+    try:
+        return _dom_conditions[name](*args, **kwargs)
+    except TypeError:
+        # The action will fail with the same arguments.
+        return None
+
+
 def fails(action, *args, **kwargs):
     """Check that an action raises an AssertionError.
 
@@ -895,14 +1338,265 @@ def fails(action, *args, **kwargs):
     _raise(msg)
 
 
+class _ElementCache(object):
+    """The elements already found by id.
+
+    The elements are keyed by the window and the frame they were found in,
+    and forgotten when an action loads another document. A cached element is
+    reused without any call to the browser: if the page replaced it, or
+    loaded another document on its own, the element is stale and looked for
+    again when used (see `_SelfHealingElement`).
+
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.window = None
+        self.frames = ()
+        self.elements = {}
+
+    def reset(self, enabled):
+        self.enabled = enabled
+        self.window = None
+        self.frames = ()
+        self.forget()
+
+    def _key(self, locator):
+        return (self.window, self.frames, locator)
+
+    def get(self, locator):
+        return self.elements.get(self._key(locator))
+
+    def keep(self, locator, elem):
+        if self.enabled:
+            self.elements[self._key(locator)] = elem
+
+    def switch_to_window(self, window):
+        self.window = window
+        self.frames = ()
+
+    def switch_to_frame(self, frame):
+        if frame is None:
+            self.frames = ()
+        else:
+            self.frames += (frame,)
+
+    def forget(self):
+        self.elements.clear()
+
+
+_element_cache = _ElementCache()
+
+
+def set_element_cache(enabled=True):
+    """Reuse the elements found by id until the page changes.
+
+    The actions receiving the identifier of an element look for it in the page
+    every time. With the cache enabled, the element found is reused, without
+    any call to the browser, by the following actions until the page is loaded
+    again (`go_to`, `refresh`, `go_back` or clicking with `wait=True`) or
+    another window or frame is selected.
+
+    If the page replaces an element with a new one with the same id from
+    JavaScript, or loads another document on its own, the element is stale
+    and the next action using it looks for it again.
+
+    The cache is disabled at the start of each test.
+
+    :argument enabled: If `True` the elements are cached, otherwise they are
+        looked for every time.
+
+    """
+    if enabled:
+        logger.debug('Enabling the element cache')
+    else:
+        logger.debug('Disabling the element cache')
+    _set_element_cache(enabled)
+
+
+def _set_element_cache(enabled):
+    _element_cache.reset(enabled)
+
+
+class _SelfHealingElement(WebElement):
+    """An element looked for again when it becomes stale.
+
+    `locate` is called without arguments and returns the element, it is called
+    once for each command failing with a StaleElementReferenceException. If
+    it finds the element, the element object is updated and the command is
+    run again. Otherwise, or if the element found is stale too, the
+    StaleElementReferenceException is raised.
+
+    """
+
+    def __init__(self, parent, id_, locate):
+        super(_SelfHealingElement, self).__init__(parent, id_)
+        self._locate = locate
+
+    def _execute(self, command, params=None):
+        execute = super(_SelfHealingElement, self)._execute
+        try:
+            try:
+                return execute(command, params)
+            except StaleElementReferenceException:
+                found = _locate_again(self._locate)
+                if found is None:
+                    raise
+            self._id = found.id
+            return execute(command, params)
+        except StaleElementReferenceException:
+            # Its document (or at least its node) is gone, the elements cached
+            # can't be trusted either.
+            _element_cache.forget()
+            raise
+
+
+def _heal_on_stale(elem, locate):
+    """Get a copy of `elem` looked for again with `locate` when stale."""
+    return _SelfHealingElement(elem.parent, elem.id, locate)
+
+
+def _by_id(identifier):
+    """Get a callable locating the element with the given id."""
+    return lambda: _test.browser.find_element_by_id(identifier)
+
+
+def _locate_again(locate):
+    logger.debug('Looking for a stale element again')
+    try:
+        return locate()
+    except (AssertionError, WebDriverException):
+        return None
+
+
 def _get_elem(id_or_elem):
     if isinstance(id_or_elem, WebElement):
         return id_or_elem
+    if isinstance(id_or_elem, _Element):
+        return id_or_elem.element
+    elem = _element_cache.get(id_or_elem)
+    if elem is not None:
+        return elem
     try:
-        return _test.browser.find_element_by_id(id_or_elem)
+        elem = _test.browser.find_element_by_id(id_or_elem)
     except (NoSuchElementException, WebDriverException):
         msg = 'Element with id: %r does not exist' % id_or_elem
         _raise(msg)
+    elem = _heal_on_stale(elem, _by_id(id_or_elem))
+    _element_cache.keep(id_or_elem, elem)
+    return elem
+
+
+# Returns the value of a field of an element: its rendered text, its tag name,
+# whether it is displayed, its class or the property (or attribute) with that
+# name.
+_GET_VALUE_FUNCTION = """
+function getValue(element, field) {
+    if (field == 'text') {
+        if (typeof element.innerText == 'string') {
+            return element.innerText;
+        }
+        return element.textContent;
+    }
+    if (field == 'tag') {
+        return element.tagName.toLowerCase();
+    }
+    if (field == 'displayed') {
+        var style = window.getComputedStyle(element);
+        return (element.getClientRects().length > 0 &&
+                style.visibility != 'hidden');
+    }
+    if (field == 'class') {
+        return element.getAttribute('class');
+    }
+    var value = element[field];
+    if (value === undefined || value === null || typeof value == 'object' ||
+            typeof value == 'function') {
+        value = element.getAttribute(field);
+    }
+    return value;
+}
+"""
+
+# The fields read at once by _Element. The text and the visibility are left
+# out, the browser and WebDriver don't always agree on them.
+_ELEMENT_FIELDS = ('tag', 'type', 'id', 'value', 'checked', 'href')
+
+_ELEMENT_FIELDS_SCRIPT = _GET_VALUE_FUNCTION + """
+var element = arguments[0], fields = arguments[1], values = [];
+for (var i = 0; i < fields.length; i++) {
+    values.push(getValue(element, fields[i]));
+}
+return values;
+"""
+
+
+class _Element(object):
+    """Wrap an element to read several of its fields in a single call.
+
+    The fields are read together the first time one of them is used, and
+    again after the element is changed with `click` or `send_keys`. An
+    `_Element` is meant to be used for a single action, the page may change
+    the element in between two actions.
+
+    """
+
+    def __init__(self, element, fields=_ELEMENT_FIELDS):
+        self.element = element
+        self.fields = fields
+        self._values = None
+
+    def _get(self, field):
+        if self._values is None:
+            self._values = self._read()
+        return self._values[field]
+
+    def _read(self):
+        try:
+            values = _test.browser.execute_script(
+                _ELEMENT_FIELDS_SCRIPT, self.element, list(self.fields))
+        except WebDriverException:
+            values = [self._read_field(field) for field in self.fields]
+        return dict(zip(self.fields, values))
+
+    def _read_field(self, field):
+        # Fallback for the browsers that can't read the fields from a script.
+        if field == 'tag':
+            return self.element.tag_name
+        if field == 'checked':
+            return self.element.is_selected()
+        return self.element.get_attribute(field)
+
+    @property
+    def tag_name(self):
+        return self._get('tag')
+
+    def get_attribute(self, name):
+        if name in self.fields:
+            return self._get(name)
+        return self.element.get_attribute(name)
+
+    def is_selected(self):
+        if 'checked' in self.fields:
+            return bool(self._get('checked'))
+        return self.element.is_selected()
+
+    def click(self):
+        self._values = None
+        self.element.click()
+
+    def send_keys(self, *value):
+        self._values = None
+        self.element.send_keys(*value)
+
+    def __getattr__(self, name):
+        return getattr(self.element, name)
+
+
+def _get_wrapped_elem(id_or_elem):
+    if isinstance(id_or_elem, _Element):
+        return id_or_elem
+    return _Element(_get_elem(id_or_elem))
 
 
 # Takes an optional 2nd input type for cases like textfield & password
@@ -932,6 +1626,65 @@ def assert_dropdown(id_or_elem):
     return elem
 
 
+# Selects the option of a drop-down list with the text arguments[1] (or the
+# value arguments[2]) and fires the events of a selection by the user.
+# Returns 'not-select', 'not-found' or 'selected'.
+_SELECT_OPTION_SCRIPT = """
+var select = arguments[0], text = arguments[1], value = arguments[2];
+function fire(type) {
+    var event = document.createEvent('HTMLEvents');
+    event.initEvent(type, true, false);
+    select.dispatchEvent(event);
+}
+if (select.type != 'select-one') {
+    return 'not-select';
+}
+if (text === null && value === null) {
+    return 'not-found';
+}
+for (var i = 0; i < select.options.length; i++) {
+    var option = select.options[i];
+    if (text !== null ? option.text == text : option.value == value) {
+        if (!option.selected) {
+            option.selected = true;
+            fire('input');
+            fire('change');
+        }
+        return 'selected';
+    }
+}
+return 'not-found';
+"""
+
+# Returns 'not-select', 'not-set' or 'set' depending on the selected option of
+# a drop-down list having the text arguments[1].
+_SELECTED_OPTION_SCRIPT = """
+var select = arguments[0], text = arguments[1];
+if (select.type != 'select-one') {
+    return 'not-select';
+}
+for (var i = 0; i < select.options.length; i++) {
+    var option = select.options[i];
+    if (option.text == text && option.value == select.value) {
+        return 'set';
+    }
+}
+return 'not-set';
+"""
+
+
+def _run_dropdown_script(elem, script, *args):
+    """Run a script on a drop-down list.
+
+    :return: The result of the script or `None` if the browser can't run it.
+
+    """
+    try:
+        return _test.browser.execute_script(script, elem, *args)
+    except WebDriverException:
+        return None
+
+
 def set_dropdown_value(id_or_elem, text=None, value=None):
     """Set the value of a drop-down list.
 
@@ -945,10 +1698,35 @@ def set_dropdown_value(id_or_elem, text=None, value=None):
         is not in the drop-down list.
 
     """
-    elem = assert_dropdown(id_or_elem)
-    logger.debug(
-        'Setting %r option list to %r' % (_element_to_string(elem),
-                                          text or value))
+    elem = _get_elem(id_or_elem)
+    logger.debug('Setting %r option list to %r', _ElementString(elem),
+                 text or value)
+    if text and not value:
+        result = _run_dropdown_script(elem, _SELECT_OPTION_SCRIPT, text, None)
+    elif value and not text:
+        result = _run_dropdown_script(elem, _SELECT_OPTION_SCRIPT, None, value)
+    else:
+        result = _run_dropdown_script(elem, _SELECT_OPTION_SCRIPT, None, None)
+    if result is None:
+        _click_dropdown_option(elem, id_or_elem, text, value)
+        return
+    if result == 'not-select':
+        _raise('Element %r is not one of %r' % (id_or_elem, ('select-one',)))
+    if result == 'not-found':
+        if text and not value:
+            msg = ('The following option could not be found in the list: %r'
+                   % text)
+        elif value and not text:
+            msg = ('The following option could not be found in the list: %r'
+                   % value)
+        else:
+            msg = 'Use set_dropdown_value() with either text or value!'
+        _raise(msg)
+
+
+def _click_dropdown_option(elem, id_or_elem, text, value):
+    # Fallback for the browsers that can't select the option from a script.
+    _elem_is_type(elem, id_or_elem, 'select-one')
     if text and not value:
         for element in elem.find_elements_by_tag_name('option'):
             if element.text == text:
@@ -975,16 +1753,28 @@ def assert_dropdown_value(id_or_elem, text_in):
         drop-down list or if the selected text is not the expected.
 
     """
-    elem = assert_dropdown(id_or_elem)
+    elem = _get_elem(id_or_elem)
+    result = _run_dropdown_script(elem, _SELECTED_OPTION_SCRIPT, text_in)
+    if result is None:
+        result = _read_dropdown_value(elem, id_or_elem, text_in)
+    if result == 'not-select':
+        _raise('Element %r is not one of %r' % (id_or_elem, ('select-one',)))
+    if result == 'not-set':
+        msg = 'The option is not currently set to: %r' % text_in
+        _raise(msg)
+
+
+def _read_dropdown_value(elem, id_or_elem, text_in):
+    # Fallback for the browsers that can't read the option from a script.
+    _elem_is_type(elem, id_or_elem, 'select-one')
     # Because there is no way to connect the current
     # text of a select element we have to use 'value'
     current = elem.get_attribute('value')
     for element in elem.find_elements_by_tag_name('option'):
         if text_in == element.text and \
                 current == element.get_attribute('value'):
-            return
-    msg = 'The option is not currently set to: %r' % text_in
-    _raise(msg)
+            return 'set'
+    return 'not-set'
 
 
 def assert_radio(id_or_elem):
@@ -996,7 +1786,11 @@ def assert_radio(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
+    return _assert_radio(id_or_elem).element
+
+
+def _assert_radio(id_or_elem):
+    elem = _get_wrapped_elem(id_or_elem)
     _elem_is_type(elem, id_or_elem, 'radio')
     return elem
 
@@ -1011,10 +1805,11 @@ def assert_radio_value(id_or_elem, value):
         or the value is not the expected.
 
     """
-    elem = assert_radio(id_or_elem)
+    elem = _assert_radio(id_or_elem)
     selected = elem.is_selected()
-    msg = 'Radio %r should be set to: %s.' % (_element_to_string(elem), value)
     if value != selected:
+        msg = 'Radio %r should be set to: %s.' % (_element_to_string(elem),
+                                                  value)
         _raise(msg)
 
 
@@ -1026,8 +1821,8 @@ def set_radio_value(id_or_elem):
         button.
 
     """
-    elem = assert_radio(id_or_elem)
-    logger.debug('Selecting radio button item %r' % _element_to_string(elem))
+    elem = _assert_radio(id_or_elem)
+    logger.debug('Selecting radio button item %r', _ElementString(elem))
     elem.click()
 
 
@@ -1050,7 +1845,7 @@ def assert_text(id_or_elem, text):
 
 
 def _get_text_for_assertion(id_or_elem):
-    elem = _get_elem(id_or_elem)
+    elem = _get_wrapped_elem(id_or_elem)
     if _is_text_field(elem):
         value = elem.get_attribute('value')
         if not value:
@@ -1071,7 +1866,7 @@ def _is_text_field(element):
     # XXX refactor assert_textfield. It should be the other way around,
     # assert_textfield should call is_text_field. -- elopio 2013-04-18
     try:
-        assert_textfield(element)
+        _assert_textfield(element)
         return True
     except AssertionError:
         return False
@@ -1100,13 +1895,85 @@ def assert_text_contains(id_or_elem, text, regex=False):
             _raise(msg)
 
 
-def _check_text(elem, text):
-    return get_text(elem) == text
+def _check_text(actual, text):
+    return actual == text
+
+
+def _match_text(actual, regex):
+    return bool(re.search(regex, actual or ''))
+
+
+# Returns the text of an element as rendered by the browser. Without
+# innerText, its text content stands in for it, with its white space collapsed
+# as for inline text since the line breaks of the layout are unknown.
+_RENDERED_TEXT_FUNCTION = """
+function renderedText(element) {
+    if (typeof element.innerText == 'string') {
+        return element.innerText;
+    }
+    return element.textContent.replace(/[\\s\\u00a0]+/g, ' ');
+}
+"""
+
+# Returns the text of the elements as rendered by the browser.
+_RENDERED_TEXTS_SCRIPT = _RENDERED_TEXT_FUNCTION + """
+var elements = arguments[0];
+var texts = [];
+for (var i = 0; i < elements.length; i++) {
+    texts.push(renderedText(elements[i]));
+}
+return texts;
+"""
+
+
+def _get_rendered_texts(elems):
+    """Get the texts of several elements in a single round trip.
+
+    The texts are normalized like WebDriver does but may still differ from the
+    ones returned by `get_text` (e.g. for hidden elements, or for elements
+    with several lines in the browsers without `innerText`).
+
+    :return: The list of texts or `None` if the browser can't run the script.
+
+    """
+    try:
+        texts = _test.browser.execute_script(_RENDERED_TEXTS_SCRIPT, elems)
+    except WebDriverException:
+        return None
+    return [_normalize_text(text) for text in texts]
 
 
-def _match_text(elem, regex):
-    text = get_text(elem) or ''
-    return bool(re.search(regex, text))
+def _normalize_text(text):
+    lines = (' '.join(line.replace(u'\xa0', ' ').split())
+             for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _filter_by_text(elems, check, expected):
+    if len(elems) > 1:
+        texts = _get_rendered_texts(elems)
+        if texts is not None:
+            # Only the elements rendered with a matching text are checked
+            # against their WebDriver text, which saves a round trip for each
+            # element discarded.
+            elems = [elem for elem, text in zip(elems, texts)
+                     if check(text, expected)]
+    return [elem for elem in elems if check(get_text(elem), expected)]
+
+
+def _make_selector(tag, css_class, id, attributes):
+    selector_string = ''
+    if tag:
+        selector_string = tag
+    if css_class:
+        css_class_selector = css_class.strip().replace(' ', '.')
+        selector_string += ('.%s' % css_class_selector)
+    if id:
+        selector_string += ('#%s' % id)
+
+    selector_string += ''.join(['[%s=%r]' % (key, value) for
+                                key, value in attributes.items()])
+    return selector_string
 
 
 def get_elements(tag=None, css_class=None, id=None, text=None,
@@ -1134,17 +2001,7 @@ def get_elements(tag=None, css_class=None, id=None, text=None,
     if text and text_regex:
         raise TypeError("You can't use text and text_regex arguments")
 
-    selector_string = ''
-    if tag:
-        selector_string = tag
-    if css_class:
-        css_class_selector = css_class.strip().replace(' ', '.')
-        selector_string += ('.%s' % css_class_selector)
-    if id:
-        selector_string += ('#%s' % id)
-
-    selector_string += ''.join(['[%s=%r]' % (key, value) for
-                                key, value in kwargs.items()])
+    selector_string = _make_selector(tag, css_class, id, kwargs)
     try:
         if text and not selector_string:
             elems = _test.browser.find_elements_by_xpath(
@@ -1161,9 +2018,9 @@ def get_elements(tag=None, css_class=None, id=None, text=None,
 
     if text:
         # if text was specified, filter elements
-        elems = [element for element in elems if _check_text(element, text)]
+        elems = _filter_by_text(elems, _check_text, text)
     elif text_regex:
-        elems = [elem for elem in elems if _match_text(elem, text_regex)]
+        elems = _filter_by_text(elems, _match_text, text_regex)
 
     if not elems:
         msg = 'Could not identify elements: 0 elements found'
@@ -1192,7 +2049,8 @@ def get_element(tag=None, css_class=None, id=None, text=None,
     :raise: TypeError if you pass both `text` and `text_regex`. AssertionError
         if no element matches the attributes or if more than one element
         match.
-    :return: The elements that matches.
+    :return: The elements that matches. If it becomes stale, it is looked for
+        again with the same arguments.
 
     """
     elems = get_elements(tag=tag, css_class=css_class,
@@ -1202,7 +2060,10 @@ def get_element(tag=None, css_class=None, id=None, text=None,
         msg = 'Could not identify element: %s elements found' % len(elems)
         _raise(msg)
 
-    return elems[0]
+    return _heal_on_stale(
+        elems[0], lambda: get_element(tag=tag, css_class=css_class, id=id,
+                                      text=text, text_regex=text_regex,
+                                      **kwargs))
 
 
 def exists_element(tag=None, css_class=None, id=None, text=None,
@@ -1266,7 +2127,11 @@ def assert_button(id_or_elem):
     :return: The element object.
 
     """
-    elem = _get_elem(id_or_elem)
+    return _assert_button(id_or_elem).element
+
+
+def _assert_button(id_or_elem):
+    elem = _get_wrapped_elem(id_or_elem)
     if elem.tag_name == 'button':
         return elem
     if elem.get_attribute('type') == 'button':
@@ -1279,19 +2144,19 @@ def click_button(id_or_elem, wait=True):
     """Click a button.
 
     :argument id_or_elem: The identifier of the element, or its element object.
-    :argument wait: If `True`, this action will wait until a page with a body
-        element is available. Otherwise, it will return immediately after the
-        Selenium refresh action is completed.
+    :argument wait: If `True`, this action will wait until the page is ready,
+        as set by `set_page_readiness`. It can also be the name of the page
+        readiness strategy to use, or a `PageReadiness` object. Otherwise, it
+        will return immediately after the Selenium refresh action is completed.
     :raise: AssertionError if the element doesn't exist or isn't a button.
 
     """
-    button = assert_button(id_or_elem)
-
-    logger.debug('Clicking button %r' % _element_to_string(button))
-    button.click()
+    button = _assert_button(id_or_elem)
 
+    logger.debug('Clicking button %r', _ElementString(button))
+    _load_page(button.click, wait, button.element)
     if wait:
-        _waitforbody()
+        _element_cache.forget()
 
 
 def get_elements_by_css(selector):
@@ -1317,14 +2182,81 @@ def get_element_by_css(selector):
         element.
     :raise: AssertionError if no element matches the `selector` of if more
         than one match.
-    :return: The elements that matches.
+    :return: The elements that matches. If it becomes stale, it is looked for
+        again with the same selector.
 
     """
     elements = get_elements_by_css(selector)
     if len(elements) != 1:
         msg = 'Could not identify element: %s elements found' % len(elements)
         _raise(msg)
-    return elements[0]
+    return _heal_on_stale(elements[0],
+                          lambda: get_element_by_css(selector))
+
+
+# Returns, for each element matching a CSS selector, a list with the element
+# (if asked for) and the values of the fields.
+_ELEMENTS_DATA_SCRIPT = _GET_VALUE_FUNCTION + """
+var elements = document.querySelectorAll(arguments[0]);
+var fields = arguments[1], keep = arguments[2];
+var rows = [];
+for (var i = 0; i < elements.length; i++) {
+    var row = keep ? [elements[i]] : [];
+    for (var j = 0; j < fields.length; j++) {
+        row.push(getValue(elements[i], fields[j]));
+    }
+    rows.push(row);
+}
+return rows;
+"""
+
+
+def get_elements_data(selector, fields=('text',), keep_elements=False):
+    """Return data about all the elements that match a CSS selector.
+
+    The data of all the elements is read with a single call to the browser.
+
+    The fields can be:
+
+    * 'text': the text of the element, as rendered by the browser. It may
+      differ from the one returned by `get_text` (e.g. for hidden elements).
+    * 'tag': the tag name of the element.
+    * 'displayed': `True` if the element takes some space in the page and is
+      not hidden.
+    * 'class': the value of the class attribute.
+    * Any other name: the value of the property with that name or, if the
+      element has no such property, of the attribute with that name (like
+      `href` or `value`).
+
+    :argument selector: The CSS selector that will be used to search for the
+        elements.
+    :argument fields: The names of the fields to read for each element.
+    :argument keep_elements: If `True`, the element object will be added to
+        the data of each element, with the 'element' key.
+    :raise: AssertionError if the browser can't run the search.
+    :return: A list with a dict mapping the names of the fields to their
+        values, for each element that matches.
+
+    """
+    logger.debug('Getting %r for the elements matching %r'
+                 % (list(fields), selector))
+    fields = list(fields)
+    try:
+        rows = _test.browser.execute_script(
+            _ELEMENTS_DATA_SCRIPT, selector, fields, keep_elements)
+    except WebDriverException as e:
+        msg = 'Element data not found: %s' % e
+        _raise(msg)
+    data = []
+    for row in rows:
+        element_data = {}
+        if keep_elements:
+            element_data['element'] = row.pop(0)
+        element_data.update(zip(fields, row))
+        if element_data.get('text') is not None:
+            element_data['text'] = _normalize_text(element_data['text'])
+        data.append(element_data)
+    return data
 
 
 def get_elements_by_xpath(selector):
@@ -1350,18 +2282,332 @@ def get_element_by_xpath(selector):
         element.
     :raise: AssertionError if no element matches the `selector` of if more
         than one match.
-    :return: The elements that matches.
+    :return: The elements that matches. If it becomes stale, it is looked for
+        again with the same selector.
 
     """
     elements = get_elements_by_xpath(selector)
     if len(elements) != 1:
         msg = 'Could not identify element: %s elements found' % len(elements)
         _raise(msg)
-    return elements[0]
+    return _heal_on_stale(elements[0],
+                          lambda: get_element_by_xpath(selector))
+
+
+class PageReadiness(object):
+    """How the actions loading a page wait for it to be ready.
+
+    `prepare` is called before the action and what it returns is passed to
+    `wait` once the action is done.
+
+    This strategy doesn't wait at all.
+
+    """
+
+    def prepare(self):
+        return None
+
+    def wait(self, prepared):
+        pass
+
+    def run(self, action, element=None):
+        """Run an action loading a page and wait for the page.
+
+        :argument action: A callable running the action.
+        :argument element: The element the action clicks, if any.
+
+        """
+        prepared = self.prepare()
+        action()
+        self.wait(prepared)
+
+
+class BodyReadiness(PageReadiness):
+    """Wait for a page with a body element.
+
+    This passes immediately if the action didn't load a page yet.
+
+    """
+
+    def wait(self, prepared):
+        wait_for(get_element, tag='body')
+
+
+class ReadyStateReadiness(PageReadiness):
+    """Wait for the document to be completely loaded.
+
+    This passes immediately if the action didn't load a page yet.
+
+    """
+
+    def wait(self, prepared):
+        wait_for(_document_is_complete)
+
+
+def _document_is_complete():
+    try:
+        state = _test.browser.execute_script('return document.readyState')
+    except WebDriverException:
+        # The document is being replaced
+        return False
+    return state == 'complete'
+
+
+_document_marks = itertools.count()
+
+
+# Marks the document, notes when it starts being unloaded, and clicks an
+# element, in a single call.
+_MARK_AND_CLICK_SCRIPT = """
+var element = arguments[0];
+document.sstMark = arguments[1];
+window.sstUnloading = false;
+if (!window.sstUnloadListener) {
+    window.sstUnloadListener = function() {
+        window.sstUnloading = true;
+    };
+    window.addEventListener('beforeunload', window.sstUnloadListener);
+}
+element.click();
+"""
+
+# Returns whether the marked document is still there (and being unloaded or
+# not) or the state of the document replacing it.
+_DOCUMENT_STATE_SCRIPT = """
+var mark = arguments[0];
+if (mark !== null && document.sstMark === mark) {
+    return window.sstUnloading ? 'unloading' : 'unchanged';
+}
+return document.readyState;
+"""
+
+
+class NavigationReadiness(PageReadiness):
+    """Wait for another document to be completely loaded.
+
+    An element is clicked from a script marking the document in the same
+    call. If the mark is still there after the click, and the document isn't
+    being unloaded, for `grace` seconds, no page is being loaded and there is
+    no need to wait. Pages loaded later (e.g. from a timer) are not waited
+    for.
+
+    The actions loading a page from WebDriver (`go_to`, `refresh` and
+    `go_back`) wait for any complete document, WebDriver doesn't return
+    before the new document is there.
+
+    """
+
+    # How long a click has to start loading another page
+    grace = 0.3
+
+    def run(self, action, element=None):
+        mark = None
+        if element is not None:
+            mark = '%s-%s' % (os.getpid(), next(_document_marks))
+            try:
+                _test.browser.execute_script(
+                    _MARK_AND_CLICK_SCRIPT, element, mark)
+            except WebDriverException:
+                # The element couldn't be clicked from a script, click it
+                # from WebDriver and wait for any complete document instead.
+                mark = None
+        if mark is None:
+            action()
+        self.wait(mark)
+
+    def wait(self, prepared):
+        wait_for(_document_is_loaded, prepared, time.time() + self.grace)
+
+
+def _document_is_loaded(mark, end_of_grace):
+    try:
+        state = _test.browser.execute_script(_DOCUMENT_STATE_SCRIPT, mark)
+    except WebDriverException:
+        # The document is being replaced
+        return False
+    if state == 'unchanged':
+        # The click may not have started loading a page yet
+        return time.time() >= end_of_grace
+    return state == 'complete'
+
+
+class NetworkIdleReadiness(NavigationReadiness):
+    """Wait for another document, if any, and for the network to be idle.
+
+    See `wait_for_network_idle`.
+
+    """
+
+    def __init__(self, quiet_ms=500):
+        self.quiet_ms = quiet_ms
+
+    def run(self, action, element=None):
+        # Count the requests sent by the action itself
+        try:
+            _network_is_idle(self.quiet_ms)
+        except WebDriverException:
+            pass
+        super(NetworkIdleReadiness, self).run(action, element)
+
+    def wait(self, prepared):
+        super(NetworkIdleReadiness, self).wait(prepared)
+        wait_for_network_idle(self.quiet_ms)
+
+
+# The page readiness strategies, by name.
+_page_readiness_strategies = {
+    'body': BodyReadiness(),
+    'navigation': NavigationReadiness(),
+    'network': NetworkIdleReadiness(),
+    'none': PageReadiness(),
+    'ready': ReadyStateReadiness(),
+}
+_PAGE_READINESS = 'body'
+
+
+def set_page_readiness(readiness):
+    """Set how the actions loading a page wait for it to be ready.
+
+    The actions accepting a `wait` argument (`go_to`, `refresh`, `go_back`,
+    `click_link`, `click_element` and `click_button`) use it when `wait` is
+    `True`.
+
+    The page readiness strategies are:
+
+    * 'body': wait for a page with a body element. This is the default at the
+      start of a test.
+    * 'ready': wait for the document to be completely loaded.
+    * 'navigation': wait for another document to be completely loaded. The
+      click actions click the element from a script marking the document,
+      if the click doesn't start loading another document within a short
+      grace period, it returns then.
+    * 'network': like 'navigation', then wait for the network to be idle (see
+      `wait_for_network_idle`).
+    * 'none': don't wait.
+
+    :argument readiness: The name of the strategy or a `PageReadiness` object.
+    :raise: ValueError if there is no strategy with that name.
+
+    """
+    logger.debug('Setting page readiness to %r' % (readiness,))
+    _set_page_readiness(readiness)
+
+
+def _set_page_readiness(readiness):
+    global _PAGE_READINESS
+    _get_page_readiness(readiness)
+    _PAGE_READINESS = readiness
+
+
+def _get_page_readiness(wait):
+    if wait is True:
+        wait = _PAGE_READINESS
+    if not wait:
+        return _page_readiness_strategies['none']
+    if isinstance(wait, PageReadiness):
+        return wait
+    try:
+        return _page_readiness_strategies[wait]
+    except KeyError:
+        raise ValueError('Unknown page readiness: %r' % (wait,))
+
+
+# Installs a counter of the pending XMLHttpRequest and fetch requests in the
+# document, unless it's already there, and returns whether the document is
+# loaded with no request sent or completed for the last arguments[0] ms.
+_NETWORK_IDLE_SCRIPT = """
+var quiet = arguments[0];
+function now() {
+    return new Date().getTime();
+}
+var tracker = window.sstNetwork;
+if (!tracker) {
+    tracker = window.sstNetwork = {pending: 0, last: now()};
+    var started = function() {
+        tracker.pending++;
+        tracker.last = now();
+        var finished = false;
+        return function() {
+            if (!finished) {
+                finished = true;
+                tracker.pending--;
+                tracker.last = now();
+            }
+        };
+    };
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        var done = started();
+        this.addEventListener('loadend', done);
+        try {
+            return send.apply(this, arguments);
+        } catch (e) {
+            done();
+            throw e;
+        }
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function() {
+            var done = started();
+            try {
+                return fetch.apply(this, arguments).then(
+                    function(response) {
+                        done();
+                        return response;
+                    },
+                    function(error) {
+                        done();
+                        throw error;
+                    });
+            } catch (e) {
+                done();
+                throw e;
+            }
+        };
+    }
+}
+return (document.readyState == 'complete' && tracker.pending == 0 &&
+        now() - tracker.last >= quiet);
+"""
+
+
+def _network_is_idle(quiet_ms):
+    return _test.browser.execute_script(_NETWORK_IDLE_SCRIPT, quiet_ms)
+
+
+def _check_network_idle(quiet_ms):
+    try:
+        return _network_is_idle(quiet_ms)
+    except WebDriverException:
+        # The document is being replaced
+        return False
 
 
-def _waitforbody():
-    wait_for(get_element, tag='body')
+def wait_for_network_idle(quiet_ms=500, timeout=None):
+    """Wait until the page has no pending XMLHttpRequest or fetch request.
+
+    The requests are counted from the page itself, the counter is installed
+    the first time this action is called for a document. The requests sent
+    before that are not counted, so the network is only considered idle after
+    `quiet_ms` once the counter is installed. The page readiness strategy
+    'network' installs the counter before loading a page.
+
+    :argument quiet_ms: How long there should be no request sent or
+        completed, in milliseconds.
+    :argument timeout: How long to wait, in seconds. If `None`, the timeout set
+        by `set_wait_timeout` is used.
+    :raise: AssertionError if the network is still busy after the timeout.
+
+    """
+    if timeout is None:
+        timeout = _TIMEOUT
+    logger.debug('Waiting for the network to be idle for %sms' % quiet_ms)
+    _wait_for(_check_network_idle, False, timeout, _POLL, quiet_ms)
+
+
+def _load_page(action, wait, element=None):
+    _get_page_readiness(wait).run(action, element)
 
 
 def get_page_source():
@@ -1373,6 +2619,7 @@ def close_window():
     """ Closes the current window."""
     logger.debug('Closing the current window')
     _test.browser.close()
+    _element_cache.forget()
 
 
 def switch_to_window(index_or_name=None):
@@ -1387,6 +2634,7 @@ def switch_to_window(index_or_name=None):
     if index_or_name is None:
         logger.debug('Switching to default window')
         _test.browser.switch_to_window('')
+        _element_cache.switch_to_window('')
     elif isinstance(index_or_name, int):
         index = index_or_name
         window_handles = _test.browser.window_handles
@@ -1397,6 +2645,7 @@ def switch_to_window(index_or_name=None):
         try:
             logger.debug('Switching to window: %r' % window)
             _test.browser.switch_to_window(window)
+            _element_cache.switch_to_window(window)
         except NoSuchWindowException:
             msg = 'Could not find window: %r' % window
             _raise(msg)
@@ -1405,6 +2654,7 @@ def switch_to_window(index_or_name=None):
         try:
             logger.debug('Switching to window: %r' % name)
             _test.browser.switch_to_window(name)
+            _element_cache.switch_to_window(name)
         except NoSuchWindowException:
             msg = 'Could not find window: %r' % name
             _raise(msg)
@@ -1421,10 +2671,12 @@ def switch_to_frame(index_or_name=None):
     if index_or_name is None:
         logger.debug('Switching to default content frame')
         _test.browser.switch_to_default_content()
+        _element_cache.switch_to_frame(None)
     else:
         logger.debug('Switching to frame: %r' % index_or_name)
         try:
             _test.browser.switch_to_frame(index_or_name)
+            _element_cache.switch_to_frame(index_or_name)
         except NoSuchFrameException:
             msg = 'Could not find frame: %r' % index_or_name
             _raise(msg)
@@ -1494,6 +2746,94 @@ def dismiss_alert(expected_text=None, text_to_write=None):
     _alert_action('dismiss', expected_text, text_to_write)
 
 
+# Returns the tag name, the header texts and the cell texts of the rows in the
+# first tbody of a table, or null if the browser doesn't provide the rendered
+# texts: the text content would include hidden text and lose the line breaks,
+# unlike the visible text the table assertions compare.
+_TABLE_DATA_SCRIPT = """
+var table = arguments[0];
+if (typeof table.innerText != 'string') {
+    return null;
+}
+function getTexts(parent, tag) {
+    var elements = parent.getElementsByTagName(tag);
+    var texts = [];
+    for (var i = 0; i < elements.length; i++) {
+        texts.push(elements[i].innerText);
+    }
+    return texts;
+}
+var data = {tag: table.tagName.toLowerCase(),
+            headers: getTexts(table, 'th'),
+            rows: null};
+var bodies = table.getElementsByTagName('tbody');
+if (bodies.length) {
+    data.rows = [];
+    var rows = bodies[0].getElementsByTagName('tr');
+    for (var i = 0; i < rows.length; i++) {
+        data.rows.push(getTexts(rows[i], 'td'));
+    }
+}
+return data;
+"""
+
+
+def _get_table_data(id_or_elem):
+    """Get the headers and rows of a table.
+
+    :return: A pair (headers, rows), `rows` is `None` if the table has no
+        tbody.
+
+    """
+    elem = _get_elem(id_or_elem)
+    try:
+        data = _test.browser.execute_script(_TABLE_DATA_SCRIPT, elem)
+    except WebDriverException:
+        data = None
+    if data is None:
+        return _read_table_data(elem, id_or_elem)
+    if data['tag'] != 'table':
+        _raise('Element %r is not a table.' % (id_or_elem,))
+    headers = [_normalize_text(text) for text in data['headers']]
+    rows = data['rows']
+    if rows is not None:
+        rows = [[_normalize_text(text) for text in row] for row in rows]
+    return headers, rows
+
+
+def _read_table_data(elem, id_or_elem):
+    # Fallback for the browsers that can't return the rendered texts in one
+    # call, reading the visible text of each cell.
+    if not elem.tag_name == 'table':
+        _raise('Element %r is not a table.' % (id_or_elem,))
+    headers = [get_text(e) for e in elem.find_elements_by_tag_name('th')]
+    rows = None
+    body = elem.find_elements_by_tag_name('tbody')
+    if body:
+        rows = [[get_text(e) for e in row.find_elements_by_tag_name('td')]
+                for row in body[0].find_elements_by_tag_name('tr')]
+    return headers, rows
+
+
+def get_table_data(id_or_elem):
+    """Return the texts of the headers and cells of a table.
+
+    The headers are the `<th>` tags. The rows are the `<tr>` tags inside the
+    first `<tbody>`, and their cells the `<td>` tags. All the texts are read
+    with a single call to the browser.
+
+    :argument id_or_elem: The identifier of the element, or its element object.
+    :raise: AssertionError if the element doesn't exist or isn't a table.
+    :return: A pair (headers, rows). `headers` is a list with the text of the
+        headers, `rows` a list with a list of the cell texts for each row. It
+        is empty if the table has no tbody.
+
+    """
+    logger.debug('Getting the data of table %r' % (id_or_elem,))
+    headers, rows = _get_table_data(id_or_elem)
+    return headers, rows or []
+
+
 def assert_table_headers(id_or_elem, headers):
     """Assert the headers of a table.
 
@@ -1506,17 +2846,20 @@ def assert_table_headers(id_or_elem, headers):
 
     """
     logger.debug('Checking headers for %r' % (id_or_elem,))
-    elem = _get_elem(id_or_elem)
-    if not elem.tag_name == 'table':
-        _raise('Element %r is not a table.' % (id_or_elem,))
-    header_elems = elem.find_elements_by_tag_name('th')
-    header_text = [get_text(e) for e in header_elems]
+    header_text, _ = _get_table_data(id_or_elem)
     if not header_text == headers:
         msg = ('Expected headers:%r. Actual headers%r\n' %
                (headers, header_text))
         _raise(msg)
 
 
+def _get_table_rows(id_or_elem):
+    _, rows = _get_table_data(id_or_elem)
+    if rows is None:
+        _raise('Table %r has no tbody.' % (id_or_elem,))
+    return rows
+
+
 def assert_table_has_rows(id_or_elem, num_rows):
     """Assert the number of rows of a table.
 
@@ -1529,13 +2872,7 @@ def assert_table_has_rows(id_or_elem, num_rows):
 
     """
     logger.debug('Checking table %r has %s rows' % (id_or_elem, num_rows))
-    elem = _get_elem(id_or_elem)
-    if not elem.tag_name == 'table':
-        _raise('Element %r is not a table.' % (id_or_elem,))
-    body = elem.find_elements_by_tag_name('tbody')
-    if not body:
-        _raise('Table %r has no tbody.' % (id_or_elem,))
-    rows = body[0].find_elements_by_tag_name('tr')
+    rows = _get_table_rows(id_or_elem)
     if not len(rows) == num_rows:
         msg = 'Expected %s rows. Found %s.' % (num_rows, len(rows))
         _raise(msg)
@@ -1560,18 +2897,11 @@ def assert_table_row_contains_text(id_or_elem, row, contents, regex=False):
     """
     logger.debug(
         'Checking the contents of table %r, row %s.' % (id_or_elem, row))
-    elem = _get_elem(id_or_elem)
-    if not elem.tag_name == 'table':
-        _raise('Element %r is not a table.' % (id_or_elem,))
-    body = elem.find_elements_by_tag_name('tbody')
-    if not body:
-        _raise('Table %r has no tbody.' % (id_or_elem,))
-    rows = body[0].find_elements_by_tag_name('tr')
+    rows = _get_table_rows(id_or_elem)
     if len(rows) <= row:
         msg = 'Asked to fetch row %s. Highest row is %s' % (row, len(rows) - 1)
         _raise(msg)
-    columns = rows[row].find_elements_by_tag_name('td')
-    cells = [get_text(e) for e in columns]
+    cells = rows[row]
     if not regex:
         success = cells == contents
     elif len(contents) != len(cells):
@@ -1597,8 +2927,8 @@ def assert_attribute(id_or_elem, attribute, value, regex=False):
 
     """
     elem = _get_elem(id_or_elem)
-    logger.debug(
-        'Checking attribute %r of %r' % (attribute, _element_to_string(elem)))
+    logger.debug('Checking attribute %r of %r', attribute,
+                 _ElementString(elem))
     actual = elem.get_attribute(attribute)
     if not regex:
         success = value == actual
@@ -1621,9 +2951,8 @@ def assert_css_property(id_or_elem, property, value, regex=False):
 
     """
     elem = _get_elem(id_or_elem)
-    logger.debug(
-        'Checking css property %r: %r of %r' % (
-            property, value, _element_to_string(elem)))
+    logger.debug('Checking css property %r: %r of %r', property, value,
+                 _ElementString(elem))
     actual = elem.value_of_css_property(property)
     # some browsers return string with space padded commas, some don't.
     actual = actual.replace(', ', ',')
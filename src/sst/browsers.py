@@ -17,23 +17,55 @@
 #   limitations under the License.
 #
 
+import atexit
+import copy
+import errno
+import hashlib
+import httplib
+import json
 import logging
+import os
 import platform
+import random
 import shutil
+import signal
+import socket
 import subprocess
+import threading
 import time
+import urllib2
+import urlparse
 
 from selenium import webdriver
 from selenium.common import exceptions as selenium_exceptions
+from selenium.webdriver.chrome import (
+    service as chrome_service,
+    webdriver as chrome_webdriver,
+)
 from selenium.webdriver.common import utils
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from selenium.webdriver.firefox import (
+    extension_connection,
     firefox_binary,
+    firefox_profile,
     webdriver as ff_webdriver,
 )
+from selenium.webdriver.remote import (
+    remote_connection,
+    webdriver as remote_webdriver,
+)
+
+from sst import locks
 
 
 logger = logging.getLogger('SST')
 
+# The errors a browser start can fail with and that are worth a retry: the
+# WebDriver ones and the network ones happening while talking to the browser
+# or the hub (refused or reset connections, time outs).
+START_ERRORS = (selenium_exceptions.WebDriverException, urllib2.URLError,
+                httplib.HTTPException, socket.error)
+
 
 class BrowserFactory(object):
     """Handle browser creation for tests.
@@ -42,6 +74,14 @@ class BrowserFactory(object):
     """
 
     webdriver_class = None
+    # The name the browsers will report (None if unknown before starting one)
+    browser_name = None
+    # Whether `browser` retries a failed start on its own, the tests then
+    # don't retry it again
+    retries_start = False
+    # The X display local browsers are started on, the one in DISPLAY when
+    # they start if None
+    display = None
 
     def __init__(self):
         super(BrowserFactory, self).__init__()
@@ -55,6 +95,16 @@ class BrowserFactory(object):
         """
         pass
 
+    def setup_key(self, test):
+        """Identify the browser setup for the given test.
+
+        Browsers created for tests with the same key are interchangeable.
+
+        Daughter classes redefining `setup_for_test` should redefine this
+        method to return the test attributes they depend on.
+        """
+        return None
+
     def browser(self):
         """Create a browser based on previously collected options.
 
@@ -63,37 +113,506 @@ class BrowserFactory(object):
         """
         return self.webdriver_class()
 
+    def cleanup(self):
+        """Release the resources used for the run.
+
+        This is called once all tests are run.
+        """
+        pass
+
 
-# MISSINGTEST: Exercise this class -- vila 2013-04-11
 class RemoteBrowserFactory(BrowserFactory):
 
     webdriver_class = webdriver.Remote
 
-    def __init__(self, remote_url, capabilities):
+    def __init__(self, remote_url, capabilities, scheduler=None):
+        """Create remote sessions.
+
+        :param remote_url: The url of the WebDriver endpoint.
+
+        :param capabilities: The desired capabilities for the sessions.
+
+        :param scheduler: An optional `SessionScheduler` limiting the number
+            of session requests in flight on the grid.
+        """
         super(RemoteBrowserFactory, self).__init__()
         self.remote_url = remote_url
         self.capabilities = capabilities
+        self.scheduler = scheduler
+        self.browser_name = capabilities.get('browserName')
+
+    @property
+    def retries_start(self):
+        # The scheduler retries with its own backoff
+        return self.scheduler is not None
 
     def browser(self):
-        return self.webdriver_class(self.remote_url, self.capabilities)
+        # Keep the connection open, the watchdog closes it to end a call
+        # hanging on a browser it cannot kill
+        if self.scheduler is None:
+            return self.webdriver_class(self.remote_url, self.capabilities,
+                                        keep_alive=True)
+        return self.scheduler.request_session(
+            lambda: self.webdriver_class(self.remote_url, self.capabilities,
+                                         keep_alive=True))
+
+
+class SessionScheduler(object):
+    """Limit the number of session requests in flight on a Selenium grid.
+
+    When many processes request a session at once, the hub queues the
+    requests or times out. Instead, a process waits for one of `capacity`
+    slots to be free before sending its request and releases the slot once
+    the session is created (or the request failed).
+
+    The slots are lock files in a directory shared by all the processes using
+    the same grid so concurrent processes (and concurrent runs) cooperate.
+
+    A failed request is retried after a jittered exponential backoff so
+    processes don't hammer the hub in lock step.
+    """
+
+    def __init__(self, remote_url, capacity, max_attempts=5, backoff=1.0,
+                 max_backoff=30.0, poll=0.5, lock_dir=None):
+        """Create a scheduler.
+
+        :param remote_url: The url of the WebDriver endpoint.
+
+        :param capacity: The maximum number of requests in flight, at least
+            1.
+
+        :param max_attempts: How many times a session request is sent before
+            giving up.
+
+        :param backoff: The base delay in seconds between two attempts. It is
+            doubled after each failure.
+
+        :param max_backoff: The maximum delay in seconds between two attempts.
+
+        :param poll: The average delay in seconds between two checks for a
+            free slot.
+
+        :param lock_dir: The directory holding the slots. By default, it is
+            derived from `remote_url` in the temp directory.
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1: %r' % (capacity,))
+        self.remote_url = remote_url
+        self.capacity = capacity
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll = poll
+        if lock_dir is None:
+            lock_dir = locks.lock_dir_for(
+                'sst-grid-%s' % (hashlib.md5(remote_url).hexdigest(),))
+        else:
+            try:
+                os.makedirs(lock_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        self.lock_dir = lock_dir
+        # How long each session request waited for a slot (in seconds)
+        self.waits = []
+
+    def acquire(self):
+        """Wait for a free slot.
+
+        :return: A file descriptor holding the slot lock.
+        """
+        slots = range(self.capacity)
+        while True:
+            # Don't let all processes compete for the same slots
+            random.shuffle(slots)
+            for slot in slots:
+                fd = locks.lock_file(
+                    os.path.join(self.lock_dir, 'slot-%d' % (slot,)))
+                if fd is not None:
+                    return fd
+            time.sleep(random.uniform(0.5, 1.5) * self.poll)
+
+    def release(self, fd):
+        """Release a slot acquired with `acquire`."""
+        locks.unlock_file(fd)
+
+    def request_session(self, create):
+        """Create a session once a slot is available.
+
+        :param create: A callable creating the session.
+
+        :return: The value returned by `create`.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            start = time.time()
+            fd = self.acquire()
+            waited = time.time() - start
+            self.waits.append(waited)
+            logger.debug('Waited %.3f secs for a session slot on %s'
+                         % (waited, self.remote_url))
+            try:
+                return create()
+            except START_ERRORS as e:
+                if attempt >= self.max_attempts:
+                    raise
+                delay = random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                logger.debug('Session request failed (attempt: %d), '
+                             'retrying in %.3f secs: %s' % (attempt, delay, e))
+            finally:
+                self.release(fd)
+            time.sleep(delay)
+
+
+class PortRegistry(object):
+    """Reserve local ports for browsers across processes.
+
+    `selenium.webdriver.common.utils.free_port` lets the OS pick a free port
+    but releases it immediately. Until the browser binds it, concurrent
+    processes can get the same port. A reserved port is locked with a file in
+    a directory shared by all processes until the browser using it quits.
+    """
+
+    def __init__(self, lock_dir=None, max_attempts=20):
+        """Create a registry.
+
+        :param lock_dir: The directory holding the port locks. By default, it
+            is shared by all processes on the host.
+
+        :param max_attempts: How many ports are tried before giving up.
+        """
+        self.lock_dir = lock_dir
+        self.max_attempts = max_attempts
+
+    def reserve(self):
+        """Reserve a free port.
+
+        :return: A `PortReservation`.
+        """
+        if self.lock_dir is None:
+            self.lock_dir = locks.lock_dir_for('sst-ports')
+        for attempt in range(1, self.max_attempts + 1):
+            port = utils.free_port()
+            fd = locks.lock_file(
+                os.path.join(self.lock_dir, 'port-%d' % (port,)))
+            if fd is not None:
+                return PortReservation(port, fd)
+            logger.debug('Port %d is reserved by another process' % (port,))
+        raise selenium_exceptions.WebDriverException(
+            'Cannot reserve a port after %d attempts' % (self.max_attempts,))
+
+
+class PortReservation(object):
+    """A port reserved by a `PortRegistry`."""
+
+    def __init__(self, port, fd):
+        self.port = port
+        self.fd = fd
+
+    def release(self):
+        """Let other processes use the port."""
+        if self.fd is not None:
+            fd, self.fd = self.fd, None
+            locks.unlock_file(fd)
+
+
+port_registry = PortRegistry()
+
+
+def child_pids(pid):
+    """Find the processes started by a process.
+
+    :param pid: The id of the parent process.
+
+    :return: The ids of its children, empty if they can't be found (no /proc
+        file system).
+    """
+    children = []
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join('/proc', entry, 'stat')) as f:
+                stat = f.read()
+        except IOError:
+            # The process is gone
+            continue
+        # The command name, between parentheses, may contain spaces
+        fields = stat.rsplit(')', 1)[-1].split()
+        if len(fields) > 1 and fields[1] == str(pid):
+            children.append(int(entry))
+    return children
+
+
+def kill_process_tree(pid):
+    """Kill a process and all its descendants.
+
+    :param pid: The id of the process at the root of the tree.
+    """
+    # Collect the whole tree first, killed parents get their children adopted
+    pids = [pid]
+    for parent in pids:
+        pids.extend(child_pids(parent))
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+
+def browser_processes(browser):
+    """Find the local processes running a browser.
+
+    :param browser: A webdriver instance.
+
+    :return: The `subprocess.Popen` objects of the browser binary (Firefox) or
+        of the driver (Chrome, PhantomJS, etc). Remote browsers have none.
+    """
+    processes = []
+    for owner in (getattr(browser, 'binary', None),
+                  getattr(browser, 'service', None)):
+        process = getattr(owner, 'process', None)
+        if process is not None:
+            processes.append(process)
+    return processes
+
+
+def kill_browser(browser):
+    """Kill the local processes running a browser, with their children.
+
+    The webdriver calls in progress fail once the browser is gone. `quit`
+    should still be called to release the other resources.
+
+    :param browser: A webdriver instance.
+
+    :return: True if some process was killed, False if none could be found.
+    """
+    processes = browser_processes(browser)
+    for process in processes:
+        logger.debug('Killing browser process %d' % (process.pid,))
+        kill_process_tree(process.pid)
+    return bool(processes)
+
+
+def disconnect_browser(browser):
+    """Close the connection to a browser without waiting for it.
+
+    The webdriver call in progress fails instead of waiting for ever for a
+    browser which cannot be killed (a remote one). The next call opens a new
+    connection, `quit` can still end the session.
+
+    :param browser: A webdriver instance.
+
+    :return: True if an open connection was closed, False if there was none.
+    """
+    executor = getattr(browser, 'command_executor', None)
+    conn = getattr(executor, '_conn', None)
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return False
+    logger.debug('Closing the connection to the browser')
+    try:
+        # Unlike close(), shutdown() wakes up the thread reading the socket
+        sock.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+        # Already closed by the other end
+        pass
+    return True
+
+
+def probe_grid_capacity(remote_url, timeout=10):
+    """Ask a Selenium grid hub how many slots it provides.
+
+    :param remote_url: The url of the WebDriver endpoint on the hub (eg:
+        http://host:port/wd/hub).
+
+    :param timeout: The time in seconds allowed for the hub to answer.
+
+    :return: The total number of slots or None if the hub can't tell.
+    """
+    parsed = urlparse.urlparse(remote_url)
+    # Credentials are not part of the hub api url
+    netloc = parsed.netloc.rpartition('@')[2]
+    api_url = urlparse.urlunparse(
+        (parsed.scheme, netloc, '/grid/api/hub', '', '', ''))
+    try:
+        response = urllib2.urlopen(api_url, timeout=timeout)
+        status = json.loads(response.read())
+        return int(status['slotCounts']['total'])
+    except (IOError, ValueError, KeyError, TypeError) as e:
+        logger.debug('Cannot probe grid capacity at %s: %s' % (api_url, e))
+        return None
+
+
+class PrewarmingBrowserFactory(BrowserFactory):
+    """Start the browser for the next test while the current test runs.
+
+    Starting a browser takes seconds. Each time a browser is handed over to a
+    test, another one is started in the background with the same setup so
+    the next test finds it ready.
+
+    A pre-warmed browser is only handed over to a test with the same setup
+    key (see `BrowserFactory.setup_key`) running on the same display. It is
+    discarded otherwise.
+
+    `cleanup` quits the unused browser once all tests are run.
+    """
+
+    def __init__(self, factory):
+        """Wrap a browser factory.
+
+        :param factory: The `BrowserFactory` creating the browsers.
+        """
+        super(PrewarmingBrowserFactory, self).__init__()
+        self.factory = factory
+        self.webdriver_class = factory.webdriver_class
+        self.browser_name = factory.browser_name
+        self.retries_start = factory.retries_start
+        self.test = None
+        self.pending = None
+        self.registered = False
+
+    def setup_for_test(self, test):
+        self.factory.setup_for_test(test)
+        self.test = test
+
+    def setup_key(self, test):
+        return (os.environ.get('DISPLAY'), self.factory.setup_key(test))
+
+    def browser(self):
+        key = self.setup_key(self.test)
+        browser = None
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            if pending.key == key:
+                browser = pending.take()
+            else:
+                logger.debug('Discarding pre-warmed browser: setup differs')
+                pending.discard()
+        if browser is None:
+            browser = self.factory.browser()
+        self.prewarm(self.test, key)
+        return browser
+
+    def prewarm(self, test, key):
+        """Start a browser in the background for the next test.
+
+        :param test: The test whose setup is used for the new browser.
+
+        :param key: The setup key of `test`.
+        """
+        if not self.registered:
+            # Don't leave a browser behind if 'cleanup' is never called
+            atexit.register(self.cleanup)
+            self.registered = True
+        # The copy keeps the setup for the next browser separate from the one
+        # for the current test.
+        factory = copy.copy(self.factory)
+        # The display is read here, DISPLAY may change (e.g. when an xvfb
+        # display is given back to a pool) while the browser starts in the
+        # background.
+        factory.display = os.environ.get('DISPLAY')
+        self.pending = PrewarmedBrowser(factory, test, key)
+        self.pending.start()
+
+    def cleanup(self):
+        """Quit the browser started for a test that will never run."""
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.discard()
+        self.factory.cleanup()
+
+
+class PrewarmedBrowser(threading.Thread):
+    """A browser started in the background."""
+
+    def __init__(self, factory, test, key):
+        super(PrewarmedBrowser, self).__init__()
+        # Never delay the end of the process
+        self.daemon = True
+        self.factory = factory
+        self.test = test
+        self.key = key
+        self.browser = None
+
+    def run(self):
+        try:
+            self.factory.setup_for_test(self.test)
+            self.browser = self.factory.browser()
+        except Exception as e:
+            # The test will start its own browser
+            logger.debug('Cannot pre-warm browser: %s' % (e,))
+        # Don't keep the test alive
+        self.test = None
+
+    def take(self):
+        """Wait for the browser to be started.
+
+        :return: The browser or None if it couldn't be started.
+        """
+        self.join()
+        return self.browser
+
+    def discard(self):
+        """Quit the browser once it is started."""
+        browser = self.take()
+        if browser is not None:
+            try:
+                browser.quit()
+            except Exception as e:
+                logger.debug('Cannot quit pre-warmed browser: %s' % (e,))
+
+
+class WebDriverChrome(chrome_webdriver.WebDriver):
+    """Start chrome on a given X display."""
+
+    def __init__(self, display=None):
+        # Same as the base class but chromedriver, and chrome with it, gets
+        # its own environment
+        env = None
+        if display is not None:
+            env = dict(os.environ, DISPLAY=display)
+        self.service = chrome_service.Service('chromedriver', env=env)
+        self.service.start()
+        try:
+            remote_webdriver.WebDriver.__init__(
+                self,
+                command_executor=self.service.service_url,
+                desired_capabilities=self.create_options().to_capabilities(),
+                keep_alive=True)
+        except:
+            self.quit()
+            raise
+        self._is_remote = False
 
 
 # MISSINGTEST: Exercise this class -- vila 2013-04-11
 class ChromeFactory(BrowserFactory):
 
-    webdriver_class = webdriver.Chrome
+    webdriver_class = WebDriverChrome
+    browser_name = 'chrome'
+
+    def browser(self):
+        return self.webdriver_class(display=self.display)
 
 
 # MISSINGTEST: Exercise this class (requires windows) -- vila 2013-04-11
 class IeFactory(BrowserFactory):
 
     webdriver_class = webdriver.Ie
+    browser_name = 'internet explorer'
 
 
 # MISSINGTEST: Exercise this class -- vila 2013-04-11
 class PhantomJSFactory(BrowserFactory):
 
     webdriver_class = webdriver.PhantomJS
+    browser_name = 'phantomjs'
     
     def browser(self):
         return self.webdriver_class(service_args=['--ignore-ssl-errors=true'])
@@ -103,6 +622,7 @@ class PhantomJSFactory(BrowserFactory):
 class OperaFactory(BrowserFactory):
 
     webdriver_class = webdriver.Opera
+    browser_name = 'opera'
 
 
 class FirefoxBinary(firefox_binary.FirefoxBinary):
@@ -119,6 +639,9 @@ class FirefoxBinary(firefox_binary.FirefoxBinary):
 
     It has been observed that this leads to hanging processes for 'firefox
     -silent'.
+
+    `WebDriverFirefox` uses a port reserved from a `PortRegistry` instead so
+    concurrent processes don't race for the same port.
     """
 
     def _start_from_profile_path(self, path):
@@ -175,40 +698,246 @@ class FirefoxBinary(firefox_binary.FirefoxBinary):
         return connectable
 
 
+class ProfileTemplates(object):
+    """Firefox profiles built once per set of preferences.
+
+    Building a profile requires unpacking the webdriver extension. Instead,
+    each browser gets a copy of the template matching its preferences where
+    the extension files are hard linked.
+    """
+
+    def __init__(self):
+        self.templates = {}
+        # Prewarmed browsers are created in other threads
+        self.lock = threading.Lock()
+        self.registered = False
+
+    def get(self, prefs):
+        """Get the template for the given preferences.
+
+        :param prefs: A dict of firefox preferences.
+
+        :return: The template directory path.
+        """
+        key = tuple(sorted(prefs.items()))
+        with self.lock:
+            path = self.templates.get(key)
+            if path is None:
+                if not self.registered:
+                    # Don't leave templates behind if 'cleanup' is not called
+                    atexit.register(self.cleanup)
+                    self.registered = True
+                path = self.build(prefs)
+                self.templates[key] = path
+            return path
+
+    def build(self, prefs):
+        profile = webdriver.FirefoxProfile()
+        for name, value in prefs.items():
+            profile.set_preference(name, value)
+        profile.add_extension()
+        profile.update_preferences()
+        logger.debug('Built profile template: %s' % (profile.path,))
+        return profile.path
+
+    def cleanup(self):
+        """Remove all templates."""
+        with self.lock:
+            templates, self.templates = self.templates, {}
+        for path in templates.values():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def copy_profile(template, path):
+    """Copy a profile template.
+
+    The extensions are never modified so their files are hard linked. Other
+    files (user.js is rewritten with the webdriver port) are copied.
+
+    :param template: The template directory path.
+
+    :param path: The existing directory receiving the copy.
+    """
+    extensions = os.path.join(template, 'extensions')
+    for dir_path, dir_names, file_names in os.walk(template):
+        rel_path = os.path.relpath(dir_path, template)
+        dest_path = os.path.normpath(os.path.join(path, rel_path))
+        if not os.path.isdir(dest_path):
+            os.makedirs(dest_path)
+        for name in file_names:
+            src = os.path.join(dir_path, name)
+            dest = os.path.join(dest_path, name)
+            if dir_path.startswith(extensions):
+                try:
+                    os.link(src, dest)
+                    continue
+                except OSError:
+                    # Not supported by the file system or cross-device
+                    pass
+            shutil.copy2(src, dest)
+
+
+class TemplateProfile(webdriver.FirefoxProfile):
+    """A firefox profile copied from a template.
+
+    The template already contains the webdriver extension.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        super(TemplateProfile, self).__init__()
+
+    def _create_tempfolder(self):
+        path = super(TemplateProfile, self)._create_tempfolder()
+        copy_profile(self.template, path)
+        return path
+
+    def add_extension(self, extension=firefox_profile.WEBDRIVER_EXT):
+        if extension == firefox_profile.WEBDRIVER_EXT:
+            # Already installed in the template
+            return
+        super(TemplateProfile, self).add_extension(extension)
+
+
+class ProfileCleaner(object):
+    """Remove profile directories in the background.
+
+    Removing a profile is not needed for the next test to start.
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def remove(self, *paths):
+        """Remove the given directories in a background thread."""
+        thread = threading.Thread(target=self._remove, args=paths)
+        thread.daemon = True
+        thread.start()
+        # Forget the removals already done
+        self.threads = [t for t in self.threads if t.is_alive()]
+        self.threads.append(thread)
+
+    def _remove(self, *paths):
+        for path in paths:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def wait(self):
+        """Wait for the pending removals to complete."""
+        threads, self.threads = self.threads, []
+        for thread in threads:
+            thread.join()
+
+
+profile_cleaner = ProfileCleaner()
+# Don't leave profiles behind
+atexit.register(profile_cleaner.wait)
+
+
+class ExtensionConnection(extension_connection.ExtensionConnection):
+    """Connect to the firefox webdriver extension on a given port.
+
+    The base class always picks the port with `utils.free_port`.
+    """
+
+    def __init__(self, host, firefox_profile, firefox_binary, timeout, port):
+        self.profile = firefox_profile
+        self.binary = firefox_binary
+        self.profile.port = port
+        self.profile.update_preferences()
+        self.profile.add_extension()
+        self.binary.launch_browser(self.profile)
+        remote_connection.RemoteConnection.__init__(
+            self, 'http://%s:%d/hub' % (host, port), keep_alive=True)
+
+
 class WebDriverFirefox(ff_webdriver.WebDriver):
     """Workarounds selenium firefox issues."""
 
     def __init__(self, firefox_profile=None, firefox_binary=None, timeout=30,
-                 capabilities=None, proxy=None):
+                 capabilities=None, proxy=None, ports=None, display=None):
+        if ports is None:
+            ports = port_registry
+        self.port_reservation = ports.reserve()
         try:
-            super(WebDriverFirefox, self).__init__(
-                firefox_profile, FirefoxBinary(), timeout, capabilities, proxy)
+            self._start(firefox_profile, timeout, capabilities, proxy,
+                        display)
         except selenium_exceptions.WebDriverException:
             # If we can't start, cleanup profile
+            self.port_reservation.release()
             shutil.rmtree(self.profile.path)
             if self.profile.tempfolder is not None:
                 shutil.rmtree(self.profile.tempfolder)
             raise
 
+    def _start(self, firefox_profile, timeout, capabilities, proxy,
+               display=None):
+        # Same as the base class but using the reserved port and the given
+        # display
+        self.binary = FirefoxBinary()
+        if display is not None:
+            self.binary._firefox_env['DISPLAY'] = display
+        self.profile = firefox_profile
+        if self.profile is None:
+            self.profile = webdriver.FirefoxProfile()
+        self.profile.native_events_enabled = (
+            self.NATIVE_EVENTS_ALLOWED and self.profile.native_events_enabled)
+        if capabilities is None:
+            capabilities = DesiredCapabilities.FIREFOX
+        if proxy is not None:
+            proxy.add_to_capabilities(capabilities)
+        remote_webdriver.WebDriver.__init__(
+            self,
+            command_executor=ExtensionConnection(
+                '127.0.0.1', self.profile, self.binary, timeout,
+                self.port_reservation.port),
+            desired_capabilities=capabilities,
+            keep_alive=True)
+        self._is_remote = False
+
+    def quit(self):
+        # Same as the base class but the profile is removed in the background
+        try:
+            remote_webdriver.WebDriver.quit(self)
+        except (httplib.BadStatusLine, socket.error):
+            # Firefox may shut down before we read the response
+            pass
+        self.binary.kill()
+        self.port_reservation.release()
+        profile_cleaner.remove(self.profile.path, self.profile.tempfolder)
+
 
 class FirefoxFactory(BrowserFactory):
 
     webdriver_class = WebDriverFirefox
+    browser_name = 'firefox'
+
+    def __init__(self):
+        super(FirefoxFactory, self).__init__()
+        self.templates = ProfileTemplates()
 
     def setup_for_test(self, test):
-        profile = webdriver.FirefoxProfile()
-        profile.set_preference('intl.accept_languages', 'en')
+        prefs = {'intl.accept_languages': 'en'}
         if test.assume_trusted_cert_issuer:
-            profile.set_preference('webdriver_assume_untrusted_issuer', False)
-            profile.set_preference(
-                'capability.policy.default.Window.QueryInterface', 'allAccess')
-            profile.set_preference(
-                'capability.policy.default.Window.frameElement.get',
+            prefs['webdriver_assume_untrusted_issuer'] = False
+            prefs['capability.policy.default.Window.QueryInterface'] = (
+                'allAccess')
+            prefs['capability.policy.default.Window.frameElement.get'] = (
                 'allAccess')
+        profile = TemplateProfile(self.templates.get(prefs))
+        for name, value in prefs.items():
+            profile.set_preference(name, value)
         self.profile = profile
 
+    def setup_key(self, test):
+        return test.assume_trusted_cert_issuer
+
     def browser(self):
-        return self.webdriver_class(self.profile)
+        return self.webdriver_class(self.profile, display=self.display)
+
+    def cleanup(self):
+        profile_cleaner.wait()
+        self.templates.cleanup()
 
 
 # MISSINGTEST: Exercise this class -- vila 2013-04-11
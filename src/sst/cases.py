@@ -19,15 +19,21 @@
 
 from __future__ import print_function
 
+import __future__
 import ast
+import atexit
 import logging
 import os
 import pdb
+import socket
+import sys
 import testtools
 import testtools.content
+import threading
+import time
 import traceback
+import urlparse
 
-from selenium.common import exceptions
 from sst import (
     actions,
     browsers,
@@ -40,19 +46,216 @@ from sst import (
 logger = logging.getLogger('SST')
 
 
+class SharedBrowser(object):
+    """The browser reused by the tests of a given scope.
+
+    Tests run one after the other in a process so only the browser for the
+    current scope is kept.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.browser = None
+        # The origins visited since the last reset, cleaned by the next one
+        self.origins = set()
+
+    def take(self, key):
+        """Get the browser started for the given key.
+
+        A browser started for another key is quit.
+
+        :return: The browser or None.
+        """
+        if self.browser is not None and self.key != key:
+            self.quit()
+        return self.browser
+
+    def keep(self, key, browser):
+        """Keep the browser for the next tests using the same key."""
+        if browser is not self.browser:
+            self.quit()
+        self.key = key
+        self.browser = browser
+
+    def quit(self):
+        """Quit the browser kept for a previous test."""
+        browser, self.browser, self.key = self.browser, None, None
+        self.origins = set()
+        if browser is not None:
+            try:
+                browser.quit()
+            except Exception as e:
+                logger.debug('Cannot quit shared browser: %s' % (e,))
+
+
+def get_origin(url):
+    """Get the origin of an http(s) URL, None for other URLs."""
+    parts = urlparse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        return None
+    return '%s://%s' % (parts.scheme, parts.netloc)
+
+
+shared_browser = SharedBrowser()
+# Don't leave a browser behind when the last test is done
+atexit.register(shared_browser.quit)
+
+
+class LazyBrowser(object):
+    """Stand in for the browser of a test until it is really needed.
+
+    The browser is started on first use and replaces the stand in as the test
+    browser.
+    """
+
+    def __init__(self, test):
+        self.test = test
+
+    def __getattr__(self, name):
+        return getattr(self.start(), name)
+
+    @property
+    def name(self):
+        # Known without starting the browser for most factories
+        name = self.test.browser_factory.browser_name
+        if name is None:
+            name = self.start().name
+        return name
+
+    def start(self):
+        logger.debug('Browser needed by %s' % (self.test.id(),))
+        self.test.start_browser()
+        return self.test.browser
+
+
+class TestTimeout(Exception):
+    """A test ran for longer than allowed."""
+
+
+class Watchdog(object):
+    """Kill the browser of a test running for too long.
+
+    No time out applies to a browser hanging in a webdriver call, the test
+    would wait for ever. When the time is up, the processes of the browser are
+    killed so the call fails and the test ends. A remote browser can't be
+    killed, the connection to it is closed instead.
+    """
+
+    def __init__(self, test, timeout):
+        """Create a watchdog.
+
+        :param test: The `SSTTestCase` to watch.
+
+        :param timeout: The number of seconds the test can run.
+        """
+        self.test = test
+        self.timeout = timeout
+        self.started = None
+        self.deadline = None
+        self.expired = False
+        # Where the test was when the time was up
+        self.stack = None
+        self.thread_id = None
+        self.timer = None
+
+    def start(self, timeout=None):
+        """Start counting, or count again from now.
+
+        :param timeout: The number of seconds the test can still run, the
+            initial timeout by default.
+        """
+        self.cancel()
+        if timeout is not None:
+            self.timeout = timeout
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        self.deadline = now + self.timeout
+        self.thread_id = threading.current_thread().ident
+        self.timer = threading.Timer(self.timeout, self.expire)
+        # Never delay the end of the process
+        self.timer.daemon = True
+        self.timer.start()
+
+    def cancel(self):
+        """Stop counting."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def expire(self):
+        """Stop the browser of the test, called when the time is up."""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is not None:
+            self.stack = ''.join(traceback.format_stack(frame))
+        self.expired = True
+        logger.error('%s timed out after %ss, stopping its browser'
+                     % (self.test.id(), self.timeout))
+        if not self.test.browser_started() or self.test.browser is None:
+            # A browser still starting is bound by the socket time out set by
+            # SSTTestCase._start_browser
+            return
+        try:
+            if browsers.kill_browser(self.test.browser):
+                return
+            if not browsers.disconnect_browser(self.test.browser):
+                logger.error('No browser process or connection to close')
+        except Exception as e:
+            logger.error('Cannot stop browser: %s' % (e,))
+
+    def check(self):
+        """Stop counting and report the test if the time was up.
+
+        :raise: TestTimeout if the test ran for too long.
+        """
+        self.cancel()
+        if self.deadline is None:
+            return
+        now = time.time()
+        if not self.expired and now < self.deadline:
+            return
+        msg = 'Test timed out after %.1f seconds (limit: %s seconds)' % (
+            min(now, self.deadline) - self.started, self.timeout)
+        if self.stack is not None:
+            msg += '\nTest stack when the time was up:\n' + self.stack
+        raise TestTimeout(msg)
+
+
 class SSTTestCase(testtools.TestCase):
     """A test case that can use the sst framework."""
 
     xvfb = None
     xserver_headless = False
+    # An optional xvfbdisplay.XvfbPool to borrow the headless server from
+    xvfb_pool = None
 
     browser_factory = browsers.FirefoxFactory()
 
+    # The tests sharing a browser: 'test' (no sharing), 'class', 'module' or
+    # 'session'. A shared browser is reset between tests (see
+    # `reset_browser`).
+    browser_scope = 'test'
+    # Start the browser only when the test uses it
+    lazy_browser = False
+
     assume_trusted_cert_issuer = False
 
     wait_timeout = 10
     wait_poll = 0.1
     base_url = None
+    # Reuse the elements found by id until the page changes (see
+    # `actions.set_element_cache`)
+    element_cache = False
+    # Let `wait_for` wait for DOM changes instead of polling (see
+    # `actions.set_event_driven_wait`)
+    event_driven_wait = False
+    # How the actions loading a page wait for it (see
+    # `actions.set_page_readiness`)
+    page_readiness = 'body'
+    # How many seconds the test can run before its browser is killed (see
+    # `Watchdog`), None for no limit
+    test_timeout = None
+    watchdog = None
 
     results_directory = None
     screenshots_on = False
@@ -61,20 +264,31 @@ class SSTTestCase(testtools.TestCase):
 
     def setUp(self):
         super(SSTTestCase, self).setUp()
+        self.watchdog = None
+        actions._set_test_deadline(None)
+        self.addCleanup(self._stop_watchdog)
+        if self.test_timeout is not None:
+            self.set_test_timeout(self.test_timeout)
         if self.base_url is not None:
             actions.set_base_url(self.base_url)
         actions._set_wait_timeout(self.wait_timeout, self.wait_poll)
+        actions._set_element_cache(self.element_cache)
+        actions._set_event_driven_wait(self.event_driven_wait)
+        actions._set_page_readiness(self.page_readiness)
         # Ensures sst.actions will find me
         actions._test = self
         if self.xserver_headless and self.xvfb is None:
-            # If we need to run headless and no xvfb is already running, start
-            # a new one for the current test, scheduling the shutdown for the
-            # end of the test.
-            self.xvfb = xvfbdisplay.use_xvfb_server(self)
+            # If we need to run headless and no xvfb is already running, borrow
+            # one from the pool or start a new one for the current test,
+            # scheduling the shutdown for the end of the test.
+            self.xvfb = xvfbdisplay.use_xvfb_server(self, pool=self.xvfb_pool)
         config.results_directory = self.results_directory
-        self.browser = None
-        self.start_browser()
-        self.addCleanup(self.stop_browser)
+        if self.lazy_browser:
+            self.browser = LazyBrowser(self)
+        else:
+            self.browser = None
+            self.start_browser()
+        self.addCleanup(self._stop_browser)
         if self.screenshots_on:
             self.addOnException(self.take_screenshot_and_page_dump)
         if self.debug_post_mortem:
@@ -83,6 +297,33 @@ class SSTTestCase(testtools.TestCase):
         if self.extended_report:
             self.addOnException(self.report_extensively)
 
+    def set_test_timeout(self, timeout):
+        """Set how long the test can still run.
+
+        :param timeout: The number of seconds, from now, before the browser is
+            killed and the test reported as an error. `None` removes the
+            limit.
+        """
+        if timeout is None:
+            if self.watchdog is not None:
+                self.watchdog.cancel()
+                self.watchdog = None
+            actions._set_test_deadline(None)
+            return
+        if self.watchdog is None:
+            self.watchdog = Watchdog(self, timeout)
+        self.watchdog.start(timeout)
+        actions._set_test_deadline(self.watchdog.deadline)
+
+    def _stop_watchdog(self):
+        actions._set_test_deadline(None)
+        if self.watchdog is not None:
+            self.watchdog.check()
+
+    def browser_killed(self):
+        """Whether the watchdog killed the browser of the test."""
+        return self.watchdog is not None and self.watchdog.expired
+
     def shortDescription(self):
         # testools wrongly defines this as returning self.id(). Since we're not
         # using the short description (aka the first line of the test
@@ -93,25 +334,152 @@ class SSTTestCase(testtools.TestCase):
 
     def _start_browser(self):
         self.browser_factory.setup_for_test(self)
-        self.browser = self.browser_factory.browser()
+        default_timeout = socket.getdefaulttimeout()
+        if self.watchdog is not None:
+            # The watchdog can't reach a browser before it is returned, the
+            # connections opened meanwhile give up when the time is up
+            socket.setdefaulttimeout(
+                max(self.watchdog.deadline - time.time(), 0.1))
+        try:
+            self.browser = self.browser_factory.browser()
+        finally:
+            socket.setdefaulttimeout(default_timeout)
 
     def start_browser(self):
+        key = None
+        if self.browser_scope != 'test':
+            key = self.get_browser_key()
+            if self._reuse_browser(key):
+                return
         max_attempts = 5
+        if self.browser_factory.retries_start:
+            # A single start, the factory already retried with backoff
+            max_attempts = 1
         for nb_attempts in range(1, max_attempts + 1):
             try:
                 logger.debug('Starting browser (attempt: %d)' % nb_attempts)
                 self._start_browser()
                 break
-            except exceptions.WebDriverException:
+            except browsers.START_ERRORS:
                 if nb_attempts >= max_attempts:
                     raise
         logger.debug('Browser started: %s' % self.browser.name)
+        if key is not None:
+            shared_browser.keep(key, self.browser)
+
+    def _reuse_browser(self, key):
+        browser = shared_browser.take(key)
+        if browser is None:
+            return False
+        self.browser = browser
+        try:
+            self.reset_browser()
+        except Exception as e:
+            logger.debug('Cannot reset browser, starting a new one: %s'
+                         % (e,))
+            shared_browser.quit()
+            self.browser = None
+            return False
+        logger.debug('Browser reused: %s' % self.browser.name)
+        return True
+
+    def get_browser_key(self):
+        """Identify the browser that can be reused by this test.
+
+        Tests with the same key share a browser.
+        """
+        if self.browser_scope == 'class':
+            scope = self.__class__
+        elif self.browser_scope == 'module':
+            scope = self.__class__.__module__
+        elif self.browser_scope == 'session':
+            scope = None
+        else:
+            raise ValueError('Unknown browser scope: %r'
+                             % (self.browser_scope,))
+        return (scope, self.browser_factory,
+                self.browser_factory.setup_key(self),
+                os.environ.get('DISPLAY'))
+
+    def record_origin(self, url):
+        """Remember the origin of a URL visited by the test.
+
+        The state of every recorded origin is cleared before a shared browser
+        is reused. `go_to` records the URLs it visits, pages reached another
+        way (links, forms, scripts) are only known if the test ends on them.
+        """
+        origin = get_origin(url)
+        if origin is not None and self.browser_scope != 'test':
+            shared_browser.origins.add(origin)
+
+    def reset_browser(self):
+        """Reset a browser used by a previous test.
+
+        Extra windows are closed, the cookies and storage of each origin
+        visited by the previous tests (see `record_origin`) are cleared,
+        visiting the root of the origin if needed, and the browser goes to
+        about:blank.
+
+        Daughter classes can redefine this method to tune the reset. Raising
+        an exception gets the test a new browser instead.
+        """
+        browser = self.browser
+        handles = browser.window_handles
+        for handle in handles[1:]:
+            browser.switch_to_window(handle)
+            browser.close()
+        browser.switch_to_window(handles[0])
+        browser.switch_to_default_content()
+        # The current page first, it doesn't need to be loaded
+        current = get_origin(browser.current_url)
+        self.clear_page_state()
+        for origin in sorted(shared_browser.origins - set([current])):
+            browser.get(origin + '/')
+            self.clear_page_state()
+        shared_browser.origins = set()
+        browser.get('about:blank')
+
+    def clear_page_state(self):
+        """Clear the cookies and storage of the current page origin."""
+        browser = self.browser
+        browser.delete_all_cookies()
+        browser.execute_script(
+            'try { window.localStorage.clear();'
+            ' window.sessionStorage.clear(); } catch (e) {}')
+
+    def browser_started(self):
+        """Whether the browser has been started.
+
+        This is False only while a lazy browser has not been used.
+        """
+        return not isinstance(self.browser, LazyBrowser)
+
+    def _stop_browser(self):
+        if not self.browser_started():
+            return
+        if self.browser_killed():
+            # What's left of the browser can't be reused
+            if self.browser is shared_browser.browser:
+                shared_browser.quit()
+                return
+            try:
+                self.browser.quit()
+            except Exception as e:
+                logger.debug('Cannot quit killed browser: %s' % (e,))
+            return
+        self.stop_browser()
 
     def stop_browser(self):
+        if self.browser_scope != 'test':
+            # The next test in the same scope will reuse it
+            return
         logger.debug('Stopping browser')
         self.browser.quit()
 
     def take_screenshot_and_page_dump(self, exc_info):
+        if not self.browser_started():
+            # Nothing to see
+            return
         try:
             filename = 'screenshot-{0}.png'.format(self.id())
             actions.take_screenshot(filename)
@@ -134,14 +502,16 @@ class SSTTestCase(testtools.TestCase):
     def report_extensively(self, exc_info):
         exc_class, exc, tb = exc_info
         original_message = str(exc)
-        try:
-            current_url = actions.get_current_url()
-        except Exception:
-            current_url = 'unavailable'
-        try:
-            page_source = actions.get_page_source()
-        except Exception:
-            page_source = 'unavailable'
+        current_url = page_source = 'unavailable'
+        if self.browser_started():
+            try:
+                current_url = actions.get_current_url()
+            except Exception:
+                pass
+            try:
+                page_source = actions.get_page_source()
+            except Exception:
+                pass
         self.addDetail(
             'Original exception',
             testtools.content.text_content('{0} : {1}'.format(
@@ -194,11 +564,25 @@ class SSTScriptTestCase(SSTTestCase):
         context.populate_context(self.context, self.script_path,
                                  self.browser.name)
 
+    def get_browser_key(self):
+        # A script is a class of tests (one per csv row) and a directory is a
+        # module.
+        if self.browser_scope == 'class':
+            scope = self.script_path
+        elif self.browser_scope == 'module':
+            scope = self.script_dir
+        else:
+            return super(SSTScriptTestCase, self).get_browser_key()
+        return (scope, self.browser_factory,
+                self.browser_factory.setup_key(self),
+                os.environ.get('DISPLAY'))
+
     def _compile_script(self):
         self.script_path = os.path.join(self.script_dir, self.script_name)
-        with open(self.script_path) as f:
-            source = f.read() + '\n'
-        self.code = compile(source, self.script_path, 'exec')
+        # Scripts have always been compiled with the print function of this
+        # module
+        self.code = context.script_cache.get(
+            self.script_path, __future__.print_function.compiler_flag)
 
     def run_test_script(self, result=None):
         # Run the test catching exceptions sstnam style
@@ -116,6 +116,41 @@ def get_common_options():
     parser.add_option('--skip-clean-results', dest='skip_clean_results',
                       default='no',
                       help=('Skip results folder cleaning, default=no. Values "no", "yes"'))
+    parser.add_option('-c', '--concurrency', dest='concurrency',
+                      default=1, type='int',
+                      help='concurrency (number of procs)')
+    parser.add_option('--scheduling', dest='scheduling',
+                      default='static', type='choice',
+                      choices=['static', 'dynamic'],
+                      help=('how tests are assigned to concurrent procs: '
+                            'static (split before running) or dynamic '
+                            '(each proc pulls the next test when free)'))
+    parser.add_option('--durations-file', dest='durations_file',
+                      default=None,
+                      help=('file recording test durations, used to balance '
+                            'concurrent runs'))
+    parser.add_option('--prewarm', dest='prewarm',
+                      action='store_true', default=False,
+                      help=('start the browser for the next test while the '
+                            'current one runs'))
+    parser.add_option('--browser-scope', dest='browser_scope',
+                      default=None, type='choice',
+                      choices=['test', 'class', 'module', 'session'],
+                      help=('tests sharing a browser: test (none), class '
+                            '(script), module (directory) or session; the '
+                            'state of the origins opened with go_to or left '
+                            'open is cleared between tests'))
+    parser.add_option('--lazy-browser', dest='lazy_browser',
+                      action='store_true', default=False,
+                      help='start the browser only when a test uses it')
+    parser.add_option('--test-timeout', dest='test_timeout',
+                      default=None, type='float',
+                      help=('seconds a test can run before its browser is '
+                            'stopped and the test reported as an error'))
+    parser.add_option('--script-cache-dir', dest='script_cache_dir',
+                      default=None,
+                      help=('directory keeping the compiled scripts for the '
+                            'concurrent processes and the next runs'))
     return parser
 
 
@@ -124,9 +159,6 @@ def get_run_options():
     parser.add_option('-x', dest='xserver_headless',
                       default=False, action='store_true',
                       help='run browser in headless xserver (Xvfb)')
-    parser.add_option('-c', '--concurrency', dest='concurrency',
-                      default=1, type='int',
-                      help='concurrency (number of procs)')
     return parser
 
 
@@ -149,9 +181,27 @@ def get_remote_options():
                       help=('url to WebDriver endpoint '
                             '(eg: http://host:port/wd/hub), '
                             'when using a remote Selenium RC'))
+    parser.add_option('--grid-capacity', dest='grid_capacity',
+                      default=None, type='string', action='callback',
+                      callback=set_grid_capacity,
+                      help=('maximum number of session requests in flight '
+                            'on a Selenium grid, "auto" asks the hub'))
     return parser
 
 
+def set_grid_capacity(option, opt_str, value, parser):
+    """Accept 'auto' or a positive integer for --grid-capacity."""
+    if value != 'auto':
+        try:
+            value = int(value)
+        except ValueError:
+            value = 0
+        if value < 1:
+            raise optparse.OptionValueError(
+                '%s must be "auto" or a positive integer' % (opt_str,))
+    setattr(parser.values, option.dest, value)
+
+
 def get_opts_run(args=None):
     return get_opts(get_run_options, args)
 
@@ -31,8 +31,13 @@ concurrency.
 Unix only.
 """
 
+import collections
+import errno
+import heapq
+import logging
 import os
 import sys
+import threading
 import traceback
 import unittest
 import itertools
@@ -40,28 +45,126 @@ import itertools
 import subunit
 from subunit import test_results
 import testtools
+from testtools import content
+
+
+logger = logging.getLogger('SST')
 
 
 class TestInOtherProcess(subunit.ProtocolTestCase):
     # Should be in subunit, I think. RBC.
-    def __init__(self, stream, pid):
+    def __init__(self, stream, pid, respawn=None, exited=None, abandon=None):
+        """Run the tests of a forked process.
+
+        :param stream: The stream where the process reports its test activity
+            with the subunit protocol.
+
+        :param pid: The process id.
+
+        :param respawn: An optional callable used when the process ends
+            abnormally. It is called with the number of tests the process
+            started and returns a new `TestInOtherProcess` running the tests
+            that were not started or None if there is nothing left to run.
+
+        :param exited: An optional callable called once the process has been
+            reaped, with the ids of the tests the process started.
+
+        :param abandon: An optional callable called when the process is not
+            replaced, with the ids of the tests the process started. It returns
+            the tests that will never be run, they are reported as errors.
+        """
         super(TestInOtherProcess, self).__init__(stream)
         self.pid = pid
+        self.respawn = respawn
+        self.exited = exited
+        self.abandon = abandon
 
     def run(self, result):
+        counter = StartedTestsCounter(result)
         try:
-            super(TestInOtherProcess, self).run(result)
+            super(TestInOtherProcess, self).run(counter)
         finally:
             pid, status = os.waitpid(self.pid, 0)
-        # GZ 2011-10-18: If status is nonzero, should report to the result
-        #                that something went wrong.
+        replacement = None
+        if status != 0:
+            # If a test was running, subunit already reported it as an error
+            # (lost connection during test). The tests that were not started
+            # yet are rescheduled on a new process.
+            logger.warning('Process %d %s after starting %d tests'
+                           % (pid, describe_exit_status(status),
+                              counter.started))
+            if self.respawn is not None and counter.started:
+                # If no test could be started, a new process is unlikely to
+                # do better, don't loop forever.
+                replacement = self.respawn(counter.started)
+        if self.exited is not None:
+            self.exited(counter.ids)
+        if replacement is not None:
+            replacement.run(result)
+        elif self.abandon is not None:
+            report_not_run(result, self.abandon(counter.ids),
+                           'Process %d %s before running this test'
+                           % (pid, describe_exit_status(status)))
+
+
+def report_not_run(result, tests, reason):
+    """Report tests that will never be run as errors.
+
+    :param result: The result to report to.
+
+    :param tests: The tests that were not run.
+
+    :param reason: Why they were not run.
+    """
+    for test in tests:
+        result.startTest(test)
+        result.addError(test, details={'reason': content.text_content(reason)})
+        result.stopTest(test)
+
 
+class StartedTestsCounter(test_results.TestResultDecorator):
+    """Count the tests started while forwarding to the decorated result."""
 
-def fork_for_tests(concurrency_num=1):
+    def __init__(self, decorated):
+        super(StartedTestsCounter, self).__init__(decorated)
+        self.started = 0
+        # The ids of the started tests
+        self.ids = []
+
+    def startTest(self, test):
+        self.started += 1
+        self.ids.append(test.id())
+        return super(StartedTestsCounter, self).startTest(test)
+
+
+def describe_exit_status(status):
+    """Describe a process exit status as returned by `os.waitpid`."""
+    if os.WIFSIGNALED(status):
+        return 'was killed by signal %d' % (os.WTERMSIG(status),)
+    return 'exited with status %d' % (os.WEXITSTATUS(status),)
+
+
+def fork_for_tests(concurrency_num=1, durations=None, scheduling='static',
+                   finish=None):
     """Implementation of `make_tests` used to construct `ConcurrentTestSuite`.
 
     :param concurrency_num: number of processes to use.
+
+    :param durations: An optional dict mapping test ids to their duration in
+        a previous run. When provided, tests are partitioned so that all
+        processes are expected to finish at the same time.
+
+    :param scheduling: How tests are assigned to processes. 'static' splits
+        the suite into one block per process before forking. 'dynamic' keeps
+        a queue of tests in the parent and each process pulls the next one as
+        soon as it is free.
+
+    :param finish: An optional callable called in each process once its
+        tests are run.
     """
+    if scheduling not in ('static', 'dynamic'):
+        raise ValueError('Unknown scheduling: %r' % (scheduling,))
+
     def do_fork(suite):
         """Take suite and start up multiple runners by forking (Unix only).
 
@@ -70,49 +173,282 @@ def fork_for_tests(concurrency_num=1):
         :return: An iterable of TestCase-like objects which can each have
         run(result) called on them to feed tests to result.
         """
+        if scheduling == 'dynamic':
+            return fork_dynamic(suite, concurrency_num, durations, finish)
         tests = []
-        test_blocks = partition_tests(suite, concurrency_num)
+        if durations:
+            test_blocks = partition_tests_by_duration(suite, concurrency_num,
+                                                      durations)
+        else:
+            test_blocks = partition_tests(suite, concurrency_num)
         # Clear the tests from the original suite so it doesn't keep them alive
         suite._tests[:] = []
         for process_tests in test_blocks:
-            process_suite = unittest.TestSuite(process_tests)
-            # Also clear each split list so new suite has only reference
-            process_tests[:] = []
-            c2pread, c2pwrite = os.pipe()
-            pid = os.fork()
-            if pid == 0:
-                try:
-                    stream = os.fdopen(c2pwrite, 'wb', 1)
-                    os.close(c2pread)
-                    # Leave stderr and stdout open so we can see test noise
-                    # Close stdin so that the child goes away if it decides to
-                    # read from stdin (otherwise its a roulette to see what
-                    # child actually gets keystrokes for pdb etc).
-                    sys.stdin.close()
-                    result = test_results.AutoTimingTestResultDecorator(
-                        subunit.TestProtocolClient(stream)
-                    )
-                    process_suite.run(result)
-                except:
-                    # Try and report traceback on stream, but exit with error
-                    # even if stream couldn't be created or something else
-                    # goes wrong.  The traceback is formatted to a string and
-                    # written in one go to avoid interleaving lines from
-                    # multiple failing children.
-                    try:
-                        stream.write(traceback.format_exc())
-                    finally:
-                        os._exit(1)
-                os._exit(0)
-            else:
-                os.close(c2pwrite)
-                stream = os.fdopen(c2pread, 'rb', 1)
-                test = TestInOtherProcess(stream, pid)
-                tests.append(test)
+            tests.append(fork_block(process_tests, finish))
         return tests
     return do_fork
 
 
+def fork_block(tests, finish=None):
+    """Fork a process running a block of tests in order.
+
+    If the process dies before completing the block, the tests it didn't start
+    are run by a new process. If it dies before starting any test, they are
+    reported as errors instead.
+
+    :param tests: The list of tests to run.
+
+    :param finish: See `fork_worker`.
+
+    :return: A `TestInOtherProcess` feeding the child activity to its result.
+    """
+    def respawn(started):
+        remaining = tests[started:]
+        if not remaining:
+            return None
+        logger.warning('Rescheduling %d tests' % (len(remaining),))
+        return fork_block(remaining, finish)
+
+    def abandon(started_ids):
+        return tests[len(started_ids):]
+
+    return fork_worker(unittest.TestSuite(tests).run, respawn, None, finish,
+                       abandon)
+
+
+def fork_worker(run, respawn=None, exited=None, finish=None, abandon=None):
+    """Fork a process reporting its test activity via subunit.
+
+    :param run: A callable taking a result as its sole parameter. It is called
+        in the child process to run the tests.
+
+    :param respawn: See `TestInOtherProcess`.
+
+    :param exited: See `TestInOtherProcess`.
+
+    :param finish: An optional callable called in the child process once
+        `run` returns.
+
+    :param abandon: See `TestInOtherProcess`.
+
+    :return: A `TestInOtherProcess` feeding the child activity to its result.
+    """
+    c2pread, c2pwrite = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            stream = os.fdopen(c2pwrite, 'wb', 1)
+            os.close(c2pread)
+            # Leave stderr and stdout open so we can see test noise
+            # Close stdin so that the child goes away if it decides to
+            # read from stdin (otherwise its a roulette to see what
+            # child actually gets keystrokes for pdb etc).
+            sys.stdin.close()
+            result = test_results.AutoTimingTestResultDecorator(
+                subunit.TestProtocolClient(stream)
+            )
+            try:
+                run(result)
+            finally:
+                if finish is not None:
+                    finish()
+        except:
+            # Try and report traceback on stream, but exit with error
+            # even if stream couldn't be created or something else
+            # goes wrong.  The traceback is formatted to a string and
+            # written in one go to avoid interleaving lines from
+            # multiple failing children.
+            try:
+                stream.write(traceback.format_exc())
+            finally:
+                os._exit(1)
+        os._exit(0)
+    else:
+        os.close(c2pwrite)
+        stream = os.fdopen(c2pread, 'rb', 1)
+        return TestInOtherProcess(stream, pid, respawn, exited, abandon)
+
+
+# Test indices are sent through the queue as fixed size records. Since a
+# record is smaller than PIPE_BUF, writes are atomic and concurrent readers
+# always get whole records.
+_QUEUE_RECORD = '%7d\n'
+_QUEUE_RECORD_SIZE = len(_QUEUE_RECORD % 0)
+
+
+def fork_dynamic(suite, count, durations=None, finish=None):
+    """Fork count processes pulling their tests from a shared queue.
+
+    :param suite: The test suite to run.
+
+    :param count: The number of processes.
+
+    :param durations: An optional dict mapping test ids to their duration in
+        a previous run. When provided, the longest tests are queued first so
+        the short ones fill the gaps at the end of the run.
+
+    :param finish: See `fork_worker`.
+
+    :return: A list of `TestInOtherProcess`, one per child.
+    """
+    tests = list(testtools.iterate_tests(suite))
+    # Clear the tests from the original suite so it doesn't keep them alive
+    suite._tests[:] = []
+    order = range(len(tests))
+    if durations:
+        estimated = estimate_durations([t.id() for t in tests], durations)
+        order.sort(key=lambda i: -estimated[tests[i].id()])
+    queue = TestQueue(tests, finish)
+    workers = [queue.fork_worker() for i in range(min(count, len(tests)))]
+    queue.feed(order)
+    return workers
+
+
+class TestQueue(object):
+    """A queue of tests shared by forked processes.
+
+    The queue is a pipe fed by the parent with the indices of the tests to
+    run. Each child holds a copy of the tests (inherited from the fork) and
+    reads the index of the next test to run as soon as it is done with the
+    previous one. No process stays idle while tests are left in the queue.
+
+    A process dying while running a test only loses that test, the others are
+    still in the queue. A new process is forked to replace it. The tests that
+    no process started, once they are all gone, are reported as errors.
+    """
+
+    def __init__(self, tests, finish=None):
+        self.tests = tests
+        self.finish = finish
+        self.read_fd, self.write_fd = os.pipe()
+        # The number of processes still reading from the queue
+        self.workers = 0
+        self.lock = threading.Lock()
+        # The ids of the tests started by the processes that exited
+        self.started_ids = []
+        # The tests left behind by the last process
+        self.not_run = []
+
+    def fork_worker(self):
+        # The lock guarantees the child sees write_fd in a consistent state
+        with self.lock:
+            self.workers += 1
+            return fork_worker(self.run_from_queue, self.respawn,
+                               self.exited, self.finish, self.abandon)
+
+    def run_from_queue(self, result):
+        # The parent is the only writer, keeping the write end open here
+        # would prevent the queue from ever being seen as exhausted.
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+        QueuedTestSuite(self.tests, self.read_fd).run(result)
+
+    def respawn(self, started):
+        # If the queue is exhausted, the new process will exit immediately
+        return self.fork_worker()
+
+    def exited(self, started_ids):
+        with self.lock:
+            self.workers -= 1
+            self.started_ids.extend(started_ids)
+            if not self.workers:
+                # Nobody is left to read, let the feeder know
+                os.close(self.read_fd)
+                self.not_run = self._find_not_run()
+
+    def _find_not_run(self):
+        started = collections.Counter(self.started_ids)
+        not_run = []
+        for test in self.tests:
+            if started[test.id()]:
+                started[test.id()] -= 1
+            else:
+                not_run.append(test)
+        return not_run
+
+    def abandon(self, started_ids):
+        # Only the last process finds tests left behind
+        with self.lock:
+            not_run, self.not_run = self.not_run, []
+        return not_run
+
+    def feed(self, indices):
+        """Start feeding the queue with test indices.
+
+        The queue is fed from a thread as it may not fit in the pipe buffer.
+
+        :param indices: The test indices in the order they should be run.
+        """
+        feeder = threading.Thread(target=self._feed, args=(indices,))
+        feeder.daemon = True
+        feeder.start()
+
+    def _feed(self, indices):
+        try:
+            feed_queue(self.write_fd, indices)
+        finally:
+            with self.lock:
+                os.close(self.write_fd)
+                self.write_fd = None
+
+
+class QueuedTestSuite(unittest.TestSuite):
+    """A suite running the tests read from a queue.
+
+    Running the tests through `unittest.TestSuite` sets up and tears down
+    their class and module fixtures as the tests pulled from the queue move
+    from a class or module to another, and once the queue is exhausted.
+    """
+
+    def __init__(self, tests, fd):
+        """Create a suite.
+
+        :param tests: The list of tests the queue indices refer to.
+
+        :param fd: The read end of the queue pipe.
+        """
+        super(QueuedTestSuite, self).__init__()
+        self.queued = tests
+        self.fd = fd
+
+    def __iter__(self):
+        for index in read_queue(self.fd):
+            yield self.queued[index]
+
+
+def feed_queue(fd, indices):
+    """Write test indices to the queue.
+
+    :param fd: The write end of the queue pipe.
+
+    :param indices: The test indices in the order they should be run.
+    """
+    try:
+        for index in indices:
+            os.write(fd, _QUEUE_RECORD % (index,))
+    except OSError as e:
+        # All the readers are gone, nobody is left to run the tests
+        if e.errno != errno.EPIPE:
+            raise
+
+
+def read_queue(fd):
+    """Yield the test indices read from the queue until it is exhausted.
+
+    :param fd: The read end of the queue pipe.
+    """
+    while True:
+        try:
+            record = os.read(fd, _QUEUE_RECORD_SIZE)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        if not record:
+            return
+        yield int(record)
+
+
 def partition_tests(suite, count):
     """Partition suite into count lists of tests."""
     # This just assigns tests in a round-robin fashion.  On one hand this
@@ -125,3 +461,116 @@ def partition_tests(suite, count):
     for partition, test in zip(itertools.cycle(partitions), tests):
         partition.append(test)
     return partitions
+
+
+def partition_tests_by_duration(suite, count, durations):
+    """Partition suite into count lists of tests with balanced durations.
+
+    The tests are assigned longest first to the partition with the smallest
+    total so far (longest processing time first). Durations for tests not
+    mentioned in 'durations' are estimated with `estimate_durations`.
+
+    Inside a partition, tests keep their relative order in the suite.
+
+    :param suite: The test suite to partition.
+
+    :param count: The number of partitions.
+
+    :param durations: A dict mapping test ids to their duration in seconds.
+    """
+    tests = list(testtools.iterate_tests(suite))
+    estimated = estimate_durations([t.id() for t in tests], durations)
+    # Longest first, ties are broken by the order in the suite.
+    order = sorted(range(len(tests)),
+                   key=lambda i: (-estimated[tests[i].id()], i))
+    # A heap of (total duration, partition index) so the least loaded
+    # partition is always at the top
+    loads = [(0.0, p) for p in range(count)]
+    assigned = [list() for i in range(count)]
+    for i in order:
+        total, p = heapq.heappop(loads)
+        assigned[p].append(i)
+        heapq.heappush(loads, (total + estimated[tests[i].id()], p))
+    return [[tests[i] for i in sorted(indices)] for indices in assigned]
+
+
+def estimate_durations(test_ids, durations):
+    """Estimate the duration of each test from a previous run.
+
+    Known tests use their recorded duration. Unknown tests use the mean
+    duration of their closest known siblings, i.e. the known tests sharing
+    the longest id prefix (same class, same module, same package, ...). When
+    no sibling is known, the mean duration of all known tests is used.
+
+    :param test_ids: The ids of the tests to estimate.
+
+    :param durations: A dict mapping test ids to their duration in seconds.
+
+    :return: A dict mapping each of 'test_ids' to its estimated duration.
+    """
+    # Accumulate (total, count) for each id prefix of the known tests
+    prefixes = {}
+    for test_id, duration in durations.items():
+        parts = test_id.split('.')
+        for n in range(len(parts)):
+            prefix = '.'.join(parts[:n])
+            total, known = prefixes.get(prefix, (0.0, 0))
+            prefixes[prefix] = (total + duration, known + 1)
+    estimated = {}
+    for test_id in test_ids:
+        if test_id in durations:
+            estimated[test_id] = durations[test_id]
+            continue
+        parts = test_id.split('.')
+        # Unknown tests default to zero when there is no history at all
+        estimated[test_id] = 0.0
+        for n in range(len(parts) - 1, -1, -1):
+            prefix = '.'.join(parts[:n])
+            if prefix in prefixes:
+                total, known = prefixes[prefix]
+                estimated[test_id] = total / known
+                break
+    return estimated
+
+
+def load_durations(path):
+    """Load test durations recorded by `save_durations`.
+
+    :param path: The file the durations are stored in.
+
+    :return: A dict mapping test ids to their duration in seconds. The dict is
+        empty if the file doesn't exist.
+    """
+    durations = {}
+    try:
+        f = open(path)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return durations
+    with f:
+        for line in f:
+            try:
+                test_id, duration = line.rsplit(None, 1)
+                durations[test_id] = float(duration)
+            except ValueError:
+                # Ignore corrupted lines, they will be fixed by the next save
+                continue
+    return durations
+
+
+def save_durations(path, durations):
+    """Save test durations so they can be used by a later run.
+
+    The file is written atomically so concurrent runs sharing the same file
+    can't corrupt it.
+
+    :param path: The file the durations are stored in.
+
+    :param durations: A dict mapping test ids to their duration in seconds.
+    """
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'w') as f:
+        for test_id in sorted(durations):
+            f.write('%s %.3f\n' % (test_id, durations[test_id]))
+    os.rename(temp_path, path)
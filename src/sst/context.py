@@ -17,11 +17,116 @@
 #   limitations under the License.
 #
 
+import errno
+import hashlib
+import imp
+import logging
+import marshal
 import os
+import tempfile
 
 from sst import actions, config
 from collections import namedtuple
 
+logger = logging.getLogger('SST')
+
+
+class ScriptCache(object):
+    """Compile each script once per process, and optionally once per run.
+
+    The code objects are kept in memory, keyed by the script path and
+    compilation flags, and recompiled when the modification time or size of
+    the script changes. With a `directory`, they are also marshalled there so
+    concurrent processes and later runs don't compile them again.
+    """
+
+    def __init__(self, directory=None):
+        """Create a cache.
+
+        :param directory: The directory where the compiled scripts are saved,
+            None to keep them in memory only.
+        """
+        self.directory = directory
+        self.scripts = {}
+
+    def get(self, path, flags=0):
+        """Get the code of a script.
+
+        :param path: The path of the script.
+
+        :param flags: The `__future__` flags to compile the script with.
+
+        :return: The code object.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = (st.st_mtime, st.st_size)
+        key = (path, flags)
+        cached = self.scripts.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        code = None
+        if self.directory is not None:
+            code = self._load(key, stamp)
+        if code is None:
+            code = self._compile(path, flags)
+            if self.directory is not None:
+                self._save(key, stamp, code)
+        self.scripts[key] = (stamp, code)
+        return code
+
+    def clear(self):
+        """Forget the scripts kept in memory."""
+        self.scripts.clear()
+
+    def _compile(self, path, flags):
+        with open(path) as f:
+            source = f.read() + '\n'
+        return compile(source, path, 'exec', flags, True)
+
+    def _cache_path(self, key):
+        name = hashlib.sha1(repr(key)).hexdigest()
+        return os.path.join(self.directory, name + '.sstc')
+
+    def _load(self, key, stamp):
+        try:
+            with open(self._cache_path(key), 'rb') as f:
+                if f.read(len(imp.get_magic())) != imp.get_magic():
+                    # Compiled by another python version
+                    return None
+                cached_key, cached_stamp, code = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if (cached_key, cached_stamp) != (key, stamp):
+            return None
+        return code
+
+    def _save(self, key, stamp, code):
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Other processes only see complete files
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(imp.get_magic())
+                marshal.dump((key, stamp, code), f)
+            os.rename(temp_path, self._cache_path(key))
+        except (IOError, OSError) as e:
+            logger.debug('Cannot save compiled script: %s' % (e,))
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+# Shared by the script test cases and `run_test`
+script_cache = ScriptCache()
+
+
 StoredContext = namedtuple(
     'StoredContext',
     'context base_url timeout poll args'
@@ -90,7 +195,6 @@ def _execute_test(name, kwargs):
     context = {}
     populate_context(context, location, config.browser_type, kwargs)
 
-    with open(location) as h:
-        exec(h.read(), context)
+    exec(script_cache.get(location), context)
 
     return context.get('RESULT')
@@ -112,8 +112,9 @@ class TestLoader(unittest.TestLoader):
         if package is None:
             if os.path.isfile(os.path.join(dir_path, '__init__.py')):
                 package = self.importFromPath(dir_path)
-                names.remove('__init__.py')
         if package is not None:
+            if '__init__.py' in names:
+                names.remove('__init__.py')
             # Can we delegate to the package ?
             discover = getattr(package, 'discover', None)
             if discover is not None:
@@ -181,6 +182,9 @@ class SSTestLoader(TestLoader):
     directories containing them to be packages. Although as soon a test suite
     becomes complex enough to be organized as a tree, it generally requires the
     packages to be importable.
+
+    The scripts in a package defining a ``browser_scope`` attribute share
+    their browser as defined by `cases.SSTTestCase.browser_scope`.
     """
 
     file_matcher = NameMatcher(includes=[r'.*\.py$'], excludes=[r'^_'])
@@ -188,13 +192,35 @@ class SSTestLoader(TestLoader):
 
     def __init__(self, results_directory=None, browser_factory=None,
                  screenshots_on=False, debug_post_mortem=False,
-                 extended_report=False):
+                 extended_report=False, browser_scope=None,
+                 lazy_browser=False, xvfb_pool=None, test_timeout=None):
         super(SSTestLoader, self).__init__()
         self.results_directory = results_directory
         self.browser_factory = browser_factory
         self.screenshots_on = screenshots_on
         self.debug_post_mortem = debug_post_mortem
         self.extended_report = extended_report
+        self.browser_scope = browser_scope
+        self.lazy_browser = lazy_browser
+        self.xvfb_pool = xvfb_pool
+        self.test_timeout = test_timeout
+
+    def discoverTestsFromTree(self, dir_path, package=None):
+        if package is None:
+            if os.path.isfile(os.path.join(dir_path, '__init__.py')):
+                package = self.importFromPath(dir_path)
+        browser_scope = getattr(package, 'browser_scope', None)
+        if browser_scope is None:
+            return super(SSTestLoader, self).discoverTestsFromTree(dir_path,
+                                                                   package)
+        orig = self.browser_scope
+        try:
+            # The scripts in this subtree use the package scope
+            self.browser_scope = browser_scope
+            return super(SSTestLoader, self).discoverTestsFromTree(dir_path,
+                                                                   package)
+        finally:
+            self.browser_scope = orig
 
     def discoverTestsFromFile(self, path):
         return self.loadTestsFromScript(path)
@@ -228,6 +254,14 @@ class SSTestLoader(TestLoader):
         test.screenshots_on = self.screenshots_on
         test.debug_post_mortem = self.debug_post_mortem
         test.extended_report = self.extended_report
+        if self.browser_scope is not None:
+            test.browser_scope = self.browser_scope
+        test.lazy_browser = self.lazy_browser
+        if self.test_timeout is not None:
+            test.test_timeout = self.test_timeout
+        if self.xvfb_pool is not None:
+            test.xserver_headless = True
+            test.xvfb_pool = self.xvfb_pool
 
         return test
 
@@ -0,0 +1,66 @@
+#
+#   Copyright (c) 2011-2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import errno
+import fcntl
+import os
+import tempfile
+
+
+def lock_dir_for(name):
+    """Create a directory for lock files shared by all processes.
+
+    :param name: The directory base name in the temp directory.
+
+    :return: The directory path.
+    """
+    path = os.path.join(tempfile.gettempdir(), name)
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    return path
+
+
+def lock_file(path):
+    """Try to lock a file without waiting.
+
+    The lock is held until `unlock_file` is called or the process exits.
+
+    :param path: The file to lock, created if needed.
+
+    :return: A file descriptor holding the lock or None if the file is already
+        locked (by any process).
+    """
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except IOError as e:
+        os.close(fd)
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return None
+
+
+def unlock_file(fd):
+    """Release a lock acquired with `lock_file`."""
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
@@ -26,6 +26,8 @@ class TextTestResult(testresult.TextTestResult):
     def __init__(self, stream, failfast=False, verbosity=1):
         super(TextTestResult, self).__init__(stream, failfast)
         self.verbose = verbosity > 1
+        # Test ids mapped to how long they took to run (in seconds)
+        self.durations = {}
 
     def startTest(self, test):
         if self.verbose:
@@ -35,10 +37,10 @@ class TextTestResult(testresult.TextTestResult):
         super(TextTestResult, self).startTest(test)
 
     def stopTest(self, test):
+        elapsed = self._delta_to_float(self._now() - self.start_time)
+        self.durations[test.id()] = elapsed
         if self.verbose:
-            elapsed_time = self._now() - self.start_time
-            self.stream.write(' (%.3f secs)\n'
-                              % self._delta_to_float(elapsed_time))
+            self.stream.write(' (%.3f secs)\n' % elapsed)
             self.stream.flush()
         super(TextTestResult, self).stopTest(test)
 
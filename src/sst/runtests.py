@@ -29,6 +29,7 @@ from sst import (
     cases,
     concurrency,
     config,
+    context,
     filters,
     loaders,
     results,
@@ -61,12 +62,20 @@ def runtests(test_regexps, results_directory, out,
              shared_directory=None,
              screenshots_on=False,
              concurrency_num=1,
+             scheduling='static',
              failfast=False,
              debug=False,
              extended=False,
              includes=None,
              excludes=None,
-             xml_results_filename='results.xml'):
+             xml_results_filename='results.xml',
+             durations_file=None,
+             prewarm=False,
+             browser_scope=None,
+             lazy_browser=False,
+             xvfb_pool=None,
+             test_timeout=None,
+             script_cache_dir=None):
     if not os.path.isdir(test_dir):
         raise RuntimeError('Specified directory %r does not exist'
                            % (test_dir,))
@@ -76,10 +85,22 @@ def runtests(test_regexps, results_directory, out,
     config.shared_directory = shared_directory
     if shared_directory is not None:
         sys.path.append(shared_directory)
+    if script_cache_dir is not None:
+        context.script_cache.directory = script_cache_dir
+    if prewarm and browser_factory is not None:
+        browser_factory = browsers.PrewarmingBrowserFactory(browser_factory)
+
+    def finish():
+        # Quit the browsers kept for tests that will never run and release
+        # the resources used by the factory
+        cases.shared_browser.quit()
+        if browser_factory is not None:
+            browser_factory.cleanup()
 
     loader = loaders.SSTestLoader(results_directory,
                                   browser_factory, screenshots_on,
-                                  debug, extended)
+                                  debug, extended, browser_scope,
+                                  lazy_browser, xvfb_pool, test_timeout)
     alltests = loader.suiteClass()
     alltests.addTests(loader.discoverTestsFromTree(test_dir))
     alltests = filters.include_regexps(test_regexps, alltests)
@@ -105,19 +126,32 @@ def runtests(test_regexps, results_directory, out,
     else:
         result = txt_res
 
+    durations = None
+    if durations_file is not None:
+        durations = concurrency.load_durations(durations_file)
+
     if concurrency_num == 1:
         suite = alltests
     else:
         suite = testtools.ConcurrentTestSuite(
-            alltests, concurrency.fork_for_tests(concurrency_num))
+            alltests,
+            concurrency.fork_for_tests(concurrency_num, durations, scheduling,
+                                       finish))
 
     result.startTestRun()
     try:
         suite.run(result)
     except KeyboardInterrupt:
         out.write('Test run interrupted\n')
+    finally:
+        finish()
     result.stopTestRun()
 
+    if durations_file is not None:
+        # Tests that didn't run this time keep their previous duration
+        durations.update(txt_res.durations)
+        concurrency.save_durations(durations_file, durations)
+
     return len(result.failures) + len(result.errors)
 
 
@@ -18,6 +18,7 @@
 #   limitations under the License.
 #
 
+import logging
 import os
 import sys
 
@@ -32,6 +33,9 @@ from sst import (
 )
 
 
+logger = logging.getLogger('SST')
+
+
 def main():
     cmd_opts, args = command.get_opts_remote()
 
@@ -39,6 +43,8 @@ def main():
     command.reset_directory(results_directory,
                             cmd_opts.skip_clean_results)
 
+    scheduler = get_session_scheduler(cmd_opts.webdriver_remote_url,
+                                      cmd_opts.grid_capacity)
     browser_factory = browsers.RemoteBrowserFactory(
         cmd_opts.webdriver_remote_url,
         {
@@ -47,6 +53,7 @@ def main():
             "version": cmd_opts.browser_version,
             "name": cmd_opts.session_name
         },
+        scheduler,
     )
     runtests.runtests(
         args, results_directory, sys.stdout,
@@ -56,14 +63,45 @@ def main():
         browser_factory=browser_factory,
         shared_directory=cmd_opts.shared_directory,
         screenshots_on=cmd_opts.screenshots_on,
+        concurrency_num=cmd_opts.concurrency,
+        scheduling=cmd_opts.scheduling,
         failfast=cmd_opts.failfast,
         debug=cmd_opts.debug,
         extended=cmd_opts.extended_tracebacks,
         # FIXME: not tested -- vila 2013-05-23
         excludes=cmd_opts.excludes,
-        xml_results_filename=cmd_opts.xml_results_filename
+        xml_results_filename=cmd_opts.xml_results_filename,
+        durations_file=cmd_opts.durations_file,
+        prewarm=cmd_opts.prewarm,
+        browser_scope=cmd_opts.browser_scope,
+        lazy_browser=cmd_opts.lazy_browser,
+        test_timeout=cmd_opts.test_timeout,
+        script_cache_dir=cmd_opts.script_cache_dir
     )
 
 
+def get_session_scheduler(remote_url, grid_capacity):
+    """Build the session scheduler required by the command line options.
+
+    :param remote_url: The url of the WebDriver endpoint.
+
+    :param grid_capacity: None to disable the scheduler, 'auto' to ask the hub
+        for its capacity or the capacity itself (validated by the option
+        parsing).
+    """
+    if grid_capacity is None:
+        return None
+    if grid_capacity == 'auto':
+        capacity = browsers.probe_grid_capacity(remote_url)
+        if not capacity:
+            logger.warning('Cannot get the grid capacity from %s, '
+                           'session requests are not limited.'
+                           % (remote_url,))
+            return None
+    else:
+        capacity = grid_capacity
+    return browsers.SessionScheduler(remote_url, capacity)
+
+
 if __name__ == '__main__':
     main()
@@ -38,12 +38,14 @@ def main():
     out = sys.stdout
     cleaner = command.Cleaner(out)
 
+    xvfb_pool = None
     if cmd_opts.xserver_headless:
-        from sst.xvfbdisplay import Xvfb
+        from sst.xvfbdisplay import XvfbPool
         out.write('starting virtual display...')
-        display = Xvfb(width=1024, height=768)
-        display.start()
-        cleaner.add('stopping virtual display...\n', display.stop)
+        # One display per concurrent process
+        xvfb_pool = XvfbPool(max(1, cmd_opts.concurrency))
+        xvfb_pool.start()
+        cleaner.add('stopping virtual display...\n', xvfb_pool.stop)
 
     with cleaner:
         results_directory = os.path.abspath('results')
@@ -59,11 +61,19 @@ def main():
             shared_directory=cmd_opts.shared_directory,
             screenshots_on=cmd_opts.screenshots_on,
             concurrency_num=cmd_opts.concurrency,
+            scheduling=cmd_opts.scheduling,
             failfast=cmd_opts.failfast,
             debug=cmd_opts.debug,
             extended=cmd_opts.extended_tracebacks,
             excludes=cmd_opts.excludes,
-            xml_results_filename=cmd_opts.xml_results_filename
+            xml_results_filename=cmd_opts.xml_results_filename,
+            durations_file=cmd_opts.durations_file,
+            prewarm=cmd_opts.prewarm,
+            browser_scope=cmd_opts.browser_scope,
+            lazy_browser=cmd_opts.lazy_browser,
+            xvfb_pool=xvfb_pool,
+            test_timeout=cmd_opts.test_timeout,
+            script_cache_dir=cmd_opts.script_cache_dir
         )
 
     return failures
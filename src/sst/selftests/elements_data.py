@@ -0,0 +1,24 @@
+import sst
+import sst.actions
+
+
+sst.actions.set_base_url('http://localhost:%s/' % sst.DEVSERVER_PORT)
+sst.actions.go_to('/')
+
+options = sst.actions.get_elements_data(
+    '#select_with_id_1 option', ['text', 'value', 'tag'])
+sst.actions.assert_equal(
+    [{'text': 'Select One', 'value': 'select_1', 'tag': 'option'},
+     {'text': 'Select Two', 'value': 'select_2', 'tag': 'option'},
+     {'text': 'Select Three', 'value': 'select_3', 'tag': 'option'}],
+    options)
+
+radios = sst.actions.get_elements_data(
+    'input[name=radio_with_id]', ['id'], keep_elements=True)
+sst.actions.assert_equal(
+    ['radio_with_id_1', 'radio_with_id_2', 'radio_with_id_3'],
+    [radio['id'] for radio in radios])
+sst.actions.set_radio_value(radios[1]['element'])
+sst.actions.assert_radio_value('radio_with_id_2', True)
+
+sst.actions.assert_equal([], sst.actions.get_elements_data('#foobar'))
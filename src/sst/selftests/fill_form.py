@@ -0,0 +1,33 @@
+import sst
+import sst.actions
+
+
+sst.actions.set_base_url('http://localhost:%s/' % sst.DEVSERVER_PORT)
+sst.actions.go_to('/')
+
+sst.actions.fill_form([
+    ('text_1', 'Filled'),
+    ('select_with_id_1', 'Select Two'),
+    ('id_sreg_country', True),
+    ('radio_with_id_2', True),
+])
+sst.actions.assert_text('text_1', 'Filled')
+sst.actions.assert_dropdown_value('select_with_id_1', 'Select Two')
+sst.actions.assert_checkbox_value('id_sreg_country', True)
+sst.actions.assert_radio_value('radio_with_id_2', True)
+
+# Options can be selected by value, the text is replaced
+sst.actions.fill_form({'select_with_id_1': 'select_3', 'text_1': 'Again',
+                       'id_sreg_country': False})
+sst.actions.assert_dropdown_value('select_with_id_1', 'Select Three')
+sst.actions.assert_text('text_1', 'Again')
+sst.actions.assert_checkbox_value('id_sreg_country', False)
+
+# fails for non existent element
+sst.actions.fails(sst.actions.fill_form, {'foobar': 'Text'})
+# fails for an unknown option
+sst.actions.fails(sst.actions.fill_form, {'select_with_id_1': 'Fake Text'})
+# fails for an element that isn't a field, without changing the others
+sst.actions.fails(sst.actions.fill_form,
+                  [('text_1', 'Not written'), ('label1', 'Text')])
+sst.actions.assert_text('text_1', 'Again')
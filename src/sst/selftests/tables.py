@@ -49,3 +49,11 @@ sst.actions.fails(
 sst.actions.fails(
     sst.actions.assert_table_row_contains_text, 'one-row', 0,
     ['Cell 0', 'Cell 1', 'Cell 2'], regex=True)
+
+headers, rows = sst.actions.get_table_data('one-row')
+sst.actions.assert_equal([], headers)
+sst.actions.assert_equal([['Cell 0', 'Cell 1', 'Cell 2', 'Cell 3']], rows)
+headers, rows = sst.actions.get_table_data('empty')
+sst.actions.assert_equal(['Head 0', 'Head 1', 'Head 2', 'Head 3'], headers)
+sst.actions.assert_equal([], rows)
+sst.actions.fails(sst.actions.get_table_data, 'notthere')
@@ -26,6 +26,7 @@ import testtools
 import time
 
 from selenium.common import exceptions
+from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.remote import webelement
 from sst import actions
 
@@ -143,9 +144,759 @@ class TestElementToString(testtools.TestCase):
             actions._element_to_string(element), '<p></p>')
 
 
+class TestLazyElementString(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLazyElementString, self).setUp()
+        self.patch(actions, '_test', mock.Mock(browser=mock.Mock()))
+        self.element = mock.Mock(spec=webelement.WebElement)
+        self.element.get_attribute.return_value = 'Test id'
+        self.logger = logging.getLogger('SST')
+        self.addCleanup(self.logger.setLevel, self.logger.level)
+
+    def test_element_is_not_described_without_debug_logging(self):
+        self.logger.setLevel(logging.INFO)
+        actions.click_element(self.element, wait=False)
+        self.element.click.assert_called_once_with()
+        self.assertFalse(self.element.get_attribute.called)
+
+    def test_element_is_described_when_logged(self):
+        stream = StringIO()
+        handler = logging.StreamHandler(stream)
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        self.logger.setLevel(logging.DEBUG)
+        actions.click_element(self.element, wait=False)
+        self.assertIn("Clicking element 'Test id'", stream.getvalue())
+
+    def test_unavailable_element_falls_back_to_its_repr(self):
+        self.element.get_attribute.side_effect = (
+            exceptions.StaleElementReferenceException())
+        self.assertEqual(repr(self.element),
+                         repr(actions._ElementString(self.element)))
+
+
 class TestBaseUrl(testtools.TestCase):
 
     def test_go_to(self):
         e = self.assertRaises(AssertionError, actions.go_to, '/')
         self.assertEqual('BASE_URL is not set, did you call set_base_url ?',
                          e.message)
+
+
+class TestElementCache(testtools.TestCase):
+
+    def setUp(self):
+        super(TestElementCache, self).setUp()
+        self.browser = mock.Mock()
+        self.browser.find_element_by_id.side_effect = self.find_element
+        self.browser.execute.return_value = {'value': None}
+        test = mock.Mock(browser=self.browser)
+        self.patch(actions, '_test', test)
+        self.addCleanup(actions._set_element_cache, False)
+        actions.set_element_cache()
+
+    def find_element(self, identifier):
+        return webelement.WebElement(self.browser, identifier)
+
+    def test_disabled_cache_looks_for_elements_every_time(self):
+        actions.set_element_cache(False)
+        first = actions._get_elem('test')
+        self.assertIsNot(first, actions._get_elem('test'))
+        self.assertEqual(2, self.browser.find_element_by_id.call_count)
+
+    def test_element_reused(self):
+        first = actions._get_elem('test')
+        self.browser.reset_mock()
+        self.assertIs(first, actions._get_elem('test'))
+        # A cached element costs no call to the browser
+        self.assertEqual([], self.browser.mock_calls)
+
+    def test_new_document_gets_new_elements(self):
+        first = actions._get_elem('test')
+        # The page loaded another document without any action
+        self.browser.execute.side_effect = [
+            exceptions.StaleElementReferenceException(), {'value': 'a'}]
+        self.browser.find_element_by_id.side_effect = (
+            lambda identifier: webelement.WebElement(self.browser, 'new'))
+        elem = actions._get_elem('test')
+        self.assertIs(first, elem)
+        self.assertEqual('a', elem.get_attribute('name'))
+        self.assertEqual('new', elem.id)
+
+    def test_go_to_forgets_elements(self):
+        first = actions._get_elem('test')
+        actions.go_to('http://localhost/', wait=False)
+        self.assertIsNot(first, actions._get_elem('test'))
+
+    def test_click_with_wait_forgets_elements(self):
+        first = actions._get_elem('test')
+        actions.click_element(first, wait=actions.PageReadiness())
+        self.assertIsNot(first, actions._get_elem('test'))
+
+    def test_click_without_wait_keeps_elements(self):
+        first = actions._get_elem('test')
+        actions.click_element(first, wait=False)
+        self.assertIs(first, actions._get_elem('test'))
+
+    def test_elements_keyed_by_frame(self):
+        first = actions._get_elem('test')
+        actions.switch_to_frame('frame')
+        in_frame = actions._get_elem('test')
+        self.assertIsNot(first, in_frame)
+        actions.switch_to_frame()
+        self.assertIs(first, actions._get_elem('test'))
+
+    def test_stale_element_forgets_elements(self):
+        first = actions._get_elem('test')
+        self.browser.execute.side_effect = (
+            exceptions.StaleElementReferenceException())
+        self.assertRaises(exceptions.StaleElementReferenceException,
+                          getattr, first, 'text')
+        self.assertIsNot(first, actions._get_elem('test'))
+
+
+class TestSelfHealingElements(testtools.TestCase):
+
+    def setUp(self):
+        super(TestSelfHealingElements, self).setUp()
+        self.browser = mock.Mock()
+        self.browser.find_element_by_id.side_effect = self.find_element
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.stale_ids = set()
+        self.browser.execute.side_effect = self.execute
+        self.found = 0
+
+    def find_element(self, identifier):
+        self.found += 1
+        return webelement.WebElement(self.browser,
+                                     '%s-%d' % (identifier, self.found))
+
+    def execute(self, command, params):
+        if params['id'] in self.stale_ids:
+            raise exceptions.StaleElementReferenceException()
+        return {'value': params['id']}
+
+    def test_stale_element_located_again(self):
+        elem = actions._get_elem('test')
+        self.stale_ids.add('test-1')
+        self.assertEqual('test-2', elem.get_attribute('name'))
+        self.assertEqual('test-2', elem.id)
+
+    def test_element_located_again_only_once(self):
+        elem = actions._get_elem('test')
+        self.stale_ids.update(['test-1', 'test-2'])
+        self.assertRaises(exceptions.StaleElementReferenceException,
+                          elem.get_attribute, 'name')
+        self.assertEqual(2, self.browser.find_element_by_id.call_count)
+
+    def test_missing_element_keeps_stale_error(self):
+        elem = actions._get_elem('test')
+        self.stale_ids.add('test-1')
+        self.browser.find_element_by_id.side_effect = (
+            exceptions.NoSuchElementException())
+        self.assertRaises(exceptions.StaleElementReferenceException,
+                          elem.get_attribute, 'name')
+
+    def test_element_by_css_located_again(self):
+        self.browser.find_elements_by_css_selector.side_effect = [
+            [webelement.WebElement(self.browser, 'first')],
+            [webelement.WebElement(self.browser, 'second')]]
+        elem = actions.get_element_by_css('#test')
+        self.stale_ids.add('first')
+        self.assertEqual('second', elem.get_attribute('name'))
+
+
+class TestGetElementsByText(testtools.TestCase):
+
+    def setUp(self):
+        super(TestGetElementsByText, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.texts = []
+        self.elems = [self.make_element(text) for text in
+                      ('Previous', 'Next', 'Next page')]
+        self.browser.find_elements_by_css_selector.return_value = self.elems
+
+    def make_element(self, text):
+        element = mock.Mock(spec=webelement.WebElement)
+        text = mock.PropertyMock(return_value=text)
+        type(element).text = text
+        self.texts.append(text)
+        return element
+
+    def assertTextRead(self, expected):
+        self.assertEqual(expected, [text.called for text in self.texts])
+
+    def test_text_filtered_by_the_browser(self):
+        self.browser.execute_script.return_value = [
+            u'Previous', u'  Next\n', u'Next\xa0page']
+        self.assertEqual([self.elems[1]],
+                         actions.get_elements(tag='a', text='Next'))
+        self.assertTextRead([False, True, False])
+
+    def test_regex_filtered_by_the_browser(self):
+        self.browser.execute_script.return_value = [
+            u'Previous', u'Next', u'Next page']
+        self.assertEqual(self.elems[1:],
+                         actions.get_elements(tag='a', text_regex='^Next'))
+        self.assertTextRead([False, True, True])
+
+    def test_text_checked_with_webdriver(self):
+        # The browser says the hidden element has the text, WebDriver doesn't.
+        self.browser.execute_script.return_value = [
+            u'Previous', u'Next', u'Next page']
+        self.texts[1].return_value = ''
+        self.assertRaises(AssertionError,
+                          actions.get_element, tag='a', text='Next')
+
+    def test_text_content_filtered_by_the_browser(self):
+        # The text content of the browsers without innerText
+        self.browser.execute_script.return_value = [
+            u'Previous', u' Next ', u' Next page ']
+        self.assertEqual([self.elems[1]],
+                         actions.get_elements(tag='a', text='Next'))
+        self.assertTextRead([False, True, False])
+
+    def test_fallback_without_script_support(self):
+        self.browser.execute_script.side_effect = (
+            exceptions.WebDriverException())
+        self.assertEqual([self.elems[1]],
+                         actions.get_elements(tag='a', text='Next'))
+        self.assertTextRead([True, True, True])
+
+
+class TestTableData(testtools.TestCase):
+
+    def setUp(self):
+        super(TestTableData, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.table = mock.Mock(spec=webelement.WebElement)
+        self.browser.find_element_by_id.return_value = self.table
+        self.browser.execute_script.return_value = {
+            'tag': 'table',
+            'headers': [u'Name\n', u'Value'],
+            'rows': [[u'first', u' 1 '], [u'second', u'2']]}
+
+    def test_get_table_data(self):
+        self.assertEqual(
+            ([u'Name', u'Value'], [[u'first', u'1'], [u'second', u'2']]),
+            actions.get_table_data('table'))
+        self.assertEqual(1, self.browser.execute_script.call_count)
+        self.assertFalse(self.table.find_elements_by_tag_name.called)
+
+    def test_get_table_data_without_tbody(self):
+        self.browser.execute_script.return_value['rows'] = None
+        self.assertEqual(([u'Name', u'Value'], []),
+                         actions.get_table_data('table'))
+
+    def test_not_a_table(self):
+        self.browser.execute_script.return_value['tag'] = 'div'
+        e = self.assertRaises(AssertionError,
+                              actions.get_table_data, 'table')
+        self.assertEqual("Element 'table' is not a table.", str(e))
+
+    def test_assertions_without_tbody(self):
+        self.browser.execute_script.return_value['rows'] = None
+        actions.assert_table_headers('table', [u'Name', u'Value'])
+        e = self.assertRaises(AssertionError,
+                              actions.assert_table_has_rows, 'table', 0)
+        self.assertEqual("Table 'table' has no tbody.", str(e))
+
+    def test_assert_table_row_contains_text(self):
+        actions.assert_table_has_rows('table', 2)
+        actions.assert_table_row_contains_text('table', 1, [u'second', u'2'])
+        actions.assert_table_row_contains_text(
+            'table', 0, [u'^f', u'\\d'], regex=True)
+        self.assertRaises(AssertionError,
+                          actions.assert_table_row_contains_text,
+                          'table', 2, [u'third', u'3'])
+
+    def make_webdriver_table(self):
+        self.table.tag_name = 'table'
+
+        def make_element(text, **children):
+            element = mock.Mock(spec=webelement.WebElement, text=text)
+            element.find_elements_by_tag_name.side_effect = children.get
+            return element
+        # The visible texts, as WebDriver reads them
+        row = make_element(None, td=[make_element(u'first\nline'),
+                                     make_element(u'1')])
+        body = make_element(None, tr=[row])
+        self.table.find_elements_by_tag_name.side_effect = {
+            'th': [make_element(u'Name'), make_element(u'Value')],
+            'tbody': [body]}.get
+
+    def test_fallback_without_rendered_text(self):
+        # Without innerText, the visible texts are read from WebDriver rather
+        # than from the text content
+        self.browser.execute_script.return_value = None
+        self.make_webdriver_table()
+        # Given as an element, the table mock is used as is
+        self.assertEqual(([u'Name', u'Value'], [[u'first\nline', u'1']]),
+                         actions.get_table_data(self.table))
+        actions.assert_table_row_contains_text(
+            self.table, 0, [u'first\nline', u'1'])
+
+    def test_fallback_without_script_support(self):
+        self.browser.execute_script.side_effect = (
+            exceptions.WebDriverException())
+        self.make_webdriver_table()
+        self.assertEqual(([u'Name', u'Value'], [[u'first\nline', u'1']]),
+                         actions.get_table_data(self.table))
+
+
+class TestWaitFor(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWaitFor, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        actions._set_wait_timeout(10, 0.1)
+        self.addCleanup(actions._set_event_driven_wait, False)
+        self.nb_calls = 0
+        sleep_patcher = mock.patch('time.sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def fail_until(self, times):
+        self.nb_calls += 1
+        if self.nb_calls <= times:
+            raise AssertionError('Not yet')
+
+    def test_poll_backs_off(self):
+        actions.wait_for(self.fail_until, 8)
+        delays = [call[0][0] for call in self.sleep.call_args_list]
+        self.assertEqual(8, len(delays))
+        self.assertAlmostEqual(0.1, delays[0])
+        self.assertAlmostEqual(0.15, delays[1])
+        self.assertEqual(sorted(delays), delays)
+        self.assertAlmostEqual(0.5, delays[-1])
+
+    def find_elements(self, times):
+        self.browser.find_elements_by_css_selector.side_effect = (
+            [[]] * times + [[mock.Mock(spec=webelement.WebElement)]])
+
+    def test_event_driven_wait_for_element(self):
+        actions.set_event_driven_wait()
+        self.find_elements(1)
+        self.browser.execute_async_script.return_value = True
+        actions.wait_for(actions.get_element, id='done')
+        self.assertFalse(self.sleep.called)
+        args = self.browser.execute_async_script.call_args[0]
+        self.assertEqual(('present', ['#done', None]), args[1:3])
+
+    def test_event_driven_wait_for_text(self):
+        self.assertEqual(
+            ('text', ['message', 'Saved', True]),
+            actions._get_dom_condition(
+                actions.assert_text_contains, ('message', 'Saved'), {}))
+        self.assertIs(
+            None,
+            actions._get_dom_condition(
+                actions.assert_text_contains, ('message', 'Sav.*'),
+                {'regex': True}))
+
+    def test_polling_without_event_driven_wait(self):
+        self.find_elements(1)
+        actions.wait_for(actions.get_element, id='done')
+        self.assertEqual(1, self.sleep.call_count)
+        self.assertFalse(self.browser.execute_async_script.called)
+
+    def test_other_conditions_polled(self):
+        actions.set_event_driven_wait()
+        actions.wait_for(self.fail_until, 1)
+        self.assertEqual(1, self.sleep.call_count)
+        self.assertFalse(self.browser.execute_async_script.called)
+
+    def test_poll_without_script_support(self):
+        actions.set_event_driven_wait()
+        self.find_elements(2)
+        self.browser.execute_async_script.side_effect = (
+            exceptions.WebDriverException())
+        actions.wait_for(actions.get_element, id='done')
+        self.assertEqual(1, self.browser.execute_async_script.call_count)
+        self.assertEqual(2, self.sleep.call_count)
+
+    def test_poll_when_dom_condition_is_not_enough(self):
+        actions.set_event_driven_wait()
+        # There are several elements matching until the last check
+        elems = [mock.Mock(spec=webelement.WebElement)] * 2
+        self.browser.find_elements_by_css_selector.side_effect = (
+            [elems, elems, elems, elems[:1]])
+        self.browser.execute_async_script.return_value = True
+        actions.wait_for(actions.get_element, id='done')
+        self.assertEqual(1, self.browser.execute_async_script.call_count)
+        self.assertEqual(2, self.sleep.call_count)
+
+    def test_stale_element_retried_within_the_timeout(self):
+        def stale():
+            raise exceptions.StaleElementReferenceException()
+        now = [0]
+
+        def sleep(delay):
+            now[0] += delay + 0.01
+        self.sleep.side_effect = sleep
+        self.patch(time, 'time', lambda: now[0])
+        e = self.assertRaises(AssertionError, actions.wait_for, stale)
+        self.assertIn('Timed out waiting for', str(e))
+        self.assertTrue(now[0] <= 10.5)
+
+    def test_stale_element_retried_until_condition_holds(self):
+        results = [exceptions.StaleElementReferenceException(), 'done']
+
+        def condition():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        self.assertEqual('done', actions.wait_for(condition))
+
+
+class TestPageReadiness(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPageReadiness, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.addCleanup(actions._set_page_readiness, 'body')
+        sleep_patcher = mock.patch('time.sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+        self.elem = mock.Mock(spec=webelement.WebElement)
+
+    def test_wait_for_body_by_default(self):
+        self.browser.find_elements_by_css_selector.return_value = [self.elem]
+        actions.click_element(self.elem)
+        self.browser.find_elements_by_css_selector.assert_called_once_with(
+            'body')
+
+    def test_no_wait(self):
+        actions.click_element(self.elem, wait=False)
+        self.assertTrue(self.elem.click.called)
+        self.assertEqual([], self.browser.method_calls)
+
+    def test_ready_state(self):
+        actions.set_page_readiness('ready')
+        self.browser.execute_script.side_effect = ['loading', 'complete']
+        actions.click_element(self.elem)
+        self.assertEqual(2, self.browser.execute_script.call_count)
+        self.assertEqual(1, self.sleep.call_count)
+
+    def test_navigation_without_new_document(self):
+        self.patch(actions.NavigationReadiness, 'grace', 0)
+        self.browser.execute_script.side_effect = [None, 'unchanged']
+        actions.click_element(self.elem, wait='navigation')
+        # The click marks the document, no extra call is needed
+        self.assertEqual(2, self.browser.execute_script.call_count)
+        self.assertEqual(actions._MARK_AND_CLICK_SCRIPT,
+                         self.browser.execute_script.call_args_list[0][0][0])
+        self.assertFalse(self.elem.click.called)
+        self.assertFalse(self.sleep.called)
+
+    def test_navigation_waits_for_new_document(self):
+        self.browser.execute_script.side_effect = [
+            None, 'unloading', exceptions.WebDriverException(), 'interactive',
+            'complete']
+        actions.click_element(self.elem, wait='navigation')
+        self.assertEqual(5, self.browser.execute_script.call_count)
+        mark = self.browser.execute_script.call_args_list[0][0][2]
+        self.assertEqual(mark, self.browser.execute_script.call_args[0][1])
+
+    def test_navigation_waits_for_the_click_to_load_a_page(self):
+        # The navigation only starts after the first check
+        self.patch(actions.NavigationReadiness, 'grace', 60)
+        self.browser.execute_script.side_effect = [
+            None, 'unchanged', 'loading', 'complete']
+        actions.click_element(self.elem, wait='navigation')
+        self.assertEqual(4, self.browser.execute_script.call_count)
+
+    def test_navigation_from_webdriver(self):
+        self.browser.execute_script.side_effect = ['complete']
+        actions.go_to('http://localhost/', wait='navigation')
+        self.browser.get.assert_called_once_with('http://localhost/')
+        self.assertEqual(
+            [mock.call(actions._DOCUMENT_STATE_SCRIPT, None)],
+            self.browser.execute_script.call_args_list)
+
+    def test_navigation_click_fallback(self):
+        self.browser.execute_script.side_effect = [
+            exceptions.WebDriverException(), 'complete']
+        actions.click_element(self.elem, wait='navigation')
+        self.assertTrue(self.elem.click.called)
+
+    def test_custom_readiness(self):
+        calls = []
+
+        class Readiness(actions.PageReadiness):
+
+            def prepare(self):
+                calls.append('prepare')
+                return 'prepared'
+
+            def wait(self, prepared):
+                calls.append(prepared)
+
+        self.elem.click.side_effect = lambda: calls.append('click')
+        actions.set_page_readiness(Readiness())
+        actions.click_element(self.elem)
+        self.assertEqual(['prepare', 'click', 'prepared'], calls)
+
+    def test_unknown_readiness(self):
+        self.assertRaises(ValueError, actions.set_page_readiness, 'unknown')
+        self.assertRaises(ValueError, actions.click_element, self.elem,
+                          wait='unknown')
+        self.assertFalse(self.elem.click.called)
+
+
+class TestWaitForNetworkIdle(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWaitForNetworkIdle, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        sleep_patcher = mock.patch('time.sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_wait_for_network_idle(self):
+        self.browser.execute_script.side_effect = [
+            False, exceptions.WebDriverException(), True]
+        actions.wait_for_network_idle(200)
+        self.assertEqual(3, self.browser.execute_script.call_count)
+        self.assertEqual(200, self.browser.execute_script.call_args[0][1])
+
+    def test_timeout(self):
+        self.browser.execute_script.return_value = False
+        self.assertRaises(AssertionError,
+                          actions.wait_for_network_idle, timeout=0)
+
+    def test_network_readiness(self):
+        elem = mock.Mock(spec=webelement.WebElement)
+        # Counter installed, document marked, document changed, network idle.
+        self.browser.execute_script.side_effect = [
+            False, None, 'complete', True]
+        actions.click_element(elem, wait='network')
+        scripts = [call[0][0] for call in
+                   self.browser.execute_script.call_args_list]
+        self.assertEqual(actions._NETWORK_IDLE_SCRIPT, scripts[0])
+        self.assertEqual(actions._NETWORK_IDLE_SCRIPT, scripts[-1])
+        self.assertFalse(self.sleep.called)
+
+
+class TestFillForm(testtools.TestCase):
+
+    def setUp(self):
+        super(TestFillForm, self).setUp()
+        self.browser = mock.Mock(capabilities={'platform': 'LINUX'})
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.addCleanup(actions._set_element_cache, False)
+        self.text = mock.Mock(spec=webelement.WebElement)
+        self.checkbox = mock.Mock(spec=webelement.WebElement)
+        self.radio = mock.Mock(spec=webelement.WebElement)
+        self.select = mock.Mock(spec=webelement.WebElement)
+        self.option = mock.Mock(spec=webelement.WebElement)
+        self.fields = [
+            [self.text, 'text', False, u'old', None, False],
+            [self.checkbox, 'checkbox', False, u'on', None, False],
+            [self.radio, 'radio', True, u'on', None, False],
+            [self.select, 'select-one', False, u'1', self.option, False],
+        ]
+        self.values = [[False, u'new', None], [True, u'on', None],
+                       [True, u'on', None], [False, u'2', u'Two']]
+        self.browser.execute_script.side_effect = [self.fields, self.values]
+
+    def fill_form(self, **kwargs):
+        actions.fill_form([('text', 'new'), ('checkbox', True),
+                           ('radio', True), ('select', 'Two')], **kwargs)
+
+    def test_fill_form(self):
+        self.fill_form()
+        self.text.send_keys.assert_called_once_with(
+            Keys.CONTROL, 'a', Keys.NULL, Keys.DELETE, 'new')
+        self.assertTrue(self.checkbox.click.called)
+        self.assertFalse(self.radio.click.called)
+        self.assertTrue(self.option.click.called)
+        self.assertEqual(2, self.browser.execute_script.call_count)
+
+    def test_mac_clears_with_command(self):
+        self.browser.capabilities['platform'] = 'MAC'
+        self.fill_form()
+        self.text.send_keys.assert_called_once_with(
+            Keys.COMMAND, 'a', Keys.NULL, Keys.DELETE, 'new')
+
+    def test_unchanged_fields_are_left_alone(self):
+        self.fields[0][3] = u'new'
+        self.fields[1][2] = True
+        self.fields[3][5] = True
+        self.fill_form(check=False)
+        self.assertFalse(self.text.send_keys.called)
+        self.assertFalse(self.checkbox.click.called)
+        self.assertFalse(self.option.click.called)
+        self.assertEqual(1, self.browser.execute_script.call_count)
+
+    def test_empty_field_is_not_cleared(self):
+        self.fields[0][3] = u''
+        self.fill_form()
+        self.text.send_keys.assert_called_once_with('new')
+
+    def test_fields_asserted_before_filling(self):
+        self.fields[2][1] = 'submit'
+        e = self.assertRaises(AssertionError, self.fill_form)
+        self.assertIn("Element 'radio' is not one of", str(e))
+        self.assertFalse(self.text.send_keys.called)
+
+    def test_missing_field(self):
+        self.fields[1] = None
+        e = self.assertRaises(AssertionError, self.fill_form)
+        self.assertEqual("Element with id: 'checkbox' does not exist", str(e))
+
+    def test_missing_option(self):
+        self.fields[3][4] = None
+        e = self.assertRaises(AssertionError, self.fill_form)
+        self.assertEqual(
+            "The following option could not be found in the list: 'Two'",
+            str(e))
+
+    def test_check(self):
+        self.values[0][1] = u'ne'
+        e = self.assertRaises(AssertionError, self.fill_form)
+        self.assertEqual(
+            "Field: 'text' - was not set to 'new'. Value is: u'ne'", str(e))
+
+    def test_fields_are_cached(self):
+        actions.set_element_cache()
+        self.fill_form(check=False)
+        self.browser.reset_mock()
+        self.assertEqual(self.text.id, actions._get_elem('text').id)
+        self.assertEqual([], self.browser.mock_calls)
+
+
+class TestGetElementsData(testtools.TestCase):
+
+    def setUp(self):
+        super(TestGetElementsData, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+
+    def test_get_elements_data(self):
+        self.browser.execute_script.return_value = [
+            [u' First\n', u'http://localhost/1', True],
+            [u'Second', u'http://localhost/2', False]]
+        self.assertEqual(
+            [{'text': u'First', 'href': u'http://localhost/1',
+              'displayed': True},
+             {'text': u'Second', 'href': u'http://localhost/2',
+              'displayed': False}],
+            actions.get_elements_data('a', ['text', 'href', 'displayed']))
+        self.assertEqual(1, self.browser.execute_script.call_count)
+        self.assertEqual(('a', ['text', 'href', 'displayed'], False),
+                         self.browser.execute_script.call_args[0][1:])
+
+    def test_keep_elements(self):
+        elem = mock.Mock(spec=webelement.WebElement)
+        self.browser.execute_script.return_value = [[elem, u'menu']]
+        self.assertEqual(
+            [{'element': elem, 'class': u'menu'}],
+            actions.get_elements_data('li', ['class'], keep_elements=True))
+
+    def test_invalid_selector(self):
+        self.browser.execute_script.side_effect = (
+            exceptions.WebDriverException('SyntaxError'))
+        self.assertRaises(AssertionError, actions.get_elements_data, '#')
+
+
+class TestDropdown(testtools.TestCase):
+
+    def setUp(self):
+        super(TestDropdown, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.select = mock.Mock(spec=webelement.WebElement)
+        self.select.get_attribute.return_value = 'select'
+
+    def test_set_dropdown_value_in_one_script(self):
+        self.browser.execute_script.return_value = 'selected'
+        actions.set_dropdown_value(self.select, text='Zambia')
+        self.assertEqual((self.select, 'Zambia', None),
+                         self.browser.execute_script.call_args[0][1:])
+        self.assertFalse(self.select.find_elements_by_tag_name.called)
+
+    def test_set_dropdown_value_errors(self):
+        self.browser.execute_script.return_value = 'not-found'
+        e = self.assertRaises(AssertionError, actions.set_dropdown_value,
+                              self.select, value='zm')
+        self.assertEqual(
+            "The following option could not be found in the list: 'zm'",
+            str(e))
+        e = self.assertRaises(AssertionError, actions.set_dropdown_value,
+                              self.select, text='Zambia', value='zm')
+        self.assertEqual(
+            'Use set_dropdown_value() with either text or value!', str(e))
+        self.browser.execute_script.return_value = 'not-select'
+        e = self.assertRaises(AssertionError, actions.set_dropdown_value,
+                              'country', text='Zambia')
+        self.assertEqual(
+            "Element 'country' is not one of ('select-one',)", str(e))
+
+    def test_assert_dropdown_value(self):
+        self.browser.execute_script.return_value = 'set'
+        actions.assert_dropdown_value(self.select, 'Zambia')
+        self.browser.execute_script.return_value = 'not-set'
+        e = self.assertRaises(AssertionError, actions.assert_dropdown_value,
+                              self.select, 'Zambia')
+        self.assertEqual("The option is not currently set to: 'Zambia'",
+                         str(e))
+
+    def test_fallback_without_script_support(self):
+        self.browser.execute_script.side_effect = (
+            exceptions.WebDriverException())
+        self.select.get_attribute.side_effect = {
+            'type': 'select-one', 'id': 'country'}.get
+        option = mock.Mock(spec=webelement.WebElement, text='Zambia')
+        self.select.find_elements_by_tag_name.return_value = [option]
+        actions.set_dropdown_value(self.select, text='Zambia')
+        self.assertTrue(option.click.called)
+
+
+class TestElementWrapper(testtools.TestCase):
+
+    def setUp(self):
+        super(TestElementWrapper, self).setUp()
+        self.browser = mock.Mock()
+        self.patch(actions, '_test', mock.Mock(browser=self.browser))
+        self.elem = mock.Mock(spec=webelement.WebElement)
+
+    def fields(self, tag='input', type=None, id='test', value=None,
+               checked=False, href=None):
+        return [tag, type, id, value, checked, href]
+
+    def test_fields_read_at_once(self):
+        self.browser.execute_script.return_value = self.fields(type='submit')
+        self.assertIs(self.elem, actions.assert_button(self.elem))
+        self.assertEqual(1, self.browser.execute_script.call_count)
+        self.assertFalse(self.elem.get_attribute.called)
+
+    def test_fields_read_again_after_change(self):
+        self.browser.execute_script.side_effect = [
+            self.fields(type='checkbox', checked=False),
+            self.fields(type='checkbox', checked=True)]
+        actions.toggle_checkbox(self.elem)
+        self.assertEqual(1, self.elem.click.call_count)
+        self.assertEqual(2, self.browser.execute_script.call_count)
+
+    def test_text_field_assertion(self):
+        self.browser.execute_script.return_value = self.fields(
+            type='text', value=u'Written')
+        actions.assert_text(self.elem, u'Written')
+        self.assertEqual(1, self.browser.execute_script.call_count)
+        self.assertEqual([], self.elem.method_calls)
+
+    def test_fallback_without_script_support(self):
+        self.browser.execute_script.side_effect = (
+            exceptions.WebDriverException())
+        self.elem.tag_name = 'a'
+        self.elem.get_attribute.return_value = 'http://localhost/'
+        self.assertEqual('http://localhost/',
+                         actions.get_link_url(self.elem))
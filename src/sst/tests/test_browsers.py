@@ -0,0 +1,552 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+import BaseHTTPServer
+import httplib
+import json
+import os
+import shutil
+import signal
+import socket
+import SocketServer
+import subprocess
+import threading
+import time
+import urllib2
+
+import mock
+import testtools
+
+from selenium.common import exceptions
+from selenium.webdriver.remote import remote_connection
+from sst import (
+    browsers,
+    cases,
+    tests,
+)
+
+
+class FakeHubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        # Keep the test output clean
+        pass
+
+    def send_json(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        hub = self.server.hub
+        if self.path == '/grid/api/hub':
+            self.send_json(200, {'slotCounts': {'free': hub.slots,
+                                                'total': hub.slots}})
+        else:
+            self.send_json(404, {})
+
+    def do_POST(self):
+        hub = self.server.hub
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        if not hub.start_request():
+            self.send_json(500, {'status': 13, 'sessionId': None,
+                                 'value': {'message': 'No free slot'}})
+            return
+        try:
+            # Session creation is slow
+            time.sleep(hub.creation_delay)
+            self.send_json(200, {'status': 0, 'sessionId': 'session',
+                                 'value': {'browserName': 'fake'}})
+        finally:
+            hub.end_request()
+
+    def do_DELETE(self):
+        self.send_json(200, {'status': 0, 'sessionId': 'session',
+                             'value': None})
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class FakeHub(object):
+    """A stand-in Selenium grid hub with limited slots.
+
+    Session requests exceeding the number of slots are refused.
+    """
+
+    def __init__(self, slots, creation_delay=0.1):
+        self.slots = slots
+        self.creation_delay = creation_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.refused = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeHubHandler)
+        self.server.hub = self
+        self.url = 'http://127.0.0.1:%d/wd/hub' % (self.server.server_port,)
+
+    def start_request(self):
+        with self.lock:
+            if self.in_flight >= self.slots:
+                self.refused += 1
+                return False
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return True
+
+    def end_request(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def start(self, test):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        test.addCleanup(self.server.server_close)
+        test.addCleanup(self.server.shutdown)
+
+
+def start_hub(test, slots, creation_delay=0.1):
+    hub = FakeHub(slots, creation_delay)
+    hub.start(test)
+    return hub
+
+
+class TestSessionScheduler(testtools.TestCase):
+
+    def setUp(self):
+        super(TestSessionScheduler, self).setUp()
+        tests.set_cwd_to_tmp(self)
+
+    def get_factory(self, hub, capacity, **kwargs):
+        scheduler = browsers.SessionScheduler(
+            hub.url, capacity, lock_dir='slots', poll=0.01, **kwargs)
+        return browsers.RemoteBrowserFactory(
+            hub.url, {'browserName': 'fake'}, scheduler)
+
+    def start_sessions(self, factory, count):
+        sessions = []
+
+        def start_session():
+            sessions.append(factory.browser())
+
+        threads = [threading.Thread(target=start_session)
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sessions
+
+    def test_requests_are_limited_by_capacity(self):
+        hub = start_hub(self, slots=2)
+        factory = self.get_factory(hub, 2)
+        sessions = self.start_sessions(factory, 6)
+        self.assertEqual(6, len(sessions))
+        self.assertEqual(2, hub.max_in_flight)
+        self.assertEqual(0, hub.refused)
+        waits = factory.scheduler.waits
+        self.assertEqual(6, len(waits))
+        # Some requests had to wait for the previous ones to complete
+        self.assertLess(0.1, max(waits))
+
+    def test_refused_requests_are_retried(self):
+        # The scheduler believes the hub has more slots than it really has
+        hub = start_hub(self, slots=1)
+        factory = self.get_factory(hub, 3, max_attempts=20, backoff=0.01,
+                                   max_backoff=0.05)
+        sessions = self.start_sessions(factory, 3)
+        self.assertEqual(3, len(sessions))
+        self.assertLess(0, hub.refused)
+
+    def test_gives_up_after_max_attempts(self):
+        hub = start_hub(self, slots=0)
+        scheduler = browsers.SessionScheduler(
+            hub.url, 1, max_attempts=2, backoff=0.01, lock_dir='slots')
+        factory = browsers.RemoteBrowserFactory(
+            hub.url, {'browserName': 'fake'}, scheduler)
+        self.assertRaises(exceptions.WebDriverException, factory.browser)
+        self.assertEqual(2, hub.refused)
+
+    def test_capacity_is_at_least_one(self):
+        self.assertRaises(ValueError, browsers.SessionScheduler,
+                          'http://localhost:4444/wd/hub', 0, lock_dir='slots')
+
+    def test_network_errors_are_retried(self):
+        scheduler = browsers.SessionScheduler(
+            'http://localhost:4444/wd/hub', 1, backoff=0.01, lock_dir='slots')
+        create = mock.Mock(side_effect=[
+            urllib2.URLError('refused'), socket.error('reset'),
+            socket.timeout('timed out'), httplib.BadStatusLine(''),
+            'session'])
+        self.assertEqual('session', scheduler.request_session(create))
+        self.assertEqual(5, create.call_count)
+
+    def test_test_does_not_retry_on_top_of_the_scheduler(self):
+        scheduler = browsers.SessionScheduler(
+            'http://localhost:4444/wd/hub', 1, max_attempts=3, backoff=0.01,
+            lock_dir='slots')
+        factory = browsers.RemoteBrowserFactory(
+            'http://localhost:4444/wd/hub', {'browserName': 'fake'},
+            scheduler)
+        created = []
+
+        def create(remote_url, capabilities, keep_alive=False):
+            created.append(remote_url)
+            raise exceptions.WebDriverException('Grid is full')
+        factory.webdriver_class = create
+
+        class Remote(cases.SSTTestCase):
+
+            browser_factory = factory
+
+            def test_it(self):
+                pass
+
+        result = testtools.TestResult()
+        Remote('test_it').run(result)
+        self.assertEqual(1, len(result.errors))
+        # Only the attempts of the scheduler
+        self.assertEqual(3, len(created))
+
+    def test_without_scheduler(self):
+        hub = start_hub(self, slots=1)
+        factory = browsers.RemoteBrowserFactory(
+            hub.url, {'browserName': 'fake'})
+        self.assertEqual('session', factory.browser().session_id)
+
+
+class TestDisconnectBrowser(testtools.TestCase):
+
+    def test_hung_call_fails(self):
+        # A hub accepting the connection but never answering
+        server = socket.socket()
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        url = 'http://%s:%d/wd/hub' % server.getsockname()
+        factory = browsers.RemoteBrowserFactory(url, {'browserName': 'fake'})
+        errors = []
+
+        def create(remote_url, capabilities, keep_alive=False):
+            # Only the connection of a real webdriver
+            return mock.Mock(command_executor=remote_connection
+                             .RemoteConnection(remote_url, keep_alive))
+        factory.webdriver_class = create
+        browser = factory.browser()
+
+        def call():
+            try:
+                browser.command_executor.execute(
+                    'getTitle', {'sessionId': 'session'})
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=call)
+        thread.daemon = True
+        thread.start()
+        conn, _ = server.accept()
+        self.addCleanup(conn.close)
+        conn.recv(1)
+        self.assertTrue(browsers.disconnect_browser(browser))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, len(errors))
+
+    def test_no_connection(self):
+        self.assertFalse(browsers.disconnect_browser(mock.Mock(spec=[])))
+
+
+class TestProbeGridCapacity(testtools.TestCase):
+
+    def test_probe(self):
+        hub = start_hub(self, slots=40)
+        self.assertEqual(40, browsers.probe_grid_capacity(hub.url))
+
+    def test_probe_with_credentials(self):
+        hub = start_hub(self, slots=4)
+        url = hub.url.replace('http://', 'http://user:key@')
+        self.assertEqual(4, browsers.probe_grid_capacity(url))
+
+    def test_no_hub(self):
+        hub = start_hub(self, slots=4)
+        hub.server.shutdown()
+        hub.server.server_close()
+        self.assertIs(None, browsers.probe_grid_capacity(hub.url, timeout=1))
+
+
+class FakeBrowser(object):
+
+    def __init__(self, trusted):
+        self.trusted = trusted
+        self.quitted = False
+
+    def quit(self):
+        self.quitted = True
+
+
+class FakeFactory(browsers.BrowserFactory):
+
+    def __init__(self, fail=False):
+        super(FakeFactory, self).__init__()
+        self.fail = fail
+        self.created = []
+
+    def setup_for_test(self, test):
+        self.trusted = test.assume_trusted_cert_issuer
+
+    def setup_key(self, test):
+        return test.assume_trusted_cert_issuer
+
+    def browser(self):
+        if self.fail:
+            raise exceptions.WebDriverException('Cannot start')
+        browser = FakeBrowser(self.trusted)
+        browser.display = self.display
+        self.created.append(browser)
+        return browser
+
+
+class FakeTest(object):
+
+    def __init__(self, trusted=False):
+        self.assume_trusted_cert_issuer = trusted
+
+
+class TestPrewarmingBrowserFactory(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPrewarmingBrowserFactory, self).setUp()
+        self.factory = FakeFactory()
+        self.prewarming = browsers.PrewarmingBrowserFactory(self.factory)
+        self.addCleanup(self.prewarming.cleanup)
+
+    def start_browser(self, test):
+        self.prewarming.setup_for_test(test)
+        return self.prewarming.browser()
+
+    def test_next_browser_is_prewarmed(self):
+        first = self.start_browser(FakeTest())
+        # The next browser is started in the background
+        self.prewarming.pending.join()
+        self.assertEqual(2, len(self.factory.created))
+        second = self.start_browser(FakeTest())
+        self.assertIs(self.factory.created[1], second)
+        self.assertIsNot(first, second)
+
+    def test_different_setup_is_not_handed_over(self):
+        self.start_browser(FakeTest())
+        prewarmed = self.prewarming.pending.take()
+        browser = self.start_browser(FakeTest(trusted=True))
+        self.assertIsNot(prewarmed, browser)
+        self.assertTrue(browser.trusted)
+        self.assertTrue(prewarmed.quitted)
+
+    def test_different_display_is_not_handed_over(self):
+        self.start_browser(FakeTest())
+        prewarmed = self.prewarming.pending.take()
+        self.patch(os, 'environ', dict(os.environ, DISPLAY=':1234'))
+        browser = self.start_browser(FakeTest())
+        self.assertIsNot(prewarmed, browser)
+        self.assertTrue(prewarmed.quitted)
+
+    def test_display_read_before_prewarming(self):
+        self.patch(os, 'environ', dict(os.environ, DISPLAY=':1234'))
+        first = self.start_browser(FakeTest())
+        # The test gives its display back before the next browser starts
+        self.patch(os, 'environ', dict(os.environ, DISPLAY=':4321'))
+        prewarmed = self.prewarming.pending.take()
+        self.assertIs(None, first.display)
+        self.assertEqual(':1234', prewarmed.display)
+
+    def test_cleanup_quits_unused_browser(self):
+        browser = self.start_browser(FakeTest())
+        self.prewarming.cleanup()
+        self.assertEqual(2, len(self.factory.created))
+        self.assertFalse(browser.quitted)
+        self.assertTrue(self.factory.created[1].quitted)
+        self.assertIs(None, self.prewarming.pending)
+
+    def test_prewarm_failure(self):
+        # The pre-warming uses a copy of the failing factory
+        self.factory.fail = True
+        self.prewarming.prewarm(FakeTest(), False)
+        self.prewarming.pending.join()
+        self.factory.fail = False
+        # The failed pre-warm is replaced by a fresh browser
+        browser = self.start_browser(FakeTest())
+        self.assertIs(self.factory.created[0], browser)
+
+
+class TestProfileTemplates(testtools.TestCase):
+
+    def setUp(self):
+        super(TestProfileTemplates, self).setUp()
+        self.factory = browsers.FirefoxFactory()
+        self.addCleanup(self.factory.cleanup)
+
+    def get_profile(self, trusted=False):
+        self.factory.setup_for_test(FakeTest(trusted))
+        profile = self.factory.profile
+        self.addCleanup(shutil.rmtree, profile.path, True)
+        return profile
+
+    def test_template_is_reused(self):
+        first = self.get_profile()
+        second = self.get_profile()
+        self.assertEqual(1, len(self.factory.templates.templates))
+        self.assertEqual(first.template, second.template)
+        self.assertNotEqual(first.path, second.path)
+
+    def test_template_per_prefs(self):
+        default = self.get_profile()
+        trusted = self.get_profile(trusted=True)
+        self.assertEqual(2, len(self.factory.templates.templates))
+        self.assertNotEqual(default.template, trusted.template)
+        self.assertEqual(
+            False,
+            trusted.default_preferences['webdriver_assume_untrusted_issuer'])
+
+    def test_extension_is_linked(self):
+        profile = self.get_profile()
+        extensions = os.listdir(os.path.join(profile.path, 'extensions'))
+        self.assertEqual(1, len(extensions))
+        install_rdf = os.path.join(profile.path, 'extensions', extensions[0],
+                                   'install.rdf')
+        self.assertEqual(2, os.stat(install_rdf).st_nlink)
+        # Installing the webdriver extension is a no-op
+        profile.add_extension()
+
+    def test_prefs_do_not_leak_into_template(self):
+        profile = self.get_profile()
+        profile.port = 4321
+        profile.update_preferences()
+        with open(os.path.join(profile.template, 'user.js')) as f:
+            self.assertNotIn('4321', f.read())
+        with open(os.path.join(profile.path, 'user.js')) as f:
+            self.assertIn('4321', f.read())
+
+    def test_cleanup(self):
+        template = self.get_profile().template
+        self.factory.cleanup()
+        self.assertFalse(os.path.exists(template))
+        self.assertEqual({}, self.factory.templates.templates)
+
+
+class TestProfileCleaner(testtools.TestCase):
+
+    def test_remove(self):
+        tests.set_cwd_to_tmp(self)
+        os.makedirs('profile/extensions')
+        os.mkdir('tempfolder')
+        cleaner = browsers.ProfileCleaner()
+        cleaner.remove('profile', None, 'tempfolder')
+        cleaner.wait()
+        self.assertEqual([], os.listdir('.'))
+        self.assertEqual([], cleaner.threads)
+
+
+class TestPortRegistry(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPortRegistry, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        os.mkdir('ports')
+        self.registry = browsers.PortRegistry('ports', max_attempts=3)
+
+    def patch_free_port(self, *ports):
+        ports = list(ports)
+        self.patch(browsers.utils, 'free_port', lambda: ports.pop(0))
+
+    def reserve(self):
+        reservation = self.registry.reserve()
+        self.addCleanup(reservation.release)
+        return reservation
+
+    def test_reserve(self):
+        self.patch_free_port(4321)
+        self.assertEqual(4321, self.reserve().port)
+
+    def test_reserved_port_is_skipped(self):
+        self.patch_free_port(4321, 4321, 4322)
+        self.reserve()
+        # Another registry sharing the lock directory (as another process
+        # would) can't get the same port
+        other = browsers.PortRegistry('ports')
+        reservation = other.reserve()
+        self.addCleanup(reservation.release)
+        self.assertEqual(4322, reservation.port)
+
+    def test_released_port_can_be_reserved(self):
+        self.patch_free_port(4321, 4321)
+        self.reserve().release()
+        self.assertEqual(4321, self.reserve().port)
+
+    def test_gives_up(self):
+        self.patch_free_port(4321, 4321, 4321, 4321)
+        self.reserve()
+        self.assertRaises(exceptions.WebDriverException,
+                          self.registry.reserve)
+
+
+class TestKillBrowser(testtools.TestCase):
+
+    def start_process_tree(self):
+        # A shell waiting for its child
+        process = subprocess.Popen(['sh', '-c', 'sleep 60 & wait'])
+        self.addCleanup(process.wait)
+        for attempt in range(100):
+            children = browsers.child_pids(process.pid)
+            if children:
+                return process, children
+            time.sleep(0.01)
+        self.fail('sleep was not started')
+
+    def test_process_tree_is_killed(self):
+        if not os.path.isdir('/proc'):
+            self.skip('No /proc file system')
+        process, children = self.start_process_tree()
+        browser = mock.Mock(spec=['binary'])
+        browser.binary.process = process
+        self.assertTrue(browsers.kill_browser(browser))
+        self.assertEqual(-signal.SIGKILL, process.wait())
+        for attempt in range(100):
+            if self.is_dead(children[0]):
+                break
+            time.sleep(0.01)
+        else:
+            self.fail('sleep was not killed')
+
+    def is_dead(self, pid):
+        try:
+            with open('/proc/%d/stat' % (pid,)) as f:
+                stat = f.read()
+        except IOError:
+            return True
+        # Killed but not reaped yet by its new parent
+        return stat.rsplit(')', 1)[1].split()[0] == 'Z'
+
+    def test_remote_browser_has_no_process(self):
+        self.assertFalse(browsers.kill_browser(mock.Mock(spec=[])))
@@ -18,6 +18,8 @@
 #
 
 from cStringIO import StringIO
+import sys
+
 import testtools
 
 from sst import command
@@ -73,6 +75,40 @@ class TestArgParsing(testtools.TestCase):
         self.assertEqual(5, opts.concurrency)
 
 
+class TestRemoteArgParsing(testtools.TestCase):
+
+    def parse_args(self, provided_args):
+        opts, remaining_args = command.get_opts_remote(
+            ['dummy-for-tests'] + provided_args)
+        self.assertEqual('dummy-for-tests', remaining_args[0])
+        return opts, remaining_args[1:]
+
+    def test_default_values(self):
+        opts, args = self.parse_args([])
+        self.assertEqual(1, opts.concurrency)
+        self.assertEqual('static', opts.scheduling)
+        self.assertIs(None, opts.durations_file)
+
+    def test_concurrency(self):
+        opts, args = self.parse_args(['-c', '40', '--scheduling=dynamic'])
+        self.assertEqual(40, opts.concurrency)
+        self.assertEqual('dynamic', opts.scheduling)
+
+    def test_grid_capacity(self):
+        opts, args = self.parse_args(['--grid-capacity', '4'])
+        self.assertEqual(4, opts.grid_capacity)
+        opts, args = self.parse_args(['--grid-capacity=auto'])
+        self.assertEqual('auto', opts.grid_capacity)
+
+    def test_invalid_grid_capacity(self):
+        self.patch(sys, 'stderr', StringIO())
+        for value in ('0', '-2', 'many', '1.5'):
+            self.assertRaises(SystemExit, self.parse_args,
+                              ['--grid-capacity', value])
+        self.assertIn('--grid-capacity must be "auto" or a positive integer',
+                      sys.stderr.getvalue())
+
+
 class TestCleanups(testtools.TestCase):
 
     def test_cleanup_now_consumes(self):
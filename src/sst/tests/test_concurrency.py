@@ -113,6 +113,225 @@ class TestConcurrentSuite(testtools.TestCase):
         self.assertEqual(0, len(res.failures))
 
 
+def get_killed_case():
+    # Define the class in a function so test loading don't try to load it as a
+    # regular test class.
+
+    class Killed(unittest.TestCase):
+
+        def test_killed(self):
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    return Killed('test_killed')
+
+
+def get_dies_before_starting_case():
+    # Define the class in a function so test loading don't try to load it as a
+    # regular test class.
+
+    class DiesBeforeStarting(unittest.TestCase):
+
+        def test_dies(self):
+            pass
+
+        def run(self, result=None):
+            # Like a process failing to start its browser before its first
+            # test
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    return DiesBeforeStarting('test_dies')
+
+
+class TestCrashedProcesses(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCrashedProcesses, self).setUp()
+        # Silence the warnings about crashed processes
+        self.patch(concurrency.logger, 'warning', lambda msg: None)
+
+    def run_tests_concurrently(self, tests, concurrency_num, scheduling):
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        suite = unittest.TestSuite(tests)
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite,
+            concurrency.fork_for_tests(concurrency_num,
+                                       scheduling=scheduling))
+        res.startTestRun()
+        concurrent_suite.run(res)
+        res.stopTestRun()
+        return res
+
+    def get_tests(self):
+        return [tests.get_case('pass'), get_killed_case(),
+                tests.get_case('pass'), get_killed_case(),
+                tests.get_case('pass')]
+
+    def assertCrashesReported(self, res):
+        # All tests have been run
+        self.assertEqual(5, res.testsRun)
+        # The ones that were running when their process was killed are
+        # reported as errors
+        self.assertEqual(2, len(res.errors))
+        for test, error in res.errors:
+            self.assertEqual(
+                'sst.tests.test_concurrency.Killed.test_killed', test.id())
+            self.assertIn('lost connection during test', error)
+
+    def test_static(self):
+        res = self.run_tests_concurrently(self.get_tests(), 1, 'static')
+        self.assertCrashesReported(res)
+
+    def test_dynamic(self):
+        res = self.run_tests_concurrently(self.get_tests(), 2, 'dynamic')
+        self.assertCrashesReported(res)
+
+    def assertNotRunReported(self, res, count):
+        self.assertEqual(count, res.testsRun)
+        self.assertEqual(count, len(res.errors))
+        for test, error in res.errors:
+            self.assertIn('was killed by signal %d before running this test'
+                          % (signal.SIGKILL,), error)
+
+    def test_static_dies_before_first_test(self):
+        res = self.run_tests_concurrently(
+            [get_dies_before_starting_case(), tests.get_case('pass'),
+             tests.get_case('pass')], 1, 'static')
+        self.assertNotRunReported(res, 3)
+
+    def test_dynamic_dies_before_first_test(self):
+        res = self.run_tests_concurrently(
+            [get_dies_before_starting_case(), get_dies_before_starting_case(),
+             tests.get_case('pass')], 2, 'dynamic')
+        # Whatever the process picking the passing test, no test is lost
+        self.assertEqual(3, res.testsRun)
+        errors = [test.id() for test, error in res.errors]
+        self.assertEqual(
+            2, errors.count(get_dies_before_starting_case().id()))
+
+
+class TestDescribeExitStatus(testtools.TestCase):
+
+    def get_status(self, code):
+        pid = os.fork()
+        if pid == 0:
+            if code is None:
+                os.kill(os.getpid(), signal.SIGKILL)
+            os._exit(code)
+        return os.waitpid(pid, 0)[1]
+
+    def test_exited(self):
+        self.assertEqual('exited with status 3',
+                         concurrency.describe_exit_status(self.get_status(3)))
+
+    def test_killed(self):
+        self.assertEqual(
+            'was killed by signal %d' % (signal.SIGKILL,),
+            concurrency.describe_exit_status(self.get_status(None)))
+
+
+class TestDynamicConcurrentSuite(testtools.TestCase):
+
+    def run_tests_concurrently(self, tests, durations=None):
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        suite = unittest.TestSuite(tests)
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite,
+            concurrency.fork_for_tests(2, durations, scheduling='dynamic'))
+        res.startTestRun()
+        concurrent_suite.run(res)
+        res.stopTestRun()
+        return res
+
+    def test_all_tests_run(self):
+        kinds = ['pass', 'fail', 'error', 'skip', 'pass']
+        res = self.run_tests_concurrently([tests.get_case(k) for k in kinds])
+        self.assertEqual(5, res.testsRun)
+        self.assertEqual(1, len(res.errors))
+        self.assertEqual(1, len(res.failures))
+        self.assertEqual(1, len(res.skip_reasons))
+
+    def test_with_durations(self):
+        res = self.run_tests_concurrently(
+            [tests.get_case('pass') for i in range(4)],
+            {'sst.tests.Test.test_pass': 1})
+        self.assertEqual(4, res.testsRun)
+        self.assertTrue(res.wasSuccessful())
+
+    def test_less_tests_than_processes(self):
+        res = self.run_tests_concurrently([tests.get_case('pass')])
+        self.assertEqual(1, res.testsRun)
+        self.assertTrue(res.wasSuccessful())
+
+    def test_class_fixtures(self):
+        class WithClassFixture(unittest.TestCase):
+
+            @classmethod
+            def setUpClass(cls):
+                cls.fixture = 'set up'
+
+            def test_fixture(self):
+                self.assertEqual('set up', self.fixture)
+
+        res = self.run_tests_concurrently(
+            [WithClassFixture('test_fixture') for i in range(4)])
+        self.assertEqual(4, res.testsRun)
+        self.assertTrue(res.wasSuccessful())
+
+    def test_unknown_scheduling(self):
+        self.assertRaises(ValueError, concurrency.fork_for_tests, 2,
+                          scheduling='unknown')
+
+
+class TestFinish(testtools.TestCase):
+
+    def setUp(self):
+        super(TestFinish, self).setUp()
+        tests.set_cwd_to_tmp(self)
+
+    def finish(self):
+        # Called in the child processes, leave a trace in the file system
+        open('finished-%d' % (os.getpid(),), 'w').close()
+
+    def run_tests_concurrently(self, scheduling):
+        res = results.TextTestResult(StringIO(), verbosity=0)
+        suite = unittest.TestSuite([tests.get_case('pass') for i in range(4)])
+        concurrent_suite = testtools.ConcurrentTestSuite(
+            suite,
+            concurrency.fork_for_tests(2, scheduling=scheduling,
+                                       finish=self.finish))
+        res.startTestRun()
+        concurrent_suite.run(res)
+        res.stopTestRun()
+        self.assertTrue(res.wasSuccessful())
+        self.assertEqual(4, res.testsRun)
+
+    def test_static(self):
+        self.run_tests_concurrently('static')
+        self.assertEqual(2, len(os.listdir('.')))
+
+    def test_dynamic(self):
+        self.run_tests_concurrently('dynamic')
+        self.assertEqual(2, len(os.listdir('.')))
+
+
+class TestFeedQueue(testtools.TestCase):
+
+    def test_feed_and_read(self):
+        qread, qwrite = os.pipe()
+        self.addCleanup(os.close, qread)
+        concurrency.feed_queue(qwrite, [3, 0, 1234567, 2])
+        os.close(qwrite)
+        self.assertEqual([3, 0, 1234567, 2],
+                         list(concurrency.read_queue(qread)))
+
+    def test_feed_without_readers(self):
+        qread, qwrite = os.pipe()
+        os.close(qread)
+        self.addCleanup(os.close, qwrite)
+        # No exception is raised, the indices are just dropped
+        concurrency.feed_queue(qwrite, [1, 2])
+
+
 class TestConcurrentRunTests(tests.ImportingLocalFilesTest):
     """Smoke integration tests at runtests level."""
 
@@ -177,6 +396,72 @@ class TestFail2(unittest.TestCase):
         self.assertEqual(output.count('Traceback (most recent call last):'), 2)
         self.assertIn('FAILED (failures=2)', output)
 
+    def test_dynamic_scheduling(self):
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_conc1.py
+import unittest
+class Test1(unittest.TestCase):
+    def test_pass_1(self):
+        self.assertTrue(True)
+    def test_pass_2(self):
+        self.assertTrue(True)
+
+file: t/test_conc2.py
+import unittest
+class Test2(unittest.TestCase):
+    def test_pass_3(self):
+        self.assertTrue(True)
+''')
+
+        out = StringIO()
+        runtests.runtests(
+            ['^t'], 'no results directory used', out,
+            concurrency_num=2,
+            scheduling='dynamic',
+            browser_factory=browsers.FirefoxFactory(),
+        )
+
+        output = out.getvalue()
+        self.assertIn('Ran 3 tests', output)
+        self.assertIn('OK', output)
+
+    def test_durations_file(self):
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+from sst import loaders
+discover = loaders.discoverRegularTests
+
+file: t/test_conc1.py
+import unittest
+class Test1(unittest.TestCase):
+    def test_pass_1(self):
+        self.assertTrue(True)
+
+file: t/test_conc2.py
+import unittest
+class Test2(unittest.TestCase):
+    def test_pass_2(self):
+        self.assertTrue(True)
+''')
+        concurrency.save_durations('durations', {'t.old.Test.test_old': 2})
+        out = StringIO()
+        runtests.runtests(
+            ['^t'], 'no results directory used', out,
+            concurrency_num=2,
+            browser_factory=browsers.FirefoxFactory(),
+            durations_file='durations',
+        )
+        self.assertIn('Ran 2 tests', out.getvalue())
+        durations = concurrency.load_durations('durations')
+        self.assertEqual(['t.old.Test.test_old',
+                          't.test_conc1.Test1.test_pass_1',
+                          't.test_conc2.Test2.test_pass_2'],
+                         sorted(durations.keys()))
+
 
 class PartitionTestCase(testtools.TestCase):
 
@@ -209,3 +494,87 @@ class PartitionTestCase(testtools.TestCase):
         self.assertEqual(3, len(parted_tests[0]))
         self.assertEqual(3, len(parted_tests[1]))
         self.assertEqual(2, len(parted_tests[2]))
+
+
+class PartitionByDurationTestCase(testtools.TestCase):
+
+    def get_suite(self, *names):
+        suite = unittest.TestSuite()
+        for name in names:
+            test = tests.get_case('pass')
+            # Give each test its own id
+            test.id = lambda name=name: name
+            suite.addTest(test)
+        return suite
+
+    def partition(self, suite, count, durations):
+        parted_tests = concurrency.partition_tests_by_duration(
+            suite, count, durations)
+        return [[t.id() for t in p] for p in parted_tests]
+
+    def test_longest_tests_are_spread(self):
+        suite = self.get_suite('a.slow1', 'a.slow2', 'a.fast1', 'a.fast2')
+        durations = {'a.slow1': 90, 'a.slow2': 90, 'a.fast1': 1,
+                     'a.fast2': 1}
+        self.assertEqual([['a.slow1', 'a.fast1'], ['a.slow2', 'a.fast2']],
+                         self.partition(suite, 2, durations))
+
+    def test_balances_partitions(self):
+        suite = self.get_suite('t1', 't2', 't3', 't4', 't5')
+        durations = {'t1': 8, 't2': 7, 't3': 6, 't4': 5, 't5': 4}
+        parted = self.partition(suite, 2, durations)
+        totals = sorted(sum(durations[t] for t in p) for p in parted)
+        self.assertEqual([13, 17], totals)
+
+    def test_keeps_suite_order_in_partitions(self):
+        suite = self.get_suite('t1', 't2', 't3')
+        durations = {'t1': 1, 't2': 1, 't3': 10}
+        self.assertEqual([['t3'], ['t1', 't2']],
+                         self.partition(suite, 2, durations))
+
+    def test_more_partitions_than_tests(self):
+        suite = self.get_suite('t1')
+        self.assertEqual([['t1'], []], self.partition(suite, 2, {'t1': 1}))
+
+
+class EstimateDurationsTestCase(testtools.TestCase):
+
+    def test_known(self):
+        self.assertEqual({'a.b': 3},
+                         concurrency.estimate_durations(['a.b'], {'a.b': 3}))
+
+    def test_unknown_uses_closest_siblings(self):
+        durations = {'a.b.c1': 10, 'a.b.c2': 20, 'a.d.e': 100}
+        self.assertEqual(
+            {'a.b.new': 15},
+            concurrency.estimate_durations(['a.b.new'], durations))
+
+    def test_unknown_without_siblings_uses_mean(self):
+        durations = {'a.b': 10, 'c.d': 20}
+        self.assertEqual(
+            {'e.f': 15},
+            concurrency.estimate_durations(['e.f'], durations))
+
+    def test_no_history(self):
+        self.assertEqual({'a.b': 0.0},
+                         concurrency.estimate_durations(['a.b'], {}))
+
+
+class DurationsFileTestCase(testtools.TestCase):
+
+    def setUp(self):
+        super(DurationsFileTestCase, self).setUp()
+        tests.set_cwd_to_tmp(self)
+
+    def test_missing_file(self):
+        self.assertEqual({}, concurrency.load_durations('durations'))
+
+    def test_save_load(self):
+        durations = {'a.b': 1.5, 'a.c': 30.25}
+        concurrency.save_durations('durations', durations)
+        self.assertEqual(durations, concurrency.load_durations('durations'))
+
+    def test_ignore_corrupted_lines(self):
+        with open('durations', 'w') as f:
+            f.write('a.b 1.5\ngarbage\na.c not-a-float\n')
+        self.assertEqual({'a.b': 1.5}, concurrency.load_durations('durations'))
@@ -0,0 +1,98 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import __future__
+import os
+
+import testtools
+
+from sst import (
+    config,
+    context,
+    tests,
+)
+
+
+class TestScriptCache(testtools.TestCase):
+
+    def setUp(self):
+        super(TestScriptCache, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        self.write_script('RESULT = 1\n')
+        self.cache = context.ScriptCache()
+
+    def write_script(self, source, name='script.py'):
+        with open(name, 'w') as f:
+            f.write(source)
+
+    def run_code(self, code):
+        namespace = {}
+        exec(code, namespace)
+        return namespace['RESULT']
+
+    def test_script_compiled_once(self):
+        code = self.cache.get('script.py')
+        self.assertIs(code, self.cache.get('script.py'))
+        self.assertEqual(os.path.abspath('script.py'), code.co_filename)
+
+    def test_modified_script_compiled_again(self):
+        self.cache.get('script.py')
+        self.write_script('RESULT = 22\n')
+        self.assertEqual(22, self.run_code(self.cache.get('script.py')))
+
+    def test_flags_compiled_separately(self):
+        code = self.cache.get('script.py')
+        flag = __future__.print_function.compiler_flag
+        with_flag = self.cache.get('script.py', flag)
+        self.assertIsNot(code, with_flag)
+        self.assertTrue(with_flag.co_flags & flag)
+
+    def test_script_saved_for_other_processes(self):
+        self.cache.directory = 'cache'
+        self.cache.get('script.py')
+        other = context.ScriptCache('cache')
+        self.patch(other, '_compile', None)
+        self.assertEqual(1, self.run_code(other.get('script.py')))
+
+    def test_outdated_saved_script_ignored(self):
+        self.cache.directory = 'cache'
+        self.cache.get('script.py')
+        self.write_script('RESULT = 22\n')
+        other = context.ScriptCache('cache')
+        self.assertEqual(22, self.run_code(other.get('script.py')))
+
+
+class TestRunTest(testtools.TestCase):
+
+    def setUp(self):
+        super(TestRunTest, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        with open('sub.py', 'w') as f:
+            f.write('from sst.actions import get_argument\n'
+                    'RESULT = get_argument("value")\n')
+        self.patch(context, 'script_cache', context.ScriptCache())
+        self.patch(config, '_current_context',
+                   {'__file__': os.path.abspath('main.py')})
+        self.patch(config, '__args__', {})
+        self.patch(config, 'cache', {})
+
+    def test_sub_script_compiled_once(self):
+        self.assertEqual(1, context.run_test('sub', {'value': 1}))
+        self.assertEqual(2, context.run_test('sub', {'value': 2}))
+        self.assertEqual(1, len(context.script_cache.scripts))
@@ -434,3 +434,19 @@ _hidden_too.py
                           'tests.test_real1.Test_test_real1.test_test_real1',
                           'tests.test_real2.Test_test_real2.test_test_real2'],
                          [t.id() for t in testtools.iterate_tests(suite)])
+
+    def test_browser_scope(self):
+        tests.write_tree_from_desc('''dir: t
+file: t/__init__.py
+file: t/script.py
+dir: t/shared_browser
+file: t/shared_browser/__init__.py
+browser_scope = 'module'
+file: t/shared_browser/script.py
+''')
+        test_loader = loaders.SSTestLoader(browser_scope='class')
+        suite = test_loader.discoverTestsFromTree('t')
+        self.assertEqual([('t.script', 'class'),
+                          ('t.shared_browser.script', 'module')],
+                         [(t.id(), t.browser_scope)
+                          for t in testtools.iterate_tests(suite)])
@@ -0,0 +1,47 @@
+#
+#   Copyright (c) 2013 Canonical Ltd.
+#
+#   This file is part of: SST (selenium-simple-test)
+#   https://launchpad.net/selenium-simple-test
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import os
+
+import testtools
+
+from sst import (
+    locks,
+    tests,
+)
+
+
+class TestLockFile(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLockFile, self).setUp()
+        tests.set_cwd_to_tmp(self)
+        self.path = os.path.join(os.getcwd(), 'lock')
+
+    def test_locked_file_cannot_be_locked_again(self):
+        fd = locks.lock_file(self.path)
+        self.assertIsNot(None, fd)
+        self.addCleanup(locks.unlock_file, fd)
+        self.assertIs(None, locks.lock_file(self.path))
+
+    def test_unlocked_file_can_be_locked(self):
+        locks.unlock_file(locks.lock_file(self.path))
+        fd = locks.lock_file(self.path)
+        self.assertIsNot(None, fd)
+        locks.unlock_file(fd)
@@ -19,11 +19,19 @@
 
 
 import cStringIO
+import socket
+import threading
+import time
 
 import mock
 import testtools
 
-from sst import tests
+from sst import (
+    actions,
+    browsers,
+    cases,
+    tests,
+)
 
 
 class TestHandleExceptions(testtools.TestCase):
@@ -116,3 +124,308 @@ class TestSkipping(testtools.TestCase):
         result = testtools.TestResult()
         test.run(result)
         self.assertIn('test reason', result.skip_reasons)
+
+
+class FakeFactory(browsers.BrowserFactory):
+
+    def __init__(self):
+        super(FakeFactory, self).__init__()
+        self.created = []
+
+    def browser(self):
+        browser = mock.Mock()
+        browser.name = 'fake'
+        browser.window_handles = ['main']
+        browser.current_url = 'about:blank'
+        self.created.append(browser)
+        return browser
+
+
+class TestBrowserScope(testtools.TestCase):
+
+    def setUp(self):
+        super(TestBrowserScope, self).setUp()
+        self.patch(cases, 'shared_browser', cases.SharedBrowser())
+        self.addCleanup(cases.shared_browser.quit)
+        self.factory = FakeFactory()
+
+    def get_test_class(self, scope):
+        class WithScope(cases.SSTTestCase):
+
+            browser_factory = self.factory
+            browser_scope = scope
+
+            def test_it(self):
+                pass
+
+        return WithScope
+
+    def run_tests(self, *tests):
+        result = testtools.TestResult()
+        for test in tests:
+            test.run(result)
+        self.assertTrue(result.wasSuccessful())
+
+    def test_test_scope(self):
+        klass = self.get_test_class('test')
+        self.run_tests(klass('test_it'), klass('test_it'))
+        self.assertEqual(2, len(self.factory.created))
+        for browser in self.factory.created:
+            browser.quit.assert_called_once_with()
+
+    def test_class_scope(self):
+        klass = self.get_test_class('class')
+        self.run_tests(klass('test_it'), klass('test_it'))
+        self.assertEqual(1, len(self.factory.created))
+        browser = self.factory.created[0]
+        self.assertFalse(browser.quit.called)
+        # The browser has been reset for the second test
+        browser.delete_all_cookies.assert_called_once_with()
+        browser.get.assert_called_once_with('about:blank')
+
+    def test_scope_change(self):
+        self.run_tests(self.get_test_class('class')('test_it'),
+                       self.get_test_class('class')('test_it'))
+        self.assertEqual(2, len(self.factory.created))
+        first, second = self.factory.created
+        first.quit.assert_called_once_with()
+        self.assertFalse(second.quit.called)
+
+    def test_session_scope(self):
+        self.run_tests(self.get_test_class('session')('test_it'),
+                       self.get_test_class('session')('test_it'))
+        self.assertEqual(1, len(self.factory.created))
+
+    def test_extra_windows_are_closed(self):
+        klass = self.get_test_class('module')
+        self.run_tests(klass('test_it'))
+        browser = self.factory.created[0]
+        browser.window_handles = ['main', 'popup']
+        self.run_tests(klass('test_it'))
+        self.assertEqual([mock.call('popup'), mock.call('main')],
+                         browser.switch_to_window.call_args_list)
+        browser.close.assert_called_once_with()
+
+    def test_reset_failure_starts_a_new_browser(self):
+        klass = self.get_test_class('class')
+        self.run_tests(klass('test_it'))
+        browser = self.factory.created[0]
+        browser.delete_all_cookies.side_effect = Exception('Browser died')
+        self.run_tests(klass('test_it'))
+        self.assertEqual(2, len(self.factory.created))
+        browser.quit.assert_called_once_with()
+
+    def test_visited_origins_are_cleared(self):
+        klass = self.get_test_class('class')
+        test = klass('test_it')
+        test.test_it = lambda: [
+            test.record_origin(url) for url in
+            ('http://localhost:8000/page', 'https://example.com/',
+             'http://localhost:8000/other', 'about:blank')]
+        self.run_tests(test)
+        browser = self.factory.created[0]
+        browser.current_url = 'http://localhost:8000/other'
+        self.run_tests(klass('test_it'))
+        # The current origin is cleared in place, the other one is loaded
+        self.assertEqual([mock.call('https://example.com/'),
+                          mock.call('about:blank')],
+                         browser.get.call_args_list)
+        self.assertEqual(2, browser.delete_all_cookies.call_count)
+        self.assertEqual(set(), cases.shared_browser.origins)
+
+    def test_unknown_scope(self):
+        test = self.get_test_class('unknown')('test_it')
+        result = testtools.TestResult()
+        test.run(result)
+        self.assertEqual(1, len(result.errors))
+
+
+class TestLazyBrowser(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLazyBrowser, self).setUp()
+        self.factory = FakeFactory()
+
+    def run_lazy_test(self, body):
+        class Lazy(cases.SSTTestCase):
+
+            browser_factory = self.factory
+            lazy_browser = True
+
+            def test_it(self):
+                body(self)
+
+        test = Lazy('test_it')
+        result = testtools.TestResult()
+        test.run(result)
+        return result
+
+    def test_unused_browser_is_not_started(self):
+        result = self.run_lazy_test(lambda test: None)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual([], self.factory.created)
+
+    def test_skipped_test_does_not_start_browser(self):
+        result = self.run_lazy_test(lambda test: actions.skip('no browser'))
+        self.assertIn('no browser', result.skip_reasons)
+        self.assertEqual([], self.factory.created)
+
+    def test_browser_is_started_on_first_use(self):
+        def body(test):
+            self.assertFalse(test.browser_started())
+            actions.get_current_url()
+            self.assertTrue(test.browser_started())
+
+        result = self.run_lazy_test(body)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(1, len(self.factory.created))
+        self.factory.created[0].quit.assert_called_once_with()
+
+    def test_name_from_factory(self):
+        self.factory.browser_name = 'fake'
+
+        def body(test):
+            self.assertEqual('fake', test.browser.name)
+
+        result = self.run_lazy_test(body)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual([], self.factory.created)
+
+    def test_name_from_browser(self):
+        def body(test):
+            self.assertEqual('fake', test.browser.name)
+
+        result = self.run_lazy_test(body)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(1, len(self.factory.created))
+
+
+class TestWatchdog(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWatchdog, self).setUp()
+        self.factory = FakeFactory()
+        self.killed = threading.Event()
+        # Whether the browser has local processes
+        self.local = True
+        self.disconnected = threading.Event()
+
+        def kill_browser(browser):
+            if not self.local:
+                return False
+            self.killed.set()
+            return True
+        self.patch(browsers, 'kill_browser', kill_browser)
+
+        def disconnect_browser(browser):
+            self.disconnected.set()
+            return True
+        self.patch(browsers, 'disconnect_browser', disconnect_browser)
+
+    def run_test(self, body, timeout=0.2):
+        class Watched(cases.SSTTestCase):
+
+            browser_factory = self.factory
+            test_timeout = timeout
+
+            def test_it(self):
+                body(self)
+
+        test = Watched('test_it')
+        result = testtools.TestResult()
+        test.run(result)
+        return result
+
+    def test_hung_browser_is_killed(self):
+        def hang(url):
+            # Until the browser process is killed
+            self.killed.wait(10)
+            raise Exception('Browser is gone')
+
+        def body(test):
+            test.browser.get.side_effect = hang
+            actions.go_to('http://localhost/', wait=False)
+
+        result = self.run_test(body)
+        self.assertTrue(self.killed.is_set())
+        self.assertEqual(1, len(result.errors))
+        error = result.errors[0][1]
+        self.assertIn('Test timed out after', error)
+        # Where the test was stuck is reported
+        self.assertIn('in hang', error)
+        self.factory.created[0].quit.assert_called_once_with()
+        self.assertFalse(self.disconnected.is_set())
+
+    def test_remote_browser_is_disconnected(self):
+        self.local = False
+
+        def hang(url):
+            # Until the connection is closed
+            self.disconnected.wait(10)
+            raise Exception('Connection reset')
+
+        def body(test):
+            test.browser.get.side_effect = hang
+            actions.go_to('http://localhost/', wait=False)
+
+        result = self.run_test(body)
+        self.assertTrue(self.disconnected.is_set())
+        self.assertEqual(1, len(result.errors))
+        self.assertIn('Test timed out after', result.errors[0][1])
+        # The session is still ended
+        self.factory.created[0].quit.assert_called_once_with()
+
+    def test_hung_start_gives_up_at_the_deadline(self):
+        server = socket.socket()
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+
+        def browser():
+            # A hub accepting the connection but never answering
+            conn = socket.create_connection(server.getsockname())
+            self.addCleanup(conn.close)
+            conn.recv(1)
+        self.factory.browser = browser
+
+        start = time.time()
+        result = self.run_test(lambda test: None)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(1, len(result.errors))
+        error = result.errors[0][1]
+        self.assertIn('timeout: timed out', error)
+        self.assertIn('Test timed out after', error)
+        # The time out is only set while the browser starts
+        self.assertIs(None, socket.getdefaulttimeout())
+
+    def test_fast_test_is_not_reported(self):
+        result = self.run_test(lambda test: None)
+        self.assertTrue(result.wasSuccessful())
+        self.assertFalse(self.killed.is_set())
+
+    def test_wait_for_stops_at_the_deadline(self):
+        def body(test):
+            actions.wait_for(lambda: False)
+
+        start = time.time()
+        result = self.run_test(body)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(1, len(result.errors))
+        self.assertIn('Test timed out after', result.errors[0][1])
+
+    def test_timeout_removed_by_test(self):
+        def body(test):
+            actions.set_test_timeout(None)
+            time.sleep(0.3)
+
+        result = self.run_test(body)
+        self.assertTrue(result.wasSuccessful())
+        self.assertFalse(self.killed.is_set())
+
+    def test_no_timeout(self):
+        def body(test):
+            self.assertIs(None, test.watchdog)
+            self.assertIs(None, actions._TEST_DEADLINE)
+
+        result = self.run_test(body, timeout=None)
+        self.assertTrue(result.wasSuccessful())
@@ -27,6 +27,7 @@ import testtools
 
 from sst import (
     cases,
+    tests,
     xvfbdisplay,
 )
 
@@ -101,3 +102,166 @@ class TestSSTTestCaseWithXfvb(testtools.TestCase):
                 self.assertIs(external_xvfb, self.xvfb)
 
         self.assertRunSuccessfully(HeadlessReusedXvfb("test_headless"))
+
+
+# A stand-in X server locking its display and listening on its socket in the
+# current directory like Xvfb does in /tmp.
+fake_xvfb = """#!{python}
+import errno
+import os
+import signal
+import socket
+import sys
+import time
+
+num = int(sys.argv[1][1:])
+lock = os.path.join(os.getcwd(), '.X%d-lock' % num)
+path = os.path.join(os.getcwd(), '.X11-unix', 'X%d' % num)
+owned = []
+
+
+def stop(*args):
+    for p in owned:
+        os.unlink(p)
+    sys.exit(0)
+
+# Ready to be stopped before being ready to be used
+signal.signal(signal.SIGTERM, stop)
+try:
+    fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+except OSError:
+    # Server is already active for display
+    sys.exit(1)
+owned.append(lock)
+os.write(fd, '%10d\\n' % os.getpid())
+os.close(fd)
+sockets = os.path.join(os.getcwd(), '.X11-unix')
+try:
+    os.mkdir(sockets)
+except OSError as e:
+    if e.errno != errno.EEXIST:
+        raise
+sock = socket.socket(socket.AF_UNIX)
+sock.bind(path)
+owned.append(path)
+sock.listen(1)
+while True:
+    time.sleep(1)
+"""
+
+
+def use_fake_xvfb(test):
+    tests.set_cwd_to_tmp(test)
+    with open('fake-xvfb', 'w') as f:
+        f.write(fake_xvfb.format(python=sys.executable))
+    os.chmod('fake-xvfb', 0o755)
+    test.patch(xvfbdisplay.Xvfb, 'binary', os.path.abspath('fake-xvfb'))
+    test.patch(xvfbdisplay.Xvfb, 'tmpdir', test.test_base_dir)
+    # Don't leak DISPLAY changes
+    test.patch(os, 'environ', dict(os.environ))
+
+
+def patch_displays(test, xvfb, *nums):
+    nums = list(nums)
+    test.patch(xvfb, 'search_for_free_display', lambda: nums.pop(0))
+
+
+class TestXvfbReadiness(testtools.TestCase):
+
+    def setUp(self):
+        super(TestXvfbReadiness, self).setUp()
+        use_fake_xvfb(self)
+
+    def start(self, *nums):
+        xvfb = xvfbdisplay.Xvfb()
+        patch_displays(self, xvfb, *nums)
+        self.addCleanup(xvfb.stop_server)
+        xvfb.start()
+        return xvfb
+
+    def test_start_waits_until_ready(self):
+        xvfb = self.start(1042)
+        self.assertTrue(xvfb.is_ready())
+        self.assertEqual(':1042', os.environ['DISPLAY'])
+        xvfb.stop()
+        self.assertIs(None, xvfb.proc)
+        self.assertFalse(os.path.exists('.X1042-lock'))
+
+    def test_used_display_is_skipped(self):
+        self.start(1042)
+        xvfb = self.start(1042, 1043)
+        self.assertEqual(1043, xvfb.vdisplay_num)
+        self.assertEqual(2, xvfb.attempts)
+
+    def test_gives_up(self):
+        self.start(1042)
+        xvfb = xvfbdisplay.Xvfb()
+        patch_displays(self, xvfb, 1042, 1042)
+        xvfb.launch(max_attempts=2)
+        self.assertRaises(RuntimeError, xvfb.wait_until_ready)
+        self.assertIs(None, xvfb.proc)
+
+
+class TestXvfbPool(testtools.TestCase):
+
+    def setUp(self):
+        super(TestXvfbPool, self).setUp()
+        use_fake_xvfb(self)
+
+    def start_pool(self, size=1, geometries=None):
+        pool = xvfbdisplay.XvfbPool(size, geometries)
+        for num, display in enumerate(pool.displays):
+            patch_displays(self, display, 1042 + num)
+        self.addCleanup(pool.stop)
+        pool.start()
+        return pool
+
+    def test_start(self):
+        pool = self.start_pool(2)
+        self.assertEqual([True, True], [d.is_ready() for d in pool.displays])
+        self.assertEqual(':1042', os.environ['DISPLAY'])
+
+    def test_borrow(self):
+        pool = self.start_pool(2)
+        first = pool.borrow()
+        self.assertEqual(':%d' % (first.vdisplay_num,), os.environ['DISPLAY'])
+        second = pool.borrow()
+        self.assertIsNot(first, second)
+        self.assertIs(None, pool.borrow())
+        pool.give_back(second)
+        pool.give_back(first)
+        self.assertEqual(':1042', os.environ['DISPLAY'])
+        # The last borrowed display is preferred
+        self.assertIs(second, pool.borrow())
+
+    def test_borrow_geometry(self):
+        pool = self.start_pool(geometries=[(1024, 768, 24),
+                                           (1280, 1024, 24)])
+        self.assertIs(pool.displays[1], pool.borrow(1280, 1024, 24))
+        self.assertIs(None, pool.borrow(800, 600, 24))
+
+    def test_borrowed_in_another_process(self):
+        pool = self.start_pool(1)
+        pool.borrow()
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if pool.borrow() is None else 1)
+        self.assertEqual(0, os.waitpid(pid, 0)[1])
+
+    def test_headless_test_borrows(self):
+        xvfb_pool = self.start_pool(1)
+
+        class HeadlessWithPool(Headless):
+
+            xserver_headless = True
+
+            def test_headless(self):
+                self.assertIs(xvfb_pool.displays[0], self.xvfb)
+
+        test = HeadlessWithPool('test_headless')
+        test.xvfb_pool = xvfb_pool
+        result = testtools.TestResult()
+        test.run(result)
+        self.assertTrue(result.wasSuccessful())
+        # The display has been given back
+        self.assertIs(xvfb_pool.displays[0], xvfb_pool.borrow())
@@ -25,12 +25,21 @@
 import os
 import fnmatch
 import random
+import shutil
 import subprocess
+import tempfile
 import time
 
+from sst import locks
+
 
 class Xvfb(object):
 
+    # The Xvfb executable
+    binary = 'Xvfb'
+    # Where X servers create their lock files and sockets
+    tmpdir = '/tmp'
+
     def __init__(self, width=1024, height=768, colordepth=24):
         self.width = width
         self.height = height
@@ -42,19 +51,76 @@ class Xvfb(object):
         else:
             self.old_display_num = 0
 
-    def start(self):
+    def start(self, timeout=10):
+        self.launch()
+        self.wait_until_ready(timeout)
+        self._redirect_display(self.vdisplay_num)
+
+    def launch(self, max_attempts=5):
+        """Spawn the server without waiting for it to be ready.
+
+        :param max_attempts: How many displays are tried before giving up.
+        """
+        self.max_attempts = max_attempts
+        self.attempts = 1
+        self._spawn()
+
+    def _spawn(self):
         self.vdisplay_num = self.search_for_free_display()
         self.xvfb_cmd = [
-            'Xvfb', ':%d' % (self.vdisplay_num,), '-screen', '0',
+            self.binary, ':%d' % (self.vdisplay_num,), '-screen', '0',
             '%dx%dx%d' % (self.width, self.height, self.colordepth)]
         self.proc = subprocess.Popen(self.xvfb_cmd,
                                      stdout=open(os.devnull),
                                      stderr=open(os.devnull),)
-        time.sleep(0.1)  # give Xvfb time to start
-        self._redirect_display(self.vdisplay_num)
+
+    def wait_until_ready(self, timeout=10):
+        """Wait for the server to accept connections.
+
+        The X server locks its display atomically. If another server got the
+        same display first, ours exits and another display is tried.
+
+        :param timeout: The time in seconds allowed for each attempt.
+        """
+        while True:
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                if self.proc.poll() is not None:
+                    # The display is already used
+                    break
+                if self.is_ready():
+                    return
+                time.sleep(0.01)
+            else:
+                self.stop_server()
+                raise RuntimeError('Xvfb is not ready after %s secs'
+                                   % (timeout,))
+            if self.attempts >= self.max_attempts:
+                self.proc = None
+                raise RuntimeError('Cannot start Xvfb after %d attempts'
+                                   % (self.attempts,))
+            self.attempts += 1
+            self._spawn()
+
+    def is_ready(self):
+        """Whether our server holds the display lock and listens on it."""
+        lock_path = os.path.join(self.tmpdir,
+                                 '.X%d-lock' % (self.vdisplay_num,))
+        socket_path = os.path.join(self.tmpdir, '.X11-unix',
+                                   'X%d' % (self.vdisplay_num,))
+        try:
+            with open(lock_path) as f:
+                pid = int(f.read().strip())
+        except (IOError, ValueError):
+            # Not created or not written yet
+            return False
+        return pid == self.proc.pid and os.path.exists(socket_path)
 
     def stop(self):
         self._redirect_display(self.old_display_num)
+        self.stop_server()
+
+    def stop_server(self):
         if self.proc is not None:
             self.proc.terminate()
             self.proc.wait()
@@ -73,7 +139,7 @@ class Xvfb(object):
         return display_num
 
     def _lock_files(self):
-        tmpdir = '/tmp'
+        tmpdir = self.tmpdir
         pattern = '.X*-lock'
         names = fnmatch.filter(os.listdir(tmpdir), pattern)
         ls = [os.path.join(tmpdir, child) for child in names]
@@ -84,14 +150,103 @@ class Xvfb(object):
         os.environ['DISPLAY'] = ':%s' % display_num
 
 
-def use_xvfb_server(test, xvfb=None):
+class XvfbPool(object):
+    """Displays started once and borrowed by tests.
+
+    The pool is started by the parent process, forked processes inherit it.
+    A display is borrowed by locking a file so that each display is used by
+    a single process at a time.
+
+    Like a single `Xvfb`, DISPLAY points to the first display while the pool
+    is started.
+    """
+
+    def __init__(self, size=1, geometries=None):
+        """Create a pool.
+
+        :param size: The number of displays.
+
+        :param geometries: An optional list of (width, height, colordepth),
+            one per display. All displays are 1024x768x24 by default.
+        """
+        if geometries is None:
+            geometries = [(1024, 768, 24)] * size
+        self.displays = [Xvfb(*geometry) for geometry in geometries]
+        self.lock_dir = None
+        # The display last borrowed by this process, tried first to keep
+        # using the same display
+        self.last = None
+
+    def start(self, timeout=10):
+        self.lock_dir = tempfile.mkdtemp(prefix='sst-xvfb-')
+        # Start all the servers at once
+        for display in self.displays:
+            display.launch()
+        for display in self.displays:
+            display.wait_until_ready(timeout)
+        first = self.displays[0]
+        first._redirect_display(first.vdisplay_num)
+
+    def stop(self):
+        first = self.displays[0]
+        first._redirect_display(first.old_display_num)
+        for display in self.displays:
+            display.stop_server()
+        if self.lock_dir is not None:
+            shutil.rmtree(self.lock_dir, ignore_errors=True)
+            self.lock_dir = None
+
+    def borrow(self, width=1024, height=768, colordepth=24):
+        """Borrow a free display with the given geometry.
+
+        DISPLAY is redirected to the borrowed display until it is given back.
+
+        :return: The borrowed `Xvfb` or None if none is free.
+        """
+        geometry = (width, height, colordepth)
+        candidates = [d for d in self.displays
+                      if (d.width, d.height, d.colordepth) == geometry]
+        if self.last in candidates:
+            candidates.remove(self.last)
+            candidates.insert(0, self.last)
+        for display in candidates:
+            fd = locks.lock_file(
+                os.path.join(self.lock_dir,
+                             'display-%d' % (display.vdisplay_num,)))
+            if fd is not None:
+                display.borrowed_fd = fd
+                display.old_display = os.environ.get('DISPLAY')
+                display._redirect_display(display.vdisplay_num)
+                self.last = display
+                return display
+        return None
+
+    def give_back(self, display):
+        """Let other tests borrow the display."""
+        if display.old_display is None:
+            del os.environ['DISPLAY']
+        else:
+            os.environ['DISPLAY'] = display.old_display
+        fd, display.borrowed_fd = display.borrowed_fd, None
+        locks.unlock_file(fd)
+
+
+def use_xvfb_server(test, xvfb=None, pool=None):
     """Setup an xvfb server for a given test.
 
     :param xvfb: An Xvfb object to use. If none is supplied, default values are
         used to build it.
 
+    :param pool: An optional `XvfbPool` to borrow the server from. A new
+        server is started if none is free.
+
     :returns: The xvfb server used so tests can use the built one.
     """
+    if xvfb is None and pool is not None:
+        xvfb = pool.borrow()
+        if xvfb is not None:
+            test.addCleanup(pool.give_back, xvfb)
+            return xvfb
     if xvfb is None:
         xvfb = Xvfb()
     xvfb.start()